@@ -0,0 +1,135 @@
+import time
+import logging
+
+from batch_copy import _greater_than, get_copy_key
+from journal import NULL_JOURNAL
+from pacing import NULL_PACING
+from telemetry import NULL_TELEMETRY
+
+
+class Backfill:
+    """
+    Rellena una columna existente con una expresión sobre las demás columnas de la fila
+    (ej. UPPER(LTRIM([Nombre])) o CONCAT([Serie], '-', [Numero])), en lotes recorridos
+    por la clave clúster. Cada lote se confirma junto con su marca en el diario, así que
+    una ejecución interrumpida sigue desde el último lote. pacing decide el tamaño de
+    cada lote y las pausas según el log, las colas del AG y los bloqueos.
+    condition limita las filas a actualizar (ej. solo las que faltan).
+    """
+
+    def __init__(self, connection, schema, table, column, expression, batch_size, condition=None, log=None,
+                 cancel=None, telemetry=None, journal=None, pacing=None):
+        self.connection = connection
+        self.schema = schema
+        self.table = table
+        self.column = column
+        self.expression = expression
+        self.batch_size = batch_size
+        self.condition = condition
+        self.log = log or (lambda message, level=logging.INFO: logging.log(level, message))
+        self.cancel = cancel
+        self.telemetry = telemetry or NULL_TELEMETRY
+        self.journal = journal or NULL_JOURNAL
+        self.pacing = pacing or NULL_PACING
+
+    @property
+    def step(self):
+        return f"backfill:{self.column}"
+
+    @property
+    def done_step(self):
+        return f"backfill:{self.column}:done"
+
+    def run(self):
+        """Ejecuta el relleno y devuelve el número total de filas actualizadas"""
+        schema, table = self.schema, self.table
+        cursor = self.connection.cursor()
+        if self.cancel:
+            self.cancel.track(cursor)
+        update = f"UPDATE [{schema}].[{table}] SET [{self.column}] = {self.expression}"
+        extra = [f"({self.condition})"] if self.condition else []
+
+        if self.journal.done(self.done_step):
+            rows = self.journal.rows(self.done_step)
+            self.log(f"El relleno de {self.column} ya había terminado ({rows} filas)")
+            return rows
+
+        last_key = self.journal.high_water(self.step)
+        rows = self.journal.rows(self.step) or 0
+        if last_key is not None:
+            self.log(f"Reanudando el relleno de {self.column} ({rows} filas ya actualizadas)")
+
+        key = get_copy_key(cursor, schema, table)
+        self.connection.commit()
+        started = time.monotonic()
+
+        if not key:
+            # Sin clave ordenada no se puede paginar: una sola sentencia
+            self.log(f"{schema}.{table} no tiene clave utilizable para lotes, rellenando {self.column} "
+                     f"en una sola sentencia", level=logging.WARNING)
+            self.pacing.wait(self.cancel)
+            cursor.execute(f"{update} WHERE {extra[0]}" if extra else update)
+            rows = cursor.rowcount
+            self.journal.record(self.done_step, rows=rows, commit=False)
+            self.connection.commit()
+            return self._report(rows, started)
+
+        key_cols = ", ".join(f"[{k}]" for k in key)
+        key_desc = ", ".join(f"[{k}] DESC" for k in key)
+        gt_sql, gt_layout = _greater_than(key)
+        resumed_rows = rows
+
+        while True:
+            if self.cancel:
+                self.cancel.check()
+            batch_size = self.pacing.batch_size(self.batch_size, self.cancel)
+            batch_started = time.monotonic()
+            where = f"WHERE {gt_sql}" if last_key is not None else ""
+            lower_params = [last_key[i] for i in gt_layout] if last_key is not None else []
+
+            # Límite superior del lote: la clave del batch_size-ésimo registro
+            cursor.execute(f"""
+                SELECT TOP (1) {key_cols} FROM (
+                    SELECT TOP ({int(batch_size)}) {key_cols}
+                    FROM [{schema}].[{table}]
+                    {where}
+                    ORDER BY {key_cols}
+                ) b
+                ORDER BY {key_desc}
+            """, *lower_params)
+            upper = cursor.fetchone()
+            if upper is None:
+                self.journal.record(self.done_step, rows=rows, commit=False)
+                self.connection.commit()
+                break
+            upper_key = list(upper)
+
+            conditions = [f"NOT {gt_sql}"] + extra
+            params = [upper_key[i] for i in gt_layout]
+            if last_key is not None:
+                conditions.insert(0, gt_sql)
+                params = lower_params + params
+            cursor.execute(f"{update} WHERE {' AND '.join(conditions)}", *params)
+            batch_rows = cursor.rowcount
+
+            rows += batch_rows
+            last_key = upper_key
+            self.journal.record(self.step, rows=rows, high_water=last_key, commit=False)
+            self.connection.commit()
+
+            elapsed = time.monotonic() - batch_started
+            rate = batch_rows / elapsed if elapsed > 0 else 0
+            self.log(f"Lote rellenado en {self.column}: {batch_rows} filas ({rows} en total, {rate:,.0f} filas/s)")
+
+        return self._report(rows, started, rows - resumed_rows)
+
+    def _report(self, rows, started, rows_this_run=None):
+        seconds = time.monotonic() - started
+        done = rows if rows_this_run is None else rows_this_run
+        rate = done / seconds if seconds > 0 else 0
+        self.log(f"Relleno de {self.column} completado: {rows} filas en {seconds:.1f}s ({rate:,.0f} filas/s"
+                 f"{f', {self.pacing.paused_seconds:.0f}s en pausa' if self.pacing.paused_seconds else ''})")
+        self.telemetry.emit({'event': 'backfill', 'column': self.column, 'rows': rows,
+                             'seconds': round(seconds, 3), 'rows_per_s': round(rate, 1),
+                             'paused_seconds': round(self.pacing.paused_seconds, 1)})
+        return rows
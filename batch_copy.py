@@ -0,0 +1,302 @@
+import json
+import time
+import logging
+import datetime
+import decimal
+
+from pacing import NULL_PACING
+
+# Tabla de control donde se guarda el avance de cada copia por lotes
+CHECKPOINT_TABLE = "[dbo].[ColumnAdder_Checkpoint]"
+
+
+def _encode_value(value):
+    """Convierte un valor de clave a un formato serializable en JSON"""
+    if isinstance(value, datetime.datetime):
+        return {'t': 'datetime', 'v': value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {'t': 'date', 'v': value.isoformat()}
+    if isinstance(value, datetime.time):
+        return {'t': 'time', 'v': value.isoformat()}
+    if isinstance(value, decimal.Decimal):
+        return {'t': 'decimal', 'v': str(value)}
+    if isinstance(value, (bytes, bytearray)):
+        return {'t': 'bytes', 'v': bytes(value).hex()}
+    return {'t': 'raw', 'v': value}
+
+
+def _decode_value(data):
+    """Operación inversa de _encode_value"""
+    kind, value = data['t'], data['v']
+    if kind == 'datetime':
+        return datetime.datetime.fromisoformat(value)
+    if kind == 'date':
+        return datetime.date.fromisoformat(value)
+    if kind == 'time':
+        return datetime.time.fromisoformat(value)
+    if kind == 'decimal':
+        return decimal.Decimal(value)
+    if kind == 'bytes':
+        return bytes.fromhex(value)
+    return value
+
+
+def encode_key(values):
+    return json.dumps([_encode_value(v) for v in values]) if values is not None else None
+
+
+def decode_key(text):
+    return [_decode_value(v) for v in json.loads(text)] if text else None
+
+
+def ensure_checkpoint_table(cursor):
+    """Crea la tabla de checkpoints si no existe"""
+    cursor.execute(f"""
+        IF OBJECT_ID('{CHECKPOINT_TABLE}') IS NULL
+            CREATE TABLE {CHECKPOINT_TABLE} (
+                source_name NVARCHAR(512) NOT NULL,
+                target_name NVARCHAR(512) NOT NULL,
+                last_key NVARCHAR(MAX) NULL,
+                rows_copied BIGINT NOT NULL DEFAULT 0,
+                pending_scripts NVARCHAR(MAX) NULL,
+                updated_at DATETIME2 NOT NULL DEFAULT SYSDATETIME(),
+                CONSTRAINT [PK_ColumnAdder_Checkpoint] PRIMARY KEY (source_name, target_name)
+            )
+    """)
+
+
+def load_checkpoint(cursor, source, target):
+    """Devuelve el checkpoint guardado para una copia o None si no hay"""
+    cursor.execute(f"""
+        SELECT last_key, rows_copied, pending_scripts
+        FROM {CHECKPOINT_TABLE}
+        WHERE source_name = ? AND target_name = ?
+    """, _object_name(source), _object_name(target))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    return {
+        'last_key': decode_key(row.last_key),
+        'rows_copied': row.rows_copied,
+        'pending_scripts': json.loads(row.pending_scripts) if row.pending_scripts else [],
+    }
+
+
+def save_checkpoint(cursor, source, target, last_key, rows_copied, pending_scripts=None):
+    """Inserta o actualiza el checkpoint (debe ejecutarse en la misma transacción del lote)"""
+    pending = json.dumps(pending_scripts) if pending_scripts is not None else None
+    cursor.execute(f"""
+        UPDATE {CHECKPOINT_TABLE}
+        SET last_key = ?, rows_copied = ?, pending_scripts = ISNULL(?, pending_scripts),
+            updated_at = SYSDATETIME()
+        WHERE source_name = ? AND target_name = ?;
+
+        IF @@ROWCOUNT = 0
+            INSERT INTO {CHECKPOINT_TABLE} (source_name, target_name, last_key, rows_copied, pending_scripts)
+            VALUES (?, ?, ?, ?, ?);
+    """, encode_key(last_key), rows_copied, pending, _object_name(source), _object_name(target),
+         _object_name(source), _object_name(target), encode_key(last_key), rows_copied, pending)
+
+
+def clear_checkpoint(cursor, source, target):
+    cursor.execute(f"""
+        DELETE FROM {CHECKPOINT_TABLE}
+        WHERE source_name = ? AND target_name = ?
+    """, _object_name(source), _object_name(target))
+
+
+def _object_name(obj):
+    schema, table = obj
+    return f"[{schema}].[{table}]"
+
+
+def get_copy_key(cursor, schema, table, unique_only=False):
+    """
+    Devuelve las columnas por las que se puede recorrer la tabla en orden:
+    la clave del índice clúster o, en un heap, la del índice único más estrecho.
+    Con unique_only solo se aceptan claves únicas (para identificar filas).
+    Lista vacía si no hay ninguna clave utilizable (sin NULLs).
+    """
+    cursor.execute("""
+        SELECT i.index_id, i.is_unique, c.name, c.is_nullable
+        FROM sys.indexes i
+        JOIN sys.index_columns ic ON ic.object_id = i.object_id AND ic.index_id = i.index_id
+        JOIN sys.columns c ON c.object_id = ic.object_id AND c.column_id = ic.column_id
+        WHERE i.object_id = OBJECT_ID(?)
+        AND ic.key_ordinal > 0
+        AND (i.index_id = 1 OR i.is_unique = 1)
+        AND i.has_filter = 0
+        ORDER BY i.index_id, ic.key_ordinal
+    """, f"[{schema}].[{table}]")
+
+    keys = {}
+    nullable = set()
+    for row in cursor.fetchall():
+        if unique_only and not row.is_unique:
+            continue
+        keys.setdefault(row.index_id, []).append(row.name)
+        if row.is_nullable:
+            nullable.add(row.index_id)
+
+    candidates = [idx for idx in keys if idx not in nullable]
+    if not candidates:
+        return []
+    if 1 in candidates:
+        return keys[1]
+    return keys[min(candidates, key=lambda idx: len(keys[idx]))]
+
+
+def get_recovery_model(cursor):
+    cursor.execute("SELECT recovery_model_desc FROM sys.databases WHERE name = DB_NAME()")
+    return cursor.fetchone()[0]
+
+
+def is_heap(cursor, schema, table):
+    cursor.execute("""
+        SELECT COUNT(*) FROM sys.indexes WHERE object_id = OBJECT_ID(?) AND index_id = 1
+    """, f"[{schema}].[{table}]")
+    return cursor.fetchone()[0] == 0
+
+
+def _greater_than(key):
+    """
+    Genera el predicado (k1, k2, ...) > (?, ?, ...) sin comparación de tuplas,
+    junto con el índice del valor que corresponde a cada parámetro.
+    """
+    terms = []
+    layout = []
+    for i, col in enumerate(key):
+        parts = [f"[{k}] = ?" for k in key[:i]] + [f"[{col}] > ?"]
+        terms.append("(" + " AND ".join(parts) + ")")
+        layout.extend(range(i + 1))
+    return "(" + " OR ".join(terms) + ")", layout
+
+
+class BatchCopier:
+    """
+    Copia las filas de una tabla a otra en lotes recorriendo una clave ordenada.
+    Cada lote se confirma por separado junto con su checkpoint, de modo que una
+    copia interrumpida puede reanudarse desde el último lote confirmado.
+    pacing ajusta el tamaño de cada lote (hasta batch_size) y pausa la copia si las
+    réplicas se atrasan, el log se llena o la copia bloquea a otras sesiones.
+    condition limita las filas copiadas (ej. una partición) y checkpoint es el origen
+    con el que se guarda el avance, para que varias copias parciales de la misma tabla
+    no compartan checkpoint; tablock=False evita el bloqueo de tabla cuando otras
+    sesiones cargan el mismo destino a la vez.
+    """
+
+    def __init__(self, connection, source, target, columns_list, key, batch_size,
+                 identity_insert=False, log=None, cancel=None, pacing=None, condition=None, checkpoint=None,
+                 tablock=True):
+        self.connection = connection
+        self.source = source
+        self.target = target
+        self.columns_list = columns_list
+        self.key = key
+        self.batch_size = batch_size
+        self.identity_insert = identity_insert
+        self.log = log or (lambda message, level=logging.INFO: logging.log(level, message))
+        self.cancel = cancel
+        self.pacing = pacing or NULL_PACING
+        self.condition = condition
+        self.checkpoint = checkpoint or source
+        self.tablock = tablock
+
+    def _minimal_logging(self, cursor, target_empty):
+        """TABLOCK solo permite minimal logging en SIMPLE/BULK_LOGGED sobre un heap o un destino vacío"""
+        if not self.tablock or get_recovery_model(cursor) not in ('SIMPLE', 'BULK_LOGGED'):
+            return False
+        return target_empty or is_heap(cursor, *self.target)
+
+    def run(self):
+        """Ejecuta la copia y devuelve el número total de filas copiadas"""
+        cursor = self.connection.cursor()
+        if self.cancel:
+            self.cancel.track(cursor)
+        src = _object_name(self.source)
+        dst = _object_name(self.target)
+
+        checkpoint = load_checkpoint(cursor, self.checkpoint, self.target)
+        extra = [f"({self.condition})"] if self.condition else []
+        last_key = checkpoint['last_key'] if checkpoint else None
+        rows_copied = checkpoint['rows_copied'] if checkpoint else 0
+        if last_key is not None:
+            self.log(f"Reanudando copia de {src} a {dst} desde el checkpoint ({rows_copied} filas ya copiadas)")
+
+        if self.identity_insert:
+            cursor.execute(f"SET IDENTITY_INSERT {dst} ON")
+
+        try:
+            if not self.key:
+                if rows_copied:
+                    return rows_copied
+
+                # Sin clave ordenada no se puede paginar: una sola sentencia
+                self.log(f"{src} no tiene clave utilizable para lotes, copiando en una sola sentencia", level=logging.WARNING)
+                self.pacing.wait(self.cancel)
+                hint = " WITH (TABLOCK)" if self._minimal_logging(cursor, rows_copied == 0) else ""
+                cursor.execute(f"""
+                    INSERT INTO {dst}{hint} ({self.columns_list})
+                    SELECT {self.columns_list} FROM {src}
+                    {f"WHERE {extra[0]}" if extra else ""}
+                """)
+                rows_copied += cursor.rowcount
+                save_checkpoint(cursor, self.checkpoint, self.target, None, rows_copied)
+                self.connection.commit()
+                return rows_copied
+
+            key_cols = ", ".join(f"[{k}]" for k in self.key)
+            key_desc = ", ".join(f"[{k}] DESC" for k in self.key)
+            gt_sql, gt_layout = _greater_than(self.key)
+
+            while True:
+                if self.cancel:
+                    self.cancel.check()
+                batch_size = self.pacing.batch_size(self.batch_size, self.cancel)
+                started = time.monotonic()
+                lower = [gt_sql] if last_key is not None else []
+                where = f"WHERE {' AND '.join(lower + extra)}" if lower or extra else ""
+                lower_params = [last_key[i] for i in gt_layout] if last_key is not None else []
+
+                # Límite superior del lote: la clave del batch_size-ésimo registro
+                cursor.execute(f"""
+                    SELECT TOP (1) {key_cols} FROM (
+                        SELECT TOP ({int(batch_size)}) {key_cols}
+                        FROM {src}
+                        {where}
+                        ORDER BY {key_cols}
+                    ) b
+                    ORDER BY {key_desc}
+                """, *lower_params)
+                upper = cursor.fetchone()
+                if upper is None:
+                    break
+                upper_key = list(upper)
+
+                conditions = [f"NOT {gt_sql}"] + extra
+                params = [upper_key[i] for i in gt_layout]
+                if last_key is not None:
+                    conditions.insert(0, gt_sql)
+                    params = lower_params + params
+
+                hint = " WITH (TABLOCK)" if self._minimal_logging(cursor, rows_copied == 0) else ""
+                cursor.execute(f"""
+                    INSERT INTO {dst}{hint} ({self.columns_list})
+                    SELECT {self.columns_list}
+                    FROM {src}
+                    WHERE {' AND '.join(conditions)}
+                """, *params)
+                batch_rows = cursor.rowcount
+
+                rows_copied += batch_rows
+                last_key = upper_key
+                save_checkpoint(cursor, self.checkpoint, self.target, last_key, rows_copied)
+                self.connection.commit()
+
+                elapsed = time.monotonic() - started
+                self.log(f"Lote copiado: {batch_rows} filas ({rows_copied} en total, {elapsed:.1f}s)")
+
+            return rows_copied
+        finally:
+            if self.identity_insert:
+                cursor.execute(f"SET IDENTITY_INSERT {dst} OFF")
@@ -0,0 +1,285 @@
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from cancellation import MigrationCancelled, as_cancelled
+from connection_pool import PURPOSE_DDL, PURPOSE_METADATA, get_pool
+from journal import get_pending_tables
+from migration import ColumnMigration
+from pacing import PacingController, SqlMetricsSource
+from partition_copy import STAGING_SUFFIX
+from planner import get_engine_edition, plan_column_changes, stage_columns
+from telemetry import MigrationTelemetry
+
+# Estados de cada tabla en el lote
+STATUS_PENDING = 'pending'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_SKIPPED = 'skipped'
+STATUS_FAILED = 'failed'
+STATUS_CANCELLED = 'cancelled'
+
+# Estrategia de las tablas con una migración interrumpida en el diario
+STRATEGY_RESUME = 'resume'
+
+# Tablas auxiliares de las migraciones que nunca se incluyen en un lote
+_HELPER_SUFFIXES = ('_TEMP', '_SHADOW', '_CHANGES', '_OLD', STAGING_SUFFIX)
+_HELPER_TABLES = ('ColumnAdder_Checkpoint', 'ColumnAdder_History', 'ColumnAdder_Journal', 'ColumnAdder_JournalStep')
+
+
+def select_tables(connection, schema_pattern='%', table_pattern='%'):
+    """Tablas cuyo esquema y nombre cumplen los patrones LIKE, sin las auxiliares"""
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT s.name AS schema_name, t.name AS table_name
+        FROM sys.tables t
+        JOIN sys.schemas s ON t.schema_id = s.schema_id
+        WHERE s.name LIKE ? AND t.name LIKE ? AND t.is_ms_shipped = 0
+        ORDER BY s.name, t.name
+    """, schema_pattern or '%', table_pattern or '%')
+    return [(row.schema_name, row.table_name) for row in cursor.fetchall()
+            if row.table_name not in _HELPER_TABLES and not row.table_name.endswith(_HELPER_SUFFIXES)]
+
+
+def get_table_columns(connection, tables):
+    """
+    Nombres de columnas por tabla, en una sola consulta. Las tablas seleccionadas se
+    cargan en una tabla temporal y se cruzan en el servidor: solo vuelven sus columnas
+    """
+    columns = {key: set() for key in tables}
+    if not columns:
+        return columns
+    cursor = connection.cursor()
+    cursor.execute("CREATE TABLE #BatchTables (schema_name SYSNAME NOT NULL, table_name SYSNAME NOT NULL)")
+    try:
+        cursor.fast_executemany = True
+        cursor.executemany("INSERT INTO #BatchTables (schema_name, table_name) VALUES (?, ?)", list(columns))
+        cursor.execute("""
+            SELECT k.schema_name, k.table_name, c.name AS column_name
+            FROM #BatchTables k
+            JOIN sys.columns c ON c.object_id = OBJECT_ID(QUOTENAME(k.schema_name) + '.' + QUOTENAME(k.table_name))
+        """)
+        for row in cursor.fetchall():
+            columns[(row.schema_name, row.table_name)].add(row.column_name.lower())
+    finally:
+        cursor.execute("DROP TABLE #BatchTables")
+    return columns
+
+
+def get_fk_links(connection, tables):
+    """Pares (hija, padre) de FK entre las tablas seleccionadas"""
+    cursor = connection.cursor()
+    cursor.execute("""
+        SELECT ps.name AS parent_schema, po.name AS parent_table,
+               rs.name AS referenced_schema, ro.name AS referenced_table
+        FROM sys.foreign_keys fk
+        JOIN sys.objects po ON po.object_id = fk.parent_object_id
+        JOIN sys.schemas ps ON ps.schema_id = po.schema_id
+        JOIN sys.objects ro ON ro.object_id = fk.referenced_object_id
+        JOIN sys.schemas rs ON rs.schema_id = ro.schema_id
+        WHERE fk.parent_object_id <> fk.referenced_object_id
+    """)
+    selected = set(tables)
+    links = []
+    for row in cursor.fetchall():
+        child = (row.parent_schema, row.parent_table)
+        parent = (row.referenced_schema, row.referenced_table)
+        if child in selected and parent in selected:
+            links.append((child, parent))
+    return links
+
+
+def order_by_dependencies(tables, links):
+    """
+    Agrupa las tablas unidas por FK: reconstruir una tabla elimina y recrea las FK
+    de sus vecinas, así que cada grupo se procesa en serie (padres primero) y los
+    grupos independientes en paralelo. Devuelve una lista de grupos ordenados.
+    """
+    neighbours = {key: set() for key in tables}
+    parents = {key: set() for key in tables}
+    for child, parent in links:
+        neighbours[child].add(parent)
+        neighbours[parent].add(child)
+        parents[child].add(parent)
+
+    groups = []
+    seen = set()
+    for start in tables:
+        if start in seen:
+            continue
+        component = []
+        stack = [start]
+        seen.add(start)
+        while stack:
+            key = stack.pop()
+            component.append(key)
+            for other in neighbours[key]:
+                if other not in seen:
+                    seen.add(other)
+                    stack.append(other)
+
+        # Orden topológico dentro del grupo; los ciclos se resuelven por nombre
+        ordered = []
+        remaining = sorted(component)
+        while remaining:
+            ready = [key for key in remaining if not (parents[key] & set(remaining))] or remaining[:1]
+            ordered.extend(ready)
+            remaining = [key for key in remaining if key not in ready]
+        groups.append(ordered)
+
+    # Los grupos grandes primero para que no queden solos al final
+    groups.sort(key=len, reverse=True)
+    return groups
+
+
+class TablePlan:
+    """Plan de una tabla del lote: columnas a agregar y estrategia prevista"""
+
+    def __init__(self, schema, table, columns, strategy, reasons, existing):
+        self.schema = schema
+        self.table = table
+        self.columns = columns
+        self.strategy = strategy
+        self.reasons = reasons
+        self.existing = existing
+        self.status = STATUS_PENDING if columns else STATUS_SKIPPED
+        self.result = None
+        self.error = None
+        self.elapsed = None
+        self.telemetry = None
+
+    @property
+    def key(self):
+        return (self.schema, self.table)
+
+    @property
+    def name(self):
+        return f"{self.schema}.{self.table}"
+
+
+class BatchMigration:
+    """
+    Agrega las mismas columnas a muchas tablas.
+    Cada tabla se migra en su propia conexión y transacción (ColumnMigration.apply);
+    como máximo max_workers tablas a la vez y las tablas unidas por FK en serie.
+    on_event(plan) se llama desde los hilos del pool cada vez que cambia un estado.
+    """
+
+    def __init__(self, conn_str, tables, columns, max_workers=4, batch_size=0, online=False,
+                 log=None, on_event=None, cancel=None, sample_waits=False, index_builder=None, pacing_limits=None,
+                 partition_copier=None):
+        self.conn_str = conn_str
+        self.tables = list(tables)
+        self.columns = columns
+        self.max_workers = max(1, max_workers)
+        self.batch_size = batch_size
+        self.online = online
+        self.log = log or (lambda message, level=logging.INFO: logging.log(level, message))
+        self.on_event = on_event or (lambda plan: None)
+        self.cancel = cancel
+        # El muestreo de esperas abre una conexión extra por tabla en curso
+        self.sample_waits = sample_waits
+        self.index_builder = index_builder
+        self.partition_copier = partition_copier
+        # Límites de ritmo de cada tabla (None = los de pacing.DEFAULT_LIMITS)
+        self.pacing_limits = pacing_limits
+        self.plans = {}
+        self.groups = []
+
+    def plan(self, connection):
+        """Calcula el plan por tabla; las columnas que ya existen se omiten"""
+        engine_edition = get_engine_edition(connection.cursor())
+        table_columns = get_table_columns(connection, self.tables)
+        interrupted = get_pending_tables(connection.cursor())
+
+        self.plans = {}
+        for schema, table in self.tables:
+            # Una migración interrumpida se reanuda con sus propias columnas (el diario las guarda)
+            if f"[{schema}].[{table}]" in interrupted:
+                self.plans[(schema, table)] = TablePlan(schema, table, self.columns, STRATEGY_RESUME,
+                                                        ["Migración interrumpida: se reanuda"], [])
+                continue
+            existing = table_columns.get((schema, table), set())
+            columns = [c for c in self.columns if c['name'].lower() not in existing]
+            skipped = [c['name'] for c in self.columns if c['name'].lower() in existing]
+            if columns:
+                result = plan_column_changes(stage_columns(columns), engine_edition)
+                strategy, reasons = result['strategy'], result['reasons']
+            else:
+                strategy, reasons = None, ["Todas las columnas ya existen"]
+            self.plans[(schema, table)] = TablePlan(schema, table, columns, strategy, reasons, skipped)
+
+        self.groups = order_by_dependencies(self.tables, get_fk_links(connection, self.tables))
+        return list(self.plans.values())
+
+    def run(self):
+        """Ejecuta el plan; devuelve los planes con su estado final"""
+        # Una conexión por hilo más las de seguimiento (esperas, bloqueos) y las de índices o
+        # particiones de cada tabla en curso
+        index_workers = self.index_builder.workers if self.index_builder else 1
+        partition_workers = self.partition_copier.workers if self.partition_copier else 1
+        pool = get_pool(self.conn_str, max_size=self.max_workers * (3 + max(index_workers, partition_workers)) + 2)
+        if not self.plans:
+            with pool.session(PURPOSE_METADATA) as pooled:
+                self.plan(pooled.connection)
+
+        pending = [key for group in self.groups for key in group if self.plans[key].status == STATUS_PENDING]
+        self.log(f"Migrando {len(pending)} tabla(s) con {self.max_workers} conexión(es) en paralelo")
+
+        def run_group(group):
+            for key in group:
+                self._run_table(self.plans[key], pool)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="batch") as executor:
+            for future in [executor.submit(run_group, group) for group in self.groups]:
+                future.result()
+
+        summary = {}
+        for plan in self.plans.values():
+            summary[plan.status] = summary.get(plan.status, 0) + 1
+        self.log("Lote terminado: " + ", ".join(f"{status}={count}" for status, count in sorted(summary.items())))
+        return list(self.plans.values())
+
+    def _run_table(self, plan, pool):
+        if plan.status != STATUS_PENDING:
+            return
+        if self.cancel and self.cancel.cancelled:
+            plan.status = STATUS_CANCELLED
+            self.on_event(plan)
+            return
+
+        plan.status = STATUS_RUNNING
+        self.on_event(plan)
+        start = time.monotonic()
+
+        def log(message, level=logging.INFO):
+            self.log(f"[{plan.name}] {message}", level)
+
+        try:
+            if self.cancel:
+                self.cancel.check()
+            # La sesión vuelve al pool al terminar la tabla; el pool deshace lo pendiente
+            with pool.session(PURPOSE_DDL) as pooled:
+                connection = pooled.connection
+                telemetry = MigrationTelemetry(connection, plan.name, conn_str=self.conn_str,
+                                               sample_waits=self.sample_waits)
+                pacing = PacingController(SqlMetricsSource(connection, self.conn_str), limits=self.pacing_limits, log=log)
+                migration = ColumnMigration(connection, plan.schema, plan.table, log=log, cancel=self.cancel,
+                                            telemetry=telemetry, index_builder=self.index_builder, pacing=pacing,
+                                            partition_copier=self.partition_copier)
+                try:
+                    plan.result = migration.apply(plan.columns, batch_size=self.batch_size, online=self.online)
+                finally:
+                    plan.telemetry = migration.telemetry_summary
+            plan.status = STATUS_DONE
+        except Exception as e:
+            # El error del driver por SQLCancel también es una cancelación
+            if isinstance(as_cancelled(e, self.cancel), MigrationCancelled):
+                plan.status = STATUS_CANCELLED
+            else:
+                plan.status = STATUS_FAILED
+                plan.error = str(e)
+                log(f"Error: {str(e)}", level=logging.ERROR)
+        finally:
+            plan.elapsed = time.monotonic() - start
+            self.on_event(plan)
@@ -0,0 +1,53 @@
+import threading
+
+
+class MigrationCancelled(Exception):
+    """La operación fue cancelada por el usuario"""
+
+
+def as_cancelled(error, cancel):
+    """
+    Excepción a informar por error: SQLCancel hace fallar la sentencia en curso con
+    un error del driver (HY008), que con el token cancelado es una cancelación
+    """
+    if cancel is not None and cancel.cancelled and not isinstance(error, MigrationCancelled):
+        return MigrationCancelled("Operación cancelada por el usuario")
+    return error
+
+
+class CancelToken:
+    """
+    Permite cancelar una operación que corre en otro hilo: marca la cancelación,
+    envía SQLCancel a los cursores registrados y las etapas largas consultan check()
+    entre lotes.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._cursors = []
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def track(self, cursor):
+        """Registra un cursor para poder cancelar su sentencia en curso"""
+        with self._lock:
+            self._cursors.append(cursor)
+        return cursor
+
+    def cancel(self):
+        self._event.set()
+        with self._lock:
+            cursors = list(self._cursors)
+        for cursor in cursors:
+            try:
+                cursor.cancel()
+            except Exception:
+                # El cursor puede estar cerrado o sin sentencia activa
+                pass
+
+    def check(self):
+        if self._event.is_set():
+            raise MigrationCancelled("Operación cancelada por el usuario")
@@ -0,0 +1,256 @@
+from collections import namedtuple
+
+
+SYSTEM_SCHEMAS = ('guest', 'INFORMATION_SCHEMA', 'sys', 'db_owner', 'db_accessadmin',
+                  'db_securityadmin', 'db_ddladmin', 'db_backupoperator',
+                  'db_datareader', 'db_datawriter', 'db_denydatareader', 'db_denydatawriter')
+
+
+ColumnInfo = namedtuple('ColumnInfo', ['column_name', 'type_name', 'max_length', 'precision', 'scale',
+                                       'is_nullable', 'default_value', 'column_id'])
+
+_CATALOG_COLUMNS_QUERY = """
+    SELECT
+        s.name AS schema_name,
+        t.name AS table_name,
+        t.modify_date,
+        c.name AS column_name,
+        tp.name AS type_name,
+        c.max_length,
+        c.precision,
+        c.scale,
+        c.is_nullable,
+        ISNULL(dc.definition, '') AS default_value,
+        c.column_id
+    FROM sys.tables t
+    JOIN sys.schemas s ON t.schema_id = s.schema_id
+    JOIN sys.columns c ON c.object_id = t.object_id
+    JOIN sys.types tp ON c.user_type_id = tp.user_type_id
+    LEFT JOIN sys.default_constraints dc ON c.default_object_id = dc.object_id
+"""
+
+# Filas aproximadas por tabla (heap o índice clúster, todas las particiones)
+_ROW_COUNTS_QUERY = """
+    SELECT s.name AS schema_name, t.name AS table_name, SUM(p.rows) AS row_count
+    FROM sys.tables t
+    JOIN sys.schemas s ON t.schema_id = s.schema_id
+    JOIN sys.partitions p ON p.object_id = t.object_id AND p.index_id IN (0, 1)
+"""
+
+# Versión del catálogo: cambia si la base se recrea o se restaura
+_VERSION_QUERY = "SELECT CONVERT(NVARCHAR(30), create_date, 126) FROM sys.databases WHERE database_id = DB_ID()"
+
+
+class CatalogCache:
+    """
+    Caché por conexión de esquemas, tablas y columnas.
+    Se carga con una sola ida y vuelta y se indexa por esquema y tabla;
+    después se invalida por tabla tras nuestro DDL o consultando
+    sys.tables.modify_date para detectar cambios externos.
+    Las listas se reemplazan, nunca se modifican, para poder leerlas
+    desde el hilo de la interfaz mientras el trabajador actualiza.
+    restore() la llena desde una instantánea local (ver catalog_snapshot);
+    el siguiente poll() trae solo lo que cambió desde entonces.
+    """
+
+    # Límite de tablas para recargar selectivamente (cada una usa 4 parámetros de 2100)
+    MAX_SELECTIVE_REFRESH = 500
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.loaded = False
+        self.schemas = []
+        self.tables = {}
+        self.columns = {}
+        self.modify_dates = {}
+        self.row_counts = {}
+        self.table_count = 0
+        self.max_modify_date = None
+        self.version = None
+
+    def restore(self, schemas, columns, modify_dates, row_counts, version):
+        """Carga el catálogo guardado en una instantánea; columns es {(esquema, tabla): [ColumnInfo]}"""
+        tables = {}
+        for schema, table in sorted(columns):
+            tables.setdefault(schema, []).append(table)
+        self.schemas = schemas
+        self.tables = tables
+        self.columns = columns
+        self.modify_dates = modify_dates
+        self.row_counts = row_counts
+        self.table_count = len(modify_dates)
+        self.max_modify_date = max(modify_dates.values(), default=None)
+        self.version = version
+        self.loaded = True
+
+    def load(self, connection):
+        """Carga el catálogo completo en una sola ida y vuelta"""
+        cursor = connection.cursor()
+        cursor.execute(f"""
+            SET NOCOUNT ON;
+
+            SELECT name
+            FROM sys.schemas
+            WHERE name NOT IN ({', '.join('?' * len(SYSTEM_SCHEMAS))})
+            ORDER BY name;
+
+            {_CATALOG_COLUMNS_QUERY}
+            ORDER BY s.name, t.name, c.column_id;
+
+            {_ROW_COUNTS_QUERY}
+            GROUP BY s.name, t.name;
+
+            {_VERSION_QUERY};
+        """, *SYSTEM_SCHEMAS)
+
+        schemas = [row.name for row in cursor.fetchall()]
+        cursor.nextset()
+        tables, columns, modify_dates = self._index(cursor.fetchall())
+        cursor.nextset()
+        row_counts = {(row.schema_name, row.table_name): row.row_count for row in cursor.fetchall()}
+        cursor.nextset()
+        version = cursor.fetchone()[0]
+
+        self.schemas = schemas
+        self.tables = tables
+        self.columns = columns
+        self.modify_dates = modify_dates
+        self.row_counts = row_counts
+        self.table_count = len(modify_dates)
+        self.max_modify_date = max(modify_dates.values(), default=None)
+        self.version = version
+        self.loaded = True
+
+    @staticmethod
+    def _index(rows):
+        tables = {}
+        columns = {}
+        modify_dates = {}
+        for row in rows:
+            key = (row.schema_name, row.table_name)
+            if key not in columns:
+                columns[key] = []
+                tables.setdefault(row.schema_name, []).append(row.table_name)
+                modify_dates[key] = row.modify_date
+            columns[key].append(ColumnInfo(row.column_name, row.type_name, row.max_length, row.precision,
+                                           row.scale, row.is_nullable, row.default_value, row.column_id))
+        return tables, columns, modify_dates
+
+    def get_tables(self, schema):
+        """Tablas del esquema desde la caché (None si no está cargada)"""
+        if not self.loaded:
+            return None
+        return self.tables.get(schema, [])
+
+    def get_columns(self, schema, table):
+        """Columnas de la tabla desde la caché (None si no está o fue invalidada)"""
+        return self.columns.get((schema, table))
+
+    def get_row_count(self, schema, table):
+        """Filas aproximadas de la tabla según la última lectura (None si no se conocen)"""
+        return self.row_counts.get((schema, table))
+
+    def invalidate(self, schema, table):
+        """Descarta las columnas de una tabla para recargarlas en el próximo acceso"""
+        columns = dict(self.columns)
+        columns.pop((schema, table), None)
+        self.columns = columns
+
+    def refresh_tables(self, connection, keys):
+        """Recarga tablas concretas; las que ya no existen se quitan de la caché"""
+        if not keys:
+            return
+        cursor = connection.cursor()
+        conditions = " OR ".join("(s.name = ? AND t.name = ?)" for _ in keys)
+        params = [value for key in keys for value in key]
+        cursor.execute(f"""
+            {_CATALOG_COLUMNS_QUERY}
+            WHERE {conditions}
+            ORDER BY s.name, t.name, c.column_id;
+
+            {_ROW_COUNTS_QUERY}
+            WHERE {conditions}
+            GROUP BY s.name, t.name;
+        """, *(params + params))
+        tables, columns, modify_dates = self._index(cursor.fetchall())
+        cursor.nextset()
+        row_counts = {(row.schema_name, row.table_name): row.row_count for row in cursor.fetchall()}
+
+        new_columns = dict(self.columns)
+        new_dates = dict(self.modify_dates)
+        new_counts = dict(self.row_counts)
+        new_tables = dict(self.tables)
+        for key in keys:
+            schema, table = key
+            new_columns.pop(key, None)
+            new_dates.pop(key, None)
+            new_counts.pop(key, None)
+            if key in columns:
+                new_columns[key] = columns[key]
+                new_dates[key] = modify_dates[key]
+                new_counts[key] = row_counts.get(key)
+                if table not in new_tables.get(schema, []):
+                    new_tables[schema] = sorted(new_tables.get(schema, []) + [table])
+            elif table in new_tables.get(schema, []):
+                new_tables[schema] = [t for t in new_tables[schema] if t != table]
+
+        self.columns = new_columns
+        self.modify_dates = new_dates
+        self.row_counts = new_counts
+        self.tables = new_tables
+        self.table_count = len(new_dates)
+        self.max_modify_date = max(new_dates.values(), default=None)
+
+    def refresh_table(self, connection, schema, table):
+        """Recarga una tabla después de modificarla nosotros"""
+        self.refresh_tables(connection, [(schema, table)])
+
+    def refresh_row_counts(self, connection):
+        """Relee las filas de todas las tablas (los INSERT/DELETE no cambian modify_date)"""
+        cursor = connection.cursor()
+        cursor.execute(f"{_ROW_COUNTS_QUERY} GROUP BY s.name, t.name")
+        self.row_counts = {(row.schema_name, row.table_name): row.row_count for row in cursor.fetchall()}
+
+    def poll(self, connection):
+        """
+        Detecta cambios externos. Si cambió el número de tablas (creadas o borradas)
+        se recarga todo; si no, solo las tablas con modify_date posterior al conocido.
+        Devuelve la lista de (esquema, tabla) modificados, o None si se recargó todo.
+        """
+        if not self.loaded:
+            self.load(connection)
+            return None
+
+        cursor = connection.cursor()
+        cursor.execute(f"SELECT COUNT(*), MAX(modify_date), ({_VERSION_QUERY}) FROM sys.tables")
+        table_count, max_modify_date, version = cursor.fetchone()
+
+        # Una instantánea de otra base con el mismo nombre (recreada o restaurada) no sirve
+        if table_count != self.table_count or version != self.version:
+            self.load(connection)
+            return None
+        if self.max_modify_date is None or max_modify_date is None or max_modify_date <= self.max_modify_date:
+            return []
+
+        cursor.execute("""
+            SELECT s.name AS schema_name, t.name AS table_name
+            FROM sys.tables t
+            JOIN sys.schemas s ON t.schema_id = s.schema_id
+            WHERE t.modify_date > ?
+        """, self.max_modify_date)
+        changed = [(row.schema_name, row.table_name) for row in cursor.fetchall()]
+
+        # Con muchos cambios es más barato recargar todo de una vez
+        if len(changed) > self.MAX_SELECTIVE_REFRESH:
+            self.load(connection)
+            return None
+
+        # Un renombrado aparece como tabla nueva: la anterior hay que quitarla
+        if any(key not in self.modify_dates for key in changed):
+            self.load(connection)
+            return None
+
+        self.refresh_tables(connection, changed)
+        return changed
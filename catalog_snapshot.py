@@ -0,0 +1,173 @@
+import logging
+import sqlite3
+import datetime
+from contextlib import closing
+
+from catalog import ColumnInfo
+
+# Archivo local con el catálogo de cada servidor/base, junto al log de la aplicación
+DEFAULT_SNAPSHOT_PATH = 'sql_column_adder_catalog.db'
+
+# Se incrementa cuando cambia el formato de las tablas de la instantánea
+SNAPSHOT_FORMAT = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshot (
+    snapshot_id INTEGER PRIMARY KEY,
+    server TEXT NOT NULL,
+    database TEXT NOT NULL,
+    format INTEGER NOT NULL,
+    version TEXT,
+    saved_at TEXT NOT NULL,
+    UNIQUE (server, database)
+);
+CREATE TABLE IF NOT EXISTS snapshot_schema (
+    snapshot_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (snapshot_id, name)
+);
+CREATE TABLE IF NOT EXISTS snapshot_table (
+    snapshot_id INTEGER NOT NULL,
+    schema_name TEXT NOT NULL,
+    table_name TEXT NOT NULL,
+    modify_date TEXT NOT NULL,
+    row_count INTEGER,
+    PRIMARY KEY (snapshot_id, schema_name, table_name)
+);
+CREATE TABLE IF NOT EXISTS snapshot_column (
+    snapshot_id INTEGER NOT NULL,
+    schema_name TEXT NOT NULL,
+    table_name TEXT NOT NULL,
+    column_id INTEGER NOT NULL,
+    column_name TEXT NOT NULL,
+    type_name TEXT NOT NULL,
+    max_length INTEGER,
+    precision INTEGER,
+    scale INTEGER,
+    is_nullable INTEGER,
+    default_value TEXT,
+    PRIMARY KEY (snapshot_id, schema_name, table_name, column_id)
+) WITHOUT ROWID;
+"""
+
+
+def _key(server, database):
+    """Los nombres de servidor y base no distinguen mayúsculas"""
+    return server.strip().lower(), database.strip().lower()
+
+
+class CatalogSnapshot:
+    """
+    Instantánea local (SQLite) del catálogo de cada servidor/base: esquemas, tablas
+    con su modify_date y filas, y columnas con sus tipos. Al conectar, la interfaz se
+    llena desde aquí sin esperar a la base y un sondeo en segundo plano
+    (CatalogCache.poll) trae solo las tablas con modify_date posterior; lo que cambia
+    se vuelve a guardar por tabla. Cada operación abre su propia conexión SQLite, así
+    que puede usarse desde el hilo de la interfaz y desde los trabajadores.
+    """
+
+    def __init__(self, path=DEFAULT_SNAPSHOT_PATH, log=None):
+        self.path = path
+        self.log = log or (lambda message, level=logging.INFO: logging.log(level, message))
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=10)
+        connection.executescript(_SCHEMA)
+        return connection
+
+    def load(self, server, database, cache):
+        """Llena la caché desde la instantánea; False si no hay una utilizable"""
+        try:
+            with closing(self._connect()) as db:
+                row = db.execute("SELECT snapshot_id, format, version, saved_at FROM snapshot "
+                                 "WHERE server = ? AND database = ?", _key(server, database)).fetchone()
+                if not row or row[1] != SNAPSHOT_FORMAT:
+                    return False
+                snapshot_id, _, version, saved_at = row
+                schemas = [r[0] for r in db.execute("SELECT name FROM snapshot_schema WHERE snapshot_id = ? "
+                                                    "ORDER BY name", (snapshot_id,))]
+                modify_dates = {}
+                row_counts = {}
+                for schema, table, modify_date, row_count in db.execute(
+                        "SELECT schema_name, table_name, modify_date, row_count FROM snapshot_table "
+                        "WHERE snapshot_id = ?", (snapshot_id,)):
+                    modify_dates[(schema, table)] = datetime.datetime.fromisoformat(modify_date)
+                    row_counts[(schema, table)] = row_count
+                columns = {key: [] for key in modify_dates}
+                for row in db.execute("SELECT schema_name, table_name, column_name, type_name, max_length, "
+                                      "precision, scale, is_nullable, default_value, column_id "
+                                      "FROM snapshot_column WHERE snapshot_id = ? "
+                                      "ORDER BY schema_name, table_name, column_id", (snapshot_id,)):
+                    key = (row[0], row[1])
+                    if key in columns:
+                        columns[key].append(ColumnInfo(row[2], row[3], row[4], row[5], row[6], bool(row[7]),
+                                                       row[8], row[9]))
+        except (sqlite3.Error, ValueError) as e:
+            self.log(f"No se pudo leer la instantánea del catálogo: {str(e)}", level=logging.WARNING)
+            return False
+
+        cache.restore(schemas, columns, modify_dates, row_counts, version)
+        self.log(f"Catálogo cargado desde la instantánea local del {saved_at} ({len(modify_dates)} tablas)")
+        return True
+
+    def save(self, server, database, cache, changed=None):
+        """
+        Guarda la caché. changed es la lista de (esquema, tabla) a reescribir; None
+        reescribe la instantánea completa (después de una carga total)
+        """
+        if not cache.loaded:
+            return
+        try:
+            with closing(self._connect()) as db, db:
+                snapshot_id = self._snapshot_id(db, server, database, cache)
+                if changed is None:
+                    for table in ('snapshot_schema', 'snapshot_table', 'snapshot_column'):
+                        db.execute(f"DELETE FROM {table} WHERE snapshot_id = ?", (snapshot_id,))
+                    db.executemany("INSERT INTO snapshot_schema (snapshot_id, name) VALUES (?, ?)",
+                                   [(snapshot_id, name) for name in cache.schemas])
+                    keys = list(cache.modify_dates)
+                else:
+                    keys = list(changed)
+                    for key in keys:
+                        db.execute("DELETE FROM snapshot_table WHERE snapshot_id = ? AND schema_name = ? "
+                                   "AND table_name = ?", (snapshot_id,) + key)
+                        db.execute("DELETE FROM snapshot_column WHERE snapshot_id = ? AND schema_name = ? "
+                                   "AND table_name = ?", (snapshot_id,) + key)
+
+                # Las tablas que ya no están en la caché (borradas) solo se eliminan
+                present = [key for key in keys if key in cache.modify_dates and key in cache.columns]
+                db.executemany("INSERT INTO snapshot_table (snapshot_id, schema_name, table_name, modify_date, "
+                               "row_count) VALUES (?, ?, ?, ?, ?)",
+                               [(snapshot_id,) + key + (cache.modify_dates[key].isoformat(),
+                                                        cache.row_counts.get(key)) for key in present])
+                db.executemany("INSERT INTO snapshot_column (snapshot_id, schema_name, table_name, column_id, "
+                               "column_name, type_name, max_length, precision, scale, is_nullable, default_value) "
+                               "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                               [(snapshot_id,) + key + (c.column_id, c.column_name, c.type_name, c.max_length,
+                                                        c.precision, c.scale, int(bool(c.is_nullable)),
+                                                        c.default_value)
+                                for key in present for c in cache.columns[key]])
+        except sqlite3.Error as e:
+            self.log(f"No se pudo guardar la instantánea del catálogo: {str(e)}", level=logging.WARNING)
+
+    def save_row_counts(self, server, database, cache):
+        """Actualiza solo las filas por tabla"""
+        try:
+            with closing(self._connect()) as db, db:
+                snapshot_id = self._snapshot_id(db, server, database, cache)
+                db.executemany("UPDATE snapshot_table SET row_count = ? WHERE snapshot_id = ? AND schema_name = ? "
+                               "AND table_name = ?",
+                               [(count, snapshot_id) + key for key, count in cache.row_counts.items()])
+        except sqlite3.Error as e:
+            self.log(f"No se pudo guardar la instantánea del catálogo: {str(e)}", level=logging.WARNING)
+
+    @staticmethod
+    def _snapshot_id(db, server, database, cache):
+        server, database = _key(server, database)
+        saved_at = datetime.datetime.now().isoformat(timespec='seconds')
+        db.execute("INSERT INTO snapshot (server, database, format, version, saved_at) VALUES (?, ?, ?, ?, ?) "
+                   "ON CONFLICT (server, database) DO UPDATE SET format = excluded.format, "
+                   "version = excluded.version, saved_at = excluded.saved_at",
+                   (server, database, SNAPSHOT_FORMAT, cache.version, saved_at))
+        return db.execute("SELECT snapshot_id FROM snapshot WHERE server = ? AND database = ?",
+                          (server, database)).fetchone()[0]
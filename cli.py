@@ -0,0 +1,248 @@
+"""
+Entrada de línea de comandos sin interfaz gráfica (no importa PyQt5).
+
+Ejemplo:
+    python cli.py apply --server localhost --database Ventas --driver "ODBC Driver 17 for SQL Server" \
+        --user sa --schema dbo --table Clientes --spec columnas.yaml --json
+"""
+import sys
+import json
+import time
+import logging
+import argparse
+import os
+
+from batch_migration import BatchMigration, select_tables, STATUS_FAILED, STATUS_CANCELLED
+from cancellation import MigrationCancelled
+from column_spec import ColumnSpecError, load_column_spec
+from connection_config import build_connection_string
+from connection_pool import PURPOSE_DDL, close_pool, get_pool
+from index_builder import IndexBuilder
+from partition_copy import PartitionCopier
+from migration import ColumnMigration
+from pacing import (DEFAULT_MAX_BLOCKED_MS, DEFAULT_MAX_LOG_PERCENT, DEFAULT_MAX_LOG_SEND_QUEUE_KB,
+                    DEFAULT_MAX_REDO_QUEUE_KB, PacingController, PacingLimits, SqlMetricsSource)
+from planner import format_estimate
+from progress import ProgressMonitor
+from telemetry import MigrationTelemetry
+from type_change import STRATEGY_ALTER, STRATEGY_ALTER_DEPENDENTS, STRATEGY_SWAP, format_type_change
+
+# Códigos de salida
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_USAGE = 2
+EXIT_CANCELLED = 130
+
+PASSWORD_ENV = "SQLCOLADDER_PASSWORD"
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='sqlcoladder',
+        description='SQL Column Adder - v1.0',
+        epilog='Desarrollado por Ivan Gulfo (ivansicol@gmail.com)'
+    )
+
+    common = argparse.ArgumentParser(add_help=False)
+    conn = common.add_argument_group("conexión")
+    conn.add_argument("--server", required=True, help="Servidor SQL Server")
+    conn.add_argument("--database", required=True, help="Base de datos")
+    conn.add_argument("--driver", default="Windows",
+                      help='Driver ODBC para autenticación SQL, o "Windows" para autenticación integrada')
+    conn.add_argument("--user", help="Usuario (autenticación SQL)")
+    conn.add_argument("--password", help=f"Contraseña; también puede darse en la variable {PASSWORD_ENV}")
+    common.add_argument("--schema", default="dbo", help="Esquema de la tabla")
+    common.add_argument("--json", action="store_true", help="Escribe el resultado como JSON en la salida estándar")
+    common.add_argument("--quiet", action="store_true", help="Solo registra advertencias y errores")
+
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    apply_parser = subparsers.add_parser("apply", parents=[common], help="Agrega columnas desde una especificación")
+    target = apply_parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--table", help="Tabla a modificar")
+    target.add_argument("--table-like", help="Patrón LIKE de tablas (el esquema también admite LIKE)")
+    apply_parser.add_argument("--spec", required=True, help="Archivo JSON, YAML o CSV con las columnas")
+    apply_parser.add_argument("--batch-size", type=int, default=0, help="Filas por lote al copiar datos (0 = sin lotes)")
+    apply_parser.add_argument("--online", action="store_true", help="Reconstrucción en tabla sombra")
+    apply_parser.add_argument("--workers", type=int, default=4, help="Conexiones en paralelo con --table-like")
+    apply_parser.add_argument("--progress-interval", type=float, default=10.0,
+                              help="Segundos entre mensajes de avance de la copia")
+    apply_parser.add_argument("--index-workers", type=int, default=1,
+                              help="Sesiones en paralelo para crear los índices no clúster (con --batch-size u --online)")
+    apply_parser.add_argument("--maxdop", type=int, default=0, help="MAXDOP al crear índices (0 = el del servidor)")
+    apply_parser.add_argument("--partition-workers", type=int, default=1,
+                              help="Sesiones en paralelo para copiar las particiones de una tabla particionada")
+    apply_parser.add_argument("--switch", action="store_true",
+                              help="Carga cada partición en una tabla de staging y la incorpora con SWITCH")
+    pacing = apply_parser.add_argument_group("ritmo (0 desactiva cada límite)")
+    pacing.add_argument("--max-send-queue-mb", type=float, default=DEFAULT_MAX_LOG_SEND_QUEUE_KB / 1024,
+                        help="Cola de envío del AG a partir de la cual se reduce el lote y se pausa")
+    pacing.add_argument("--max-redo-queue-mb", type=float, default=DEFAULT_MAX_REDO_QUEUE_KB / 1024,
+                        help="Cola de redo de las secundarias a partir de la cual se pausa")
+    pacing.add_argument("--max-log-percent", type=float, default=DEFAULT_MAX_LOG_PERCENT,
+                        help="Porcentaje de log usado a partir del cual se pausa")
+    pacing.add_argument("--max-blocked-ms", type=int, default=DEFAULT_MAX_BLOCKED_MS,
+                        help="Espera máxima de las sesiones bloqueadas por la migración")
+
+    plan_parser = subparsers.add_parser("plan", parents=[common],
+                                        help="Muestra estrategia y estimaciones sin modificar nada")
+    plan_parser.add_argument("--table", required=True)
+    plan_parser.add_argument("--spec", required=True, help="Archivo JSON, YAML o CSV con las columnas")
+    plan_parser.add_argument("--batch-size", type=int, default=0)
+    plan_parser.add_argument("--online", action="store_true")
+
+    alter_parser = subparsers.add_parser("alter", parents=[common], help="Modifica tipo, nulabilidad o default de una columna")
+    alter_parser.add_argument("--table", required=True)
+    alter_parser.add_argument("--column", required=True)
+    alter_parser.add_argument("--type", required=True, help='Tipo completo, ej. "nvarchar(200)"')
+    alter_parser.add_argument("--not-null", action="store_true")
+    alter_parser.add_argument("--default", help="Nuevo valor por defecto (vacío lo elimina)")
+    alter_parser.add_argument("--strategy", choices=[STRATEGY_ALTER, STRATEGY_ALTER_DEPENDENTS, STRATEGY_SWAP],
+                              help="Forma de aplicar el cambio (por defecto la que propone el análisis)")
+    alter_parser.add_argument("--batch-size", type=int, default=0, help="Filas por lote con --strategy swap")
+    alter_parser.add_argument("--analyze", action="store_true", help="Solo muestra impacto y estrategia")
+
+    rename_parser = subparsers.add_parser("rename", parents=[common], help="Renombra una columna")
+    rename_parser.add_argument("--table", required=True)
+    rename_parser.add_argument("--column", required=True)
+    rename_parser.add_argument("--new-name", required=True)
+
+    drop_parser = subparsers.add_parser("drop", parents=[common], help="Elimina una columna")
+    drop_parser.add_argument("--table", required=True)
+    drop_parser.add_argument("--column", required=True)
+
+    return parser
+
+
+def pacing_limits(args):
+    return PacingLimits(int(args.max_send_queue_mb * 1024), int(args.max_redo_queue_mb * 1024),
+                        args.max_log_percent, args.max_blocked_ms)
+
+
+def run_apply(args, connection, conn_str, log):
+    columns = load_column_spec(args.spec)
+    index_builder = IndexBuilder(conn_str, workers=args.index_workers, maxdop=args.maxdop)
+    partition_copier = PartitionCopier(conn_str, workers=args.partition_workers, switch=args.switch)
+    limits = pacing_limits(args)
+
+    if args.table:
+        telemetry = MigrationTelemetry(connection, f"{args.schema}.{args.table}", conn_str=conn_str)
+        progress = ProgressMonitor(conn_str, log=log, log_interval=args.progress_interval)
+        pacing = PacingController(SqlMetricsSource(connection, conn_str), limits=limits, log=log)
+        migration = ColumnMigration(connection, args.schema, args.table, log=log, telemetry=telemetry,
+                                    progress=progress, index_builder=index_builder, pacing=pacing,
+                                    partition_copier=partition_copier)
+        strategy = migration.apply(columns, batch_size=args.batch_size, online=args.online)
+        return {'table': f"{args.schema}.{args.table}", 'strategy': strategy,
+                'columns': [c['name'] for c in columns], 'telemetry': migration.telemetry_summary}, EXIT_OK
+
+    tables = select_tables(connection, args.schema, args.table_like)
+    batch = BatchMigration(conn_str, tables, columns, max_workers=args.workers,
+                           batch_size=args.batch_size, online=args.online, log=log, index_builder=index_builder,
+                           pacing_limits=limits, partition_copier=partition_copier)
+    batch.plan(connection)
+    plans = batch.run()
+    result = {'tables': [{
+        'table': plan.name,
+        'status': plan.status,
+        'strategy': plan.result or plan.strategy,
+        'skipped_columns': plan.existing,
+        'elapsed': plan.elapsed,
+        'error': plan.error,
+        'telemetry': plan.telemetry,
+    } for plan in plans]}
+    if any(plan.status == STATUS_CANCELLED for plan in plans):
+        return result, EXIT_CANCELLED
+    if any(plan.status == STATUS_FAILED for plan in plans):
+        return result, EXIT_ERROR
+    return result, EXIT_OK
+
+
+def run_plan(args, connection, conn_str, log):
+    columns = load_column_spec(args.spec)
+    estimate = ColumnMigration(connection, args.schema, args.table, log=log).estimate(
+        columns, batch_size=args.batch_size, online=args.online)
+    if not args.json:
+        print(format_estimate(estimate))
+    return {'plan': estimate}, EXIT_OK
+
+
+def run_alter(args, connection, conn_str, log):
+    new_data = {'type': args.type, 'nullable': not args.not_null}
+    if args.default is not None:
+        new_data['default'] = args.default
+    migration = ColumnMigration(connection, args.schema, args.table, log=log)
+    if args.analyze:
+        analysis = migration.analyze_column_change(args.column, new_data)
+        if not args.json:
+            print(format_type_change(analysis))
+        return {'analysis': analysis}, EXIT_OK
+    strategy = migration.alter_column(args.column, new_data, args.strategy, args.batch_size)
+    return {'table': f"{args.schema}.{args.table}", 'column': args.column, 'strategy': strategy}, EXIT_OK
+
+
+def run_rename(args, connection, conn_str, log):
+    ColumnMigration(connection, args.schema, args.table, log=log).rename_column(args.column, args.new_name)
+    return {'table': f"{args.schema}.{args.table}", 'column': args.new_name}, EXIT_OK
+
+
+def run_drop(args, connection, conn_str, log):
+    ColumnMigration(connection, args.schema, args.table, log=log).drop_column(args.column)
+    return {'table': f"{args.schema}.{args.table}", 'column': args.column}, EXIT_OK
+
+
+COMMANDS = {
+    'apply': run_apply,
+    'plan': run_plan,
+    'alter': run_alter,
+    'rename': run_rename,
+    'drop': run_drop,
+}
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    # El registro va a stderr para que stdout quede libre para el JSON
+    logging.basicConfig(stream=sys.stderr, level=logging.WARNING if args.quiet else logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    def log(message, level=logging.INFO):
+        logging.log(level, message)
+
+    output = {'command': args.command}
+    start = time.monotonic()
+    conn_str = None
+    try:
+        password = args.password if args.password is not None else os.environ.get(PASSWORD_ENV)
+        conn_str = build_connection_string(args.server, args.database, args.driver, args.user, password)
+        # El seguimiento de la copia y los hilos del lote toman otras sesiones del mismo pool
+        with get_pool(conn_str).session(PURPOSE_DDL) as pooled:
+            result, code = COMMANDS[args.command](args, pooled.connection, conn_str, log)
+        output.update(result)
+    except ColumnSpecError as e:
+        output['error'] = str(e)
+        code = EXIT_USAGE
+    except (MigrationCancelled, KeyboardInterrupt):
+        output['error'] = "Operación cancelada"
+        code = EXIT_CANCELLED
+    except Exception as e:
+        output['error'] = str(e)
+        code = EXIT_ERROR
+    finally:
+        if conn_str is not None:
+            close_pool(conn_str)
+
+    output['status'] = 'ok' if code == EXIT_OK else 'error'
+    output['elapsed'] = round(time.monotonic() - start, 3)
+    if args.json:
+        print(json.dumps(output, ensure_ascii=False, default=str))
+    elif code == EXIT_OK:
+        print(f"{args.command}: completado en {output['elapsed']} s")
+    else:
+        print(f"{args.command}: {output.get('error', 'error')}", file=sys.stderr)
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PyQt5.QtWidgets import QComboBox, QStyledItemDelegate
+
+from column_spec import AFTER_FIRST
+
+SQL_TYPES = ["int", "bigint", "smallint", "tinyint", "bit",
+             "decimal", "numeric", "money", "smallmoney",
+             "float", "real",
+             "date", "datetime", "datetime2", "smalldatetime", "time",
+             "char", "varchar", "text", "nchar", "nvarchar", "ntext",
+             "binary", "varbinary", "image",
+             "uniqueidentifier", "xml", "sql_variant"]
+
+HEADERS = ["Nombre", "Tipo", "Parámetros", "Nullable", "Default", "Posición", "Rellenar con"]
+COL_NAME, COL_TYPE, COL_PARAMS, COL_NULL, COL_DEFAULT, COL_AFTER, COL_EXPRESSION = range(len(HEADERS))
+
+# Clave del diccionario de columna que muestra cada columna del editor
+_FIELDS = {COL_NAME: 'name', COL_TYPE: 'type', COL_PARAMS: 'params', COL_DEFAULT: 'default', COL_AFTER: 'after',
+           COL_EXPRESSION: 'expression'}
+
+LABEL_FIRST = "(al inicio)"
+LABEL_LAST = "(al final)"
+
+
+def new_column():
+    """Fila nueva del editor: al final y con NULL, lo que permite ALTER TABLE ADD sin reconstruir"""
+    return {'name': "", 'type': "int", 'params': "", 'allow_null': True, 'default': "", 'after': None,
+            'expression': ""}
+
+
+class ColumnSpecModel(QAbstractTableModel):
+    """
+    Columnas del editor múltiple como lista de diccionarios (el mismo formato de
+    ColumnMigration y de column_spec). Las celdas se editan con delegados, así que
+    cargar cientos de columnas no crea ningún widget.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._columns = []
+        # Columnas de la tabla actual, para la posición 'after'
+        self.existing_columns = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._columns)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return HEADERS[section]
+        return str(section + 1)
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        flags = Qt.ItemIsEnabled | Qt.ItemIsSelectable
+        if index.column() == COL_NULL:
+            return flags | Qt.ItemIsUserCheckable
+        return flags | Qt.ItemIsEditable
+
+    @staticmethod
+    def position_label(after):
+        if after == AFTER_FIRST:
+            return LABEL_FIRST
+        return LABEL_LAST if after is None else after
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        column = self._columns[index.row()]
+        col = index.column()
+
+        if col == COL_NULL:
+            if role == Qt.CheckStateRole:
+                return Qt.Checked if column['allow_null'] else Qt.Unchecked
+            return None
+        if role == Qt.DisplayRole:
+            value = column[_FIELDS[col]]
+            return self.position_label(value) if col == COL_AFTER else value
+        if role == Qt.EditRole:
+            return column[_FIELDS[col]]
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid():
+            return False
+        column = self._columns[index.row()]
+        col = index.column()
+
+        if col == COL_NULL:
+            if role != Qt.CheckStateRole:
+                return False
+            column['allow_null'] = value == Qt.Checked
+        elif role == Qt.EditRole:
+            column[_FIELDS[col]] = value if col == COL_AFTER else str(value or "").strip()
+        else:
+            return False
+        self.dataChanged.emit(index, index, [role])
+        return True
+
+    def set_columns(self, columns):
+        """Reemplaza todas las filas de una vez"""
+        self.beginResetModel()
+        self._columns = [dict(new_column(), **c) for c in columns]
+        self.endResetModel()
+
+    def add_columns(self, columns):
+        if not columns:
+            return
+        first = len(self._columns)
+        self.beginInsertRows(QModelIndex(), first, first + len(columns) - 1)
+        self._columns.extend(dict(new_column(), **c) for c in columns)
+        self.endInsertRows()
+
+    def remove_rows(self, rows):
+        # De abajo hacia arriba para que los índices sigan siendo válidos
+        for row in sorted(set(rows), reverse=True):
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self._columns[row]
+            self.endRemoveRows()
+
+    def clear(self):
+        self.set_columns([])
+
+    def columns(self):
+        return [dict(c) for c in self._columns]
+
+    def set_existing_columns(self, names):
+        self.existing_columns = list(names)
+
+
+class ComboDelegate(QStyledItemDelegate):
+    """Editor de lista desplegable creado solo mientras se edita la celda; options() da (texto, valor)"""
+
+    def __init__(self, options, parent=None):
+        super().__init__(parent)
+        self.options = options
+
+    def createEditor(self, parent, option, index):
+        editor = QComboBox(parent)
+        for label, value in self.options():
+            editor.addItem(label, value)
+        return editor
+
+    def setEditorData(self, editor, index):
+        value = index.data(Qt.EditRole)
+        for i in range(editor.count()):
+            if editor.itemData(i) == value:
+                editor.setCurrentIndex(i)
+                return
+        # Valor importado que no está en la lista (ej. un tipo poco común): se conserva
+        if value is not None:
+            editor.addItem(str(value), value)
+            editor.setCurrentIndex(editor.count() - 1)
+
+    def setModelData(self, editor, model, index):
+        model.setData(index, editor.currentData(), Qt.EditRole)
+
+
+def type_delegate(parent=None):
+    return ComboDelegate(lambda: [(t, t) for t in SQL_TYPES], parent)
+
+
+def position_delegate(model, parent=None):
+    """Posiciones posibles: al inicio, después de cada columna existente o al final"""
+    return ComboDelegate(lambda: ([(LABEL_FIRST, AFTER_FIRST)] + [(name, name) for name in model.existing_columns]
+                                  + [(LABEL_LAST, None)]), parent)
@@ -0,0 +1,137 @@
+import sys
+import math
+from array import array
+
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QSortFilterProxyModel
+
+from catalog import ColumnInfo
+
+HEADERS = ["Nombre", "Tipo", "Nulo", "Valor Pred.", "Posición"]
+COL_NAME, COL_TYPE, COL_NULL, COL_DEFAULT, COL_POSITION = range(len(HEADERS))
+
+
+def format_type(type_name, max_length, precision, scale):
+    """Tipo con parámetros como se escribe en T-SQL, ej. nvarchar(50) o decimal(18,2)"""
+    if type_name in ('varchar', 'char', 'varbinary', 'binary'):
+        return f"{type_name}({'max' if max_length == -1 else max_length})"
+    if type_name in ('nvarchar', 'nchar'):
+        return f"{type_name}({'max' if max_length == -1 else math.floor(max_length / 2)})"
+    if type_name in ('decimal', 'numeric'):
+        return f"{type_name}({precision},{scale})"
+    if type_name in ('datetime2', 'datetimeoffset', 'time'):
+        return f"{type_name}({scale})"
+    return type_name
+
+
+class ColumnArray:
+    """
+    Metadatos de columnas en arreglos paralelos: los números en array('i'/'b') y los
+    textos en listas (los nombres de tipo se comparten con sys.intern). Ocupa una
+    fracción de una fila de pyodbc o un QTableWidgetItem por celda.
+    """
+
+    def __init__(self, columns=()):
+        self.names = []
+        self.type_names = []
+        self.defaults = []
+        self.max_lengths = array('i')
+        self.precisions = array('i')
+        self.scales = array('i')
+        self.nullable = array('b')
+        self.column_ids = array('i')
+        for col in columns:
+            self.names.append(col.column_name)
+            self.type_names.append(sys.intern(col.type_name))
+            self.defaults.append(col.default_value or "")
+            self.max_lengths.append(col.max_length)
+            self.precisions.append(col.precision)
+            self.scales.append(col.scale)
+            self.nullable.append(1 if col.is_nullable else 0)
+            self.column_ids.append(col.column_id)
+
+    def __len__(self):
+        return len(self.names)
+
+    def type_string(self, row):
+        return format_type(self.type_names[row], self.max_lengths[row], self.precisions[row], self.scales[row])
+
+    def column(self, row):
+        return ColumnInfo(self.names[row], self.type_names[row], self.max_lengths[row], self.precisions[row],
+                          self.scales[row], bool(self.nullable[row]), self.defaults[row], self.column_ids[row])
+
+
+class ExistingColumnsModel(QAbstractTableModel):
+    """
+    Columnas de la tabla seleccionada (solo lectura). El texto de cada celda se arma
+    en data() cuando la vista la pinta, así que abrir una tabla con miles de columnas
+    solo copia los arreglos. Qt.UserRole da el valor crudo para ordenar.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.columns = ColumnArray()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.UserRole):
+            return None
+        row, col = index.row(), index.column()
+        columns = self.columns
+
+        if col == COL_NAME:
+            return columns.names[row]
+        if col == COL_TYPE:
+            return columns.type_string(row) if role == Qt.DisplayRole else columns.type_names[row]
+        if col == COL_NULL:
+            if role == Qt.UserRole:
+                return columns.nullable[row]
+            return "Sí" if columns.nullable[row] else "No"
+        if col == COL_DEFAULT:
+            return columns.defaults[row]
+        if col == COL_POSITION:
+            return str(columns.column_ids[row]) if role == Qt.DisplayRole else columns.column_ids[row]
+        return None
+
+    def set_columns(self, columns):
+        self.beginResetModel()
+        self.columns = ColumnArray(columns)
+        self.endResetModel()
+
+    def clear(self):
+        self.set_columns([])
+
+    def column(self, row):
+        return self.columns.column(row)
+
+    def type_string(self, row):
+        return self.columns.type_string(row)
+
+
+class ColumnFilterProxy(QSortFilterProxyModel):
+    """Orden por valor crudo y filtro por texto en el nombre o el tipo de la columna"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setSortRole(Qt.UserRole)
+        self.text = ""
+
+    def set_filter_text(self, text):
+        self.text = text.strip().lower()
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if not self.text:
+            return True
+        columns = self.sourceModel().columns
+        return (self.text in columns.names[source_row].lower()
+                or self.text in columns.type_string(source_row).lower())
@@ -0,0 +1,162 @@
+import io
+import csv
+import json
+import os
+
+try:
+    import yaml
+except ImportError:  # PyYAML es opcional: sin él solo se aceptan especificaciones JSON
+    yaml = None
+
+# Valores de 'after' con significado especial
+AFTER_FIRST = "-1"
+_FIRST_ALIASES = ("-1", "first", "inicio")
+_LAST_ALIASES = ("", "last", "final")
+
+# Columnas de las especificaciones CSV, en este orden al exportar
+CSV_FIELDS = ('name', 'type', 'params', 'allow_null', 'default', 'after', 'expression')
+
+_TRUE_VALUES = ("1", "true", "yes", "y", "si", "sí", "s", "x")
+_FALSE_VALUES = ("0", "false", "no", "n")
+
+
+class ColumnSpecError(Exception):
+    """La especificación de columnas no es válida"""
+
+
+def _parse_bool(value, name):
+    """allow_null puede venir como booleano, número o texto (CSV); vacío equivale a sí"""
+    if value is None or isinstance(value, bool):
+        return True if value is None else value
+    if isinstance(value, (int, float)):
+        return bool(value)
+    text = str(value).strip().lower()
+    if not text or text in _TRUE_VALUES:
+        return True
+    if text in _FALSE_VALUES:
+        return False
+    raise ColumnSpecError(f"Columna {name}: valor de 'allow_null' no reconocido: {value}")
+
+
+def normalize_column(data, index=0):
+    """Convierte una entrada de la especificación al diccionario que usa ColumnMigration"""
+    if not isinstance(data, dict):
+        raise ColumnSpecError(f"Columna {index + 1}: se esperaba un objeto")
+    name = str(data.get('name') or '').strip()
+    col_type = str(data.get('type') or '').strip()
+    if not name:
+        raise ColumnSpecError(f"Columna {index + 1}: falta 'name'")
+    if not col_type:
+        raise ColumnSpecError(f"Columna {name}: falta 'type'")
+
+    # 'type' puede traer los parámetros, ej. nvarchar(100)
+    params = data.get('params')
+    if params in (None, '') and '(' in col_type and col_type.endswith(')'):
+        col_type, params = col_type[:-1].split('(', 1)
+    params = '' if params is None else str(params)
+
+    after = data.get('after')
+    if after is not None:
+        after = str(after)
+        if after.lower() in _FIRST_ALIASES:
+            after = AFTER_FIRST
+        elif after.lower() in _LAST_ALIASES:
+            after = None
+
+    default = data.get('default')
+    # Expresión T-SQL sobre las demás columnas con la que se rellenan las filas existentes
+    expression = str(data.get('expression') or '').strip()
+    return {
+        'name': name,
+        'type': col_type.strip(),
+        'params': params.strip(),
+        'allow_null': _parse_bool(data.get('allow_null'), name),
+        'default': '' if default is None else str(default),
+        'after': after,
+        'expression': expression,
+    }
+
+
+def parse_column_spec(data):
+    """Acepta una lista de columnas o un objeto con la clave 'columns'"""
+    if isinstance(data, dict):
+        data = data.get('columns')
+    if not isinstance(data, list) or not data:
+        raise ColumnSpecError("La especificación debe contener una lista de columnas no vacía")
+
+    columns = [normalize_column(item, i) for i, item in enumerate(data)]
+    names = [c['name'].lower() for c in columns]
+    duplicates = sorted({n for n in names if names.count(n) > 1})
+    if duplicates:
+        raise ColumnSpecError(f"Columnas repetidas: {', '.join(duplicates)}")
+    return columns
+
+
+def _spec_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.yaml', '.yml'):
+        return 'yaml'
+    return 'csv' if extension == '.csv' else 'json'
+
+
+def load_column_spec(path):
+    """Lee una especificación JSON, YAML o CSV (según la extensión) desde un archivo"""
+    # utf-8-sig acepta también los CSV guardados con BOM por Excel
+    with open(path, encoding='utf-8-sig') as f:
+        text = f.read()
+
+    spec_format = _spec_format(path)
+    if spec_format == 'csv':
+        try:
+            reader = csv.DictReader(io.StringIO(text, newline=''))
+            if not reader.fieldnames or 'name' not in reader.fieldnames:
+                raise ColumnSpecError(f"El CSV {path} debe tener encabezado con al menos 'name' y 'type'")
+            data = [{k: v for k, v in row.items() if k} for row in reader]
+        except csv.Error as e:
+            raise ColumnSpecError(f"CSV inválido en {path}: {e}")
+    elif spec_format == 'yaml':
+        if yaml is None:
+            raise ColumnSpecError("Para leer especificaciones YAML instale PyYAML (pip install pyyaml)")
+        try:
+            data = yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise ColumnSpecError(f"YAML inválido en {path}: {e}")
+    else:
+        try:
+            data = json.loads(text)
+        except ValueError as e:
+            raise ColumnSpecError(f"JSON inválido en {path}: {e}")
+
+    return parse_column_spec(data)
+
+
+def _export_column(column):
+    after = column.get('after')
+    return {
+        'name': column['name'],
+        'type': column['type'],
+        'params': column.get('params') or '',
+        'allow_null': bool(column.get('allow_null', True)),
+        'default': column.get('default') or '',
+        'after': 'first' if after == AFTER_FIRST else after,
+        'expression': column.get('expression') or '',
+    }
+
+
+def dump_column_spec(columns, path):
+    """Guarda las columnas como JSON, YAML o CSV según la extensión; se pueden volver a leer con load_column_spec"""
+    data = [_export_column(c) for c in columns]
+    spec_format = _spec_format(path)
+    if spec_format == 'yaml' and yaml is None:
+        raise ColumnSpecError("Para guardar especificaciones YAML instale PyYAML (pip install pyyaml)")
+
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        if spec_format == 'csv':
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            for row in data:
+                writer.writerow(dict(row, after=row['after'] or ''))
+        elif spec_format == 'yaml':
+            yaml.safe_dump({'columns': data}, f, allow_unicode=True, sort_keys=False)
+        else:
+            json.dump({'columns': data}, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,37 @@
+def get_driver_specific_params(driver_name):
+    driver_name_lower = driver_name.lower()
+    
+    # Detección por patrones en el nombre del driver
+    if 'freetds' in driver_name_lower:
+        return {"TDS_Version": "8.0"}
+    elif 'odbc driver 13' in driver_name_lower:
+        return {"Encrypt": "yes", "TrustServerCertificate": "no"}
+    elif 'odbc driver' in driver_name_lower:
+        return {"Encrypt": "optional", "TrustServerCertificate": "no"}
+    elif 'native client' in driver_name_lower:
+        return { "TrustServerCertificate": "yes"}
+    elif 'msodbcsql17' in driver_name_lower:
+        return {"Encrypt": "optional"}
+    elif 'sql server' in driver_name_lower and not ('odbc driver' in driver_name_lower):
+        return {}  # Driver genérico (pocos parámetros extra)
+    else:
+        # Parámetros por defecto para drivers desconocidos (puedes ajustarlos)
+        return {"Encrypt": "optional"}
+
+
+def build_connection_string(server, database, auth_type, username=None, password=None):
+    """
+    Cadena de conexión ODBC. auth_type es "Windows" (autenticación integrada)
+    o el nombre del driver ODBC a usar con usuario y contraseña.
+    """
+    if auth_type == "Windows":
+        return f"DRIVER={{SQL Server}};SERVER={server};DATABASE={database};Trusted_Connection=yes;"
+
+    # Construye la cadena base
+    conn_str = f"DRIVER={{{auth_type}}};SERVER={server};DATABASE={database};UID={username};PWD={password};"
+
+    # Añade parámetros específicos detectados automáticamente
+    driver_params = get_driver_specific_params(auth_type)
+    for key, value in driver_params.items():
+        conn_str += f"{key}={value};"
+    return conn_str
@@ -0,0 +1,186 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+import pyodbc
+
+logger = logging.getLogger(__name__)
+
+# Sesiones separadas según el uso
+PURPOSE_METADATA = 'metadata'
+PURPOSE_DDL = 'ddl'
+PURPOSE_MONITOR = 'monitor'
+
+
+class PoolTimeout(Exception):
+    """No se liberó ninguna conexión a tiempo"""
+
+
+class PooledConnection:
+    """Conexión del pool con su SPID (para KILL) y el momento del último uso"""
+
+    def __init__(self, connection, spid):
+        self.connection = connection
+        self.spid = spid
+        self.last_used = time.monotonic()
+        self.purpose = None
+
+    def cursor(self):
+        return self.connection.cursor()
+
+
+class ConnectionPool:
+    """
+    Pool de conexiones para una cadena de conexión.
+    Al entregar una conexión que estuvo inactiva más de ping_after segundos se
+    comprueba con SELECT 1; si falla se reconecta con reintentos y espera creciente.
+    Al devolverla se deshace cualquier transacción abierta y se restablece la sesión.
+    """
+
+    def __init__(self, conn_str, max_size=8, ping_after=30.0, retries=3, backoff=0.5, timeout=60.0):
+        self.conn_str = conn_str
+        self.max_size = max_size
+        self.ping_after = ping_after
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._idle = []
+        self._in_use = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def _connect(self):
+        delay = self.backoff
+        for attempt in range(1, self.retries + 1):
+            try:
+                connection = pyodbc.connect(self.conn_str)
+                cursor = connection.cursor()
+                cursor.execute("SELECT @@SPID")
+                spid = cursor.fetchone()[0]
+                connection.commit()
+                return PooledConnection(connection, spid)
+            except pyodbc.Error as e:
+                if attempt == self.retries:
+                    raise
+                logger.warning(f"Conexión fallida (intento {attempt} de {self.retries}), reintentando en {delay:.1f}s: {str(e)}")
+                time.sleep(delay)
+                delay *= 2
+
+    def _healthy(self, pooled):
+        if time.monotonic() - pooled.last_used < self.ping_after:
+            return True
+        try:
+            cursor = pooled.connection.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            pooled.connection.commit()
+            return True
+        except pyodbc.Error as e:
+            logger.warning(f"Conexión del pool caída (SPID {pooled.spid}), reconectando: {str(e)}")
+            self._close(pooled)
+            return False
+
+    @staticmethod
+    def _close(pooled):
+        try:
+            pooled.connection.close()
+        except pyodbc.Error:
+            pass
+
+    def ensure_capacity(self, size):
+        """Amplía el máximo de conexiones (ej. para un lote con muchos hilos)"""
+        with self._condition:
+            if size > self.max_size:
+                self.max_size = size
+                self._condition.notify_all()
+
+    def acquire(self, purpose=PURPOSE_DDL):
+        deadline = time.monotonic() + self.timeout
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise pyodbc.InterfaceError("El pool de conexiones está cerrado")
+                if self._idle or self._in_use < self.max_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(f"No hay conexiones libres después de {self.timeout:.0f}s")
+                self._condition.wait(remaining)
+            pooled = self._idle.pop() if self._idle else None
+            self._in_use += 1
+
+        try:
+            if pooled is None or not self._healthy(pooled):
+                pooled = self._connect()
+        except Exception:
+            with self._condition:
+                self._in_use -= 1
+                self._condition.notify()
+            raise
+        pooled.purpose = purpose
+        return pooled
+
+    def release(self, pooled, discard=False):
+        if not discard:
+            try:
+                pooled.connection.rollback()
+                cursor = pooled.connection.cursor()
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL READ COMMITTED; SET LOCK_TIMEOUT -1")
+                pooled.connection.commit()
+            except pyodbc.Error:
+                discard = True
+
+        with self._condition:
+            self._in_use -= 1
+            if discard or self._closed:
+                self._close(pooled)
+            else:
+                pooled.last_used = time.monotonic()
+                pooled.purpose = None
+                self._idle.append(pooled)
+            self._condition.notify()
+
+    @contextmanager
+    def session(self, purpose=PURPOSE_DDL):
+        """Conexión prestada durante el bloque; se descarta si hubo un error de conexión"""
+        pooled = self.acquire(purpose)
+        discard = False
+        try:
+            yield pooled
+        except (pyodbc.OperationalError, pyodbc.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.release(pooled, discard)
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._condition.notify_all()
+        for pooled in idle:
+            self._close(pooled)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(conn_str, max_size=None):
+    """Pool compartido para la cadena de conexión; se crea la primera vez"""
+    with _pools_lock:
+        pool = _pools.get(conn_str)
+        if pool is None or pool._closed:
+            pool = ConnectionPool(conn_str)
+            _pools[conn_str] = pool
+    if max_size:
+        pool.ensure_capacity(max_size)
+    return pool
+
+
+def close_pool(conn_str):
+    with _pools_lock:
+        pool = _pools.pop(conn_str, None)
+    if pool:
+        pool.close()
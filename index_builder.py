@@ -0,0 +1,142 @@
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import pyodbc
+
+from connection_pool import PURPOSE_DDL, get_pool
+from pacing import NULL_PACING
+from telemetry import NULL_TELEMETRY
+
+# SERVERPROPERTY('EngineEdition') con CREATE INDEX ... WITH (ONLINE = ON)
+ONLINE_INDEX_EDITIONS = (3, 5, 8)
+
+# 2725: columna LOB/FILESTREAM en el índice, 1712: edición sin operaciones en línea
+_ONLINE_NOT_SUPPORTED = ('2725', '1712')
+
+
+class IndexBuilder:
+    """
+    Crea los índices de una tabla recién cargada: primero el clúster y después los
+    no clúster con MAXDOP, SORT_IN_TEMPDB y ONLINE = ON si la edición lo permite.
+    Fuera de una transacción los no clúster se reparten en workers sesiones del pool
+    (son independientes entre sí una vez creado el clúster) y cada índice se confirma
+    por separado; los que ya existen se omiten, así que una ejecución interrumpida
+    puede reanudarse. Cada índice emite un evento 'index' con su duración; fuera de
+    una transacción pacing puede demorar el próximo índice si las réplicas se atrasan.
+    """
+
+    def __init__(self, conn_str=None, workers=1, maxdop=0, sort_in_tempdb=True, online=True):
+        self.conn_str = conn_str
+        self.workers = max(1, workers)
+        self.maxdop = maxdop
+        self.sort_in_tempdb = sort_in_tempdb
+        self.online = online
+
+    def options(self, online):
+        options = []
+        if self.maxdop:
+            options.append(f"MAXDOP = {int(self.maxdop)}")
+        if self.sort_in_tempdb:
+            options.append("SORT_IN_TEMPDB = ON")
+        if online:
+            options.append("ONLINE = ON")
+        return options
+
+    @staticmethod
+    def _existing(cursor, schema, table):
+        cursor.execute("SELECT name FROM sys.indexes WHERE object_id = OBJECT_ID(?) AND name IS NOT NULL",
+                       f"[{schema}].[{table}]")
+        return {row.name for row in cursor.fetchall()}
+
+    def _create(self, connection, cursor, schema, table, index, online, commit, log, telemetry):
+        start = time.monotonic()
+        try:
+            cursor.execute(index.create_sql(schema, table, self.options(online)))
+        except pyodbc.Error as e:
+            if not online or not any(code in str(e) for code in _ONLINE_NOT_SUPPORTED):
+                raise
+            log(f"El índice {index.name} no admite ONLINE = ON, se crea sin conexión", level=logging.WARNING)
+            connection.rollback()
+            online = False
+            cursor.execute(index.create_sql(schema, table, self.options(online)))
+        if commit:
+            connection.commit()
+
+        timing = {'index': index.name, 'clustered': index.is_clustered, 'online': online,
+                  'seconds': round(time.monotonic() - start, 3)}
+        log(f"Índice {index.name} creado en {timing['seconds']:.1f}s")
+        telemetry.emit(dict(timing, event='index'))
+        return timing
+
+    def build(self, connection, schema, table, indexes, engine_edition=None, in_transaction=True,
+              allow_online=True, log=None, cancel=None, telemetry=None, pacing=None):
+        """
+        Crea los índices en [schema].[table]; devuelve la duración de cada uno.
+        Dentro de una transacción todo va en la sesión actual y sin ONLINE (la tabla
+        ya está bloqueada); allow_online=False para tablas que nadie más usa.
+        """
+        log = log or (lambda message, level=logging.INFO: logging.log(level, message))
+        telemetry = telemetry or NULL_TELEMETRY
+        # Dentro de una transacción no se puede esperar: la medición confirmaría la transacción
+        pacing = NULL_PACING if in_transaction or pacing is None else pacing
+        cursor = connection.cursor()
+        if cancel:
+            cancel.track(cursor)
+
+        existing = self._existing(cursor, schema, table)
+        pending = [i for i in indexes if i.name not in existing]
+        for index in indexes:
+            if index.name in existing:
+                log(f"El índice {index.name} ya existe, se omite")
+        online = (self.online and allow_online and not in_transaction
+                  and engine_edition in ONLINE_INDEX_EDITIONS)
+
+        # El clúster primero: los no clúster se construyen sobre él y no hay que rehacerlos
+        clustered = [i for i in pending if i.is_clustered]
+        nonclustered = [i for i in pending if not i.is_clustered]
+        parallel = not in_transaction and self.conn_str and self.workers > 1 and len(nonclustered) > 1
+        serial = clustered if parallel else clustered + nonclustered
+
+        timings = []
+        for index in serial:
+            if cancel:
+                cancel.check()
+            pacing.wait(cancel)
+            timings.append(self._create(connection, cursor, schema, table, index, online,
+                                        not in_transaction, log, telemetry))
+        if not parallel:
+            return timings
+
+        workers = min(self.workers, len(nonclustered))
+        log(f"Creando {len(nonclustered)} índices no clúster en {workers} sesiones en paralelo...")
+        # La sesión de la migración y las de seguimiento (esperas, avance, bloqueos) siguen ocupadas
+        pool = get_pool(self.conn_str, max_size=workers + 4)
+
+        def create(index):
+            if cancel:
+                cancel.check()
+            pacing.wait(cancel)
+            with pool.session(PURPOSE_DDL) as pooled:
+                index_cursor = pooled.cursor()
+                if cancel:
+                    cancel.track(index_cursor)
+                # Los bloqueos que cause esta sesión también cuentan para el ritmo
+                pacing.watch(pooled.spid)
+                try:
+                    return self._create(pooled.connection, index_cursor, schema, table, index, online,
+                                        True, log, telemetry)
+                finally:
+                    pacing.unwatch(pooled.spid)
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="index") as executor:
+            futures = [executor.submit(create, index) for index in nonclustered]
+        # Se esperan todos antes de propagar el primer error: los índices creados quedan
+        errors = [f.exception() for f in futures if f.exception()]
+        timings.extend(f.result() for f in futures if not f.exception())
+        if errors:
+            raise errors[0]
+        return timings
+
+
+SERIAL_INDEX_BUILDER = IndexBuilder()
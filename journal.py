@@ -0,0 +1,186 @@
+import json
+import uuid
+import logging
+
+from batch_copy import _object_name, decode_key, encode_key
+
+# Tablas de control con las ejecuciones y los pasos completados de cada una
+JOURNAL_TABLE = "[dbo].[ColumnAdder_Journal]"
+JOURNAL_STEP_TABLE = "[dbo].[ColumnAdder_JournalStep]"
+
+RUN_RUNNING = 'running'
+RUN_DONE = 'done'
+RUN_ABANDONED = 'abandoned'
+
+
+def ensure_journal_tables(cursor):
+    """Crea las tablas del diario si no existen"""
+    cursor.execute(f"""
+        IF OBJECT_ID('{JOURNAL_TABLE}') IS NULL
+            CREATE TABLE {JOURNAL_TABLE} (
+                run_id CHAR(12) NOT NULL PRIMARY KEY,
+                table_name NVARCHAR(512) NOT NULL,
+                mode NVARCHAR(20) NOT NULL,
+                batch_size INT NOT NULL DEFAULT 0,
+                column_spec NVARCHAR(MAX) NOT NULL,
+                status NVARCHAR(20) NOT NULL,
+                started_at DATETIME2 NOT NULL DEFAULT SYSDATETIME(),
+                finished_at DATETIME2 NULL
+            );
+
+        IF OBJECT_ID('{JOURNAL_STEP_TABLE}') IS NULL
+            CREATE TABLE {JOURNAL_STEP_TABLE} (
+                run_id CHAR(12) NOT NULL,
+                step NVARCHAR(50) NOT NULL,
+                rows_done BIGINT NULL,
+                high_water NVARCHAR(MAX) NULL,
+                recorded_at DATETIME2 NOT NULL DEFAULT SYSDATETIME(),
+                CONSTRAINT [PK_ColumnAdder_JournalStep] PRIMARY KEY (run_id, step)
+            );
+    """)
+
+
+def get_pending_tables(cursor):
+    """Tablas ([esquema].[tabla]) con una migración interrumpida que puede reanudarse"""
+    cursor.execute(f"""
+        IF OBJECT_ID('{JOURNAL_TABLE}') IS NOT NULL AND OBJECT_ID('{JOURNAL_STEP_TABLE}') IS NOT NULL
+            SELECT DISTINCT j.table_name FROM {JOURNAL_TABLE} j
+            WHERE j.status = ? AND EXISTS (SELECT 1 FROM {JOURNAL_STEP_TABLE} s WHERE s.run_id = j.run_id)
+        ELSE
+            SELECT TOP (0) CAST(NULL AS NVARCHAR(512)) AS table_name
+    """, RUN_RUNNING)
+    return {row.table_name for row in cursor.fetchall()}
+
+
+class MigrationJournal:
+    """
+    Diario persistente de una migración en la base de destino: qué pasos terminaron
+    y hasta dónde llegó cada etapa incremental (high_water), para que una ejecución
+    interrumpida (caída del proceso o de la conexión) continúe donde quedó.
+    Las marcas de cada lote de la copia siguen en la tabla de checkpoints, en la
+    misma transacción que el lote. record(..., commit=False) deja la escritura
+    dentro de la transacción en curso, de modo que el paso y su efecto se confirman juntos.
+    """
+
+    def __init__(self, connection, schema, table, log=None):
+        self.connection = connection
+        self.schema = schema
+        self.table = table
+        self.log = log or (lambda message, level=logging.INFO: logging.log(level, message))
+        self.run_id = None
+        self.steps = {}
+
+    @property
+    def table_name(self):
+        return _object_name((self.schema, self.table))
+
+    def find_pending(self):
+        """
+        Última ejecución sin terminar de la tabla con algún paso confirmado, o None.
+        Las que no confirmaron ningún paso (ej. una reconstrucción en una transacción
+        que se deshizo) no dejaron cambios: se marcan abandonadas.
+        """
+        cursor = self.connection.cursor()
+        ensure_journal_tables(cursor)
+        cursor.execute(f"""
+            SELECT j.run_id, j.mode, j.batch_size, j.column_spec,
+                   (SELECT COUNT(*) FROM {JOURNAL_STEP_TABLE} s WHERE s.run_id = j.run_id) AS steps
+            FROM {JOURNAL_TABLE} j
+            WHERE j.table_name = ? AND j.status = ?
+            ORDER BY j.started_at DESC
+        """, self.table_name, RUN_RUNNING)
+        rows = cursor.fetchall()
+
+        pending = None
+        for row in rows:
+            if row.steps and pending is None:
+                pending = {'run_id': row.run_id, 'mode': row.mode, 'batch_size': row.batch_size,
+                           'columns': json.loads(row.column_spec)}
+                continue
+            cursor.execute(f"UPDATE {JOURNAL_TABLE} SET status = ?, finished_at = SYSDATETIME() WHERE run_id = ?",
+                           RUN_ABANDONED, row.run_id)
+        self.connection.commit()
+        return pending
+
+    def start(self, mode, columns, batch_size=0):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.steps = {}
+        cursor = self.connection.cursor()
+        ensure_journal_tables(cursor)
+        cursor.execute(f"""
+            INSERT INTO {JOURNAL_TABLE} (run_id, table_name, mode, batch_size, column_spec, status)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, self.run_id, self.table_name, mode, batch_size or 0, json.dumps(columns), RUN_RUNNING)
+        self.connection.commit()
+        return self.run_id
+
+    def resume(self, pending):
+        """Continúa una ejecución pendiente cargando sus pasos confirmados"""
+        self.run_id = pending['run_id']
+        cursor = self.connection.cursor()
+        cursor.execute(f"SELECT step, rows_done, high_water FROM {JOURNAL_STEP_TABLE} WHERE run_id = ?", self.run_id)
+        self.steps = {row.step: {'rows': row.rows_done, 'high_water': decode_key(row.high_water)}
+                      for row in cursor.fetchall()}
+        self.connection.commit()
+        self.log(f"Pasos ya completados: {', '.join(self.steps) or 'ninguno'}")
+
+    def done(self, step):
+        return step in self.steps
+
+    def rows(self, step):
+        return self.steps.get(step, {}).get('rows')
+
+    def high_water(self, step):
+        return self.steps.get(step, {}).get('high_water')
+
+    def record(self, step, rows=None, high_water=None, commit=True):
+        """Registra un paso completado o actualiza su marca de avance"""
+        if self.run_id is None:
+            return
+        cursor = self.connection.cursor()
+        cursor.execute(f"""
+            UPDATE {JOURNAL_STEP_TABLE}
+            SET rows_done = ?, high_water = ?, recorded_at = SYSDATETIME()
+            WHERE run_id = ? AND step = ?;
+
+            IF @@ROWCOUNT = 0
+                INSERT INTO {JOURNAL_STEP_TABLE} (run_id, step, rows_done, high_water)
+                VALUES (?, ?, ?, ?);
+        """, rows, encode_key(high_water), self.run_id, step,
+             self.run_id, step, rows, encode_key(high_water))
+        if commit:
+            self.connection.commit()
+        self.steps[step] = {'rows': rows, 'high_water': high_water}
+
+    def finish(self, commit=True):
+        if self.run_id is None:
+            return
+        cursor = self.connection.cursor()
+        cursor.execute(f"UPDATE {JOURNAL_TABLE} SET status = ?, finished_at = SYSDATETIME() WHERE run_id = ?",
+                       RUN_DONE, self.run_id)
+        if commit:
+            self.connection.commit()
+
+
+class NullJournal:
+    """Sin diario: ningún paso se considera hecho"""
+
+    run_id = None
+
+    def done(self, step):
+        return False
+
+    def rows(self, step):
+        return None
+
+    def high_water(self, step):
+        return None
+
+    def record(self, step, rows=None, high_water=None, commit=True):
+        pass
+
+    def finish(self, commit=True):
+        pass
+
+
+NULL_JOURNAL = NullJournal()
@@ -0,0 +1,98 @@
+import os
+import json
+import time
+import queue
+import logging
+import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_FILE = 'sql_column_adder.log'
+AUDIT_FILE = 'sql_column_adder_audit.jsonl'
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Cada archivo rota al superar este tamaño o al cumplir el intervalo, lo que ocurra primero
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 10
+DEFAULT_ROTATE_SECONDS = 24 * 60 * 60
+
+# Campos de auditoría que se pasan en extra= (ej. los eventos de telemetry)
+AUDIT_FIELDS = ('migration_id', 'table', 'phase', 'duration', 'rows')
+
+
+class RotatingLogHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler que además rota cada interval segundos (contados desde la
+    última escritura del archivo al abrirlo). Los respaldos son archivo.1 ... archivo.N,
+    así que rotar por tamaño y por tiempo en el mismo período nunca pisa un respaldo.
+    """
+
+    def __init__(self, filename, max_bytes=DEFAULT_MAX_BYTES, backup_count=DEFAULT_BACKUP_COUNT,
+                 interval=DEFAULT_ROTATE_SECONDS, clock=time.time):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8', delay=True)
+        self.interval = interval
+        self.clock = clock
+        started = os.path.getmtime(filename) if os.path.exists(filename) else clock()
+        self.rollover_at = started + interval if interval else None
+
+    def shouldRollover(self, record):
+        if self.rollover_at is not None and self.clock() >= self.rollover_at:
+            if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0:
+                return True
+            self.rollover_at = self.clock() + self.interval
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        if self.interval:
+            self.rollover_at = self.clock() + self.interval
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Un objeto JSON por línea con la hora, el nivel, el mensaje y los campos de auditoría"""
+
+    def format(self, record):
+        entry = {
+            'timestamp': datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+        }
+        for field in AUDIT_FIELDS:
+            entry[field] = getattr(record, field, None)
+        entry['message'] = record.getMessage()
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class AuditFilter(logging.Filter):
+    """Solo los registros de una migración (con migration_id) van a la auditoría"""
+
+    def filter(self, record):
+        return getattr(record, 'migration_id', None) is not None
+
+
+def start_logging(log_file=LOG_FILE, audit_file=AUDIT_FILE, level=logging.INFO, handlers=(),
+                  max_bytes=DEFAULT_MAX_BYTES, backup_count=DEFAULT_BACKUP_COUNT, interval=DEFAULT_ROTATE_SECONDS):
+    """
+    Deja en el logger raíz un solo QueueHandler: quien registra solo encola el registro
+    y un QueueListener lo escribe desde su hilo en el log de texto, en la auditoría JSON
+    y en los handlers adicionales (ej. el panel de la interfaz). Devuelve el listener,
+    que hay que detener (stop) al salir para vaciar la cola.
+    """
+    text_handler = RotatingLogHandler(log_file, max_bytes, backup_count, interval)
+    text_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    audit_handler = RotatingLogHandler(audit_file, max_bytes, backup_count, interval)
+    audit_handler.setFormatter(JsonLinesFormatter())
+    audit_handler.addFilter(AuditFilter())
+
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, text_handler, audit_handler, *handlers, respect_handler_level=True)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(level)
+    listener.start()
+    return listener
@@ -0,0 +1,185 @@
+import os
+import re
+import logging
+import threading
+from collections import deque, namedtuple
+
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, QObject, QSortFilterProxyModel, pyqtSignal
+from PyQt5 import QtGui
+
+# Registros que se conservan en memoria; los más viejos se descartan
+DEFAULT_CAPACITY = 10000
+# Líneas del archivo de log que se muestran al abrir la aplicación
+DEFAULT_TAIL_LINES = 500
+
+_TAIL_BLOCK_SIZE = 64 * 1024
+
+LogEntry = namedtuple('LogEntry', ['level', 'table', 'text'])
+
+# Los mensajes de una tabla del lote llevan el prefijo "[esquema.tabla] "
+_TABLE_PREFIX = re.compile(r'\[([^\[\]\s]+\.[^\[\]\s]+)\] ')
+# Formato del archivo: "fecha hora - NIVEL - mensaje"
+_FILE_LINE = re.compile(r'^\S+ \S+ - ([A-Z]+) - (.*)$')
+
+_LEVEL_COLORS = {logging.WARNING: QtGui.QColor(176, 112, 0), logging.ERROR: QtGui.QColor(192, 0, 0),
+                 logging.CRITICAL: QtGui.QColor(192, 0, 0)}
+
+
+def table_of(message):
+    """Tabla "esquema.tabla" del prefijo del mensaje, o None"""
+    match = _TABLE_PREFIX.search(message)
+    return match.group(1) if match else None
+
+
+def tail_lines(path, count=DEFAULT_TAIL_LINES, block_size=_TAIL_BLOCK_SIZE):
+    """Últimas count líneas del archivo, leyendo bloques desde el final"""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b''
+        while position > 0 and data.count(b'\n') <= count:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+    return data.decode('utf-8', errors='replace').splitlines()[-count:]
+
+
+def entries_from_lines(lines):
+    """Entradas de líneas del archivo; las de continuación (trazas) heredan el nivel anterior"""
+    entries = []
+    level = logging.INFO
+    for line in lines:
+        match = _FILE_LINE.match(line)
+        if match:
+            parsed = logging.getLevelName(match.group(1))
+            level = parsed if isinstance(parsed, int) else logging.INFO
+        entries.append(LogEntry(level, table_of(line), line))
+    return entries
+
+
+class LogBufferModel(QAbstractListModel):
+    """
+    Últimos capacity registros en un búfer circular: agregar es O(1) y, lleno, cada
+    registro nuevo descarta el más viejo. Se agrega por lotes (append_entries) para
+    que la vista procese una inserción por lote y no una por registro.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, parent=None):
+        super().__init__(parent)
+        self.capacity = capacity
+        self.items = [None] * capacity
+        self.start = 0
+        self.count = 0
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.count
+
+    def entry(self, row):
+        return self.items[(self.start + row) % self.capacity]
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        entry = self.entry(index.row())
+        if role == Qt.DisplayRole:
+            return entry.text
+        if role == Qt.ForegroundRole:
+            return _LEVEL_COLORS.get(entry.level)
+        return None
+
+    def append_entries(self, entries):
+        entries = list(entries)[-self.capacity:]
+        if not entries:
+            return
+        overflow = min(self.count, self.count + len(entries) - self.capacity)
+        if overflow > 0:
+            self.beginRemoveRows(QModelIndex(), 0, overflow - 1)
+            for _ in range(overflow):
+                self.items[self.start] = None
+                self.start = (self.start + 1) % self.capacity
+            self.count -= overflow
+            self.endRemoveRows()
+
+        self.beginInsertRows(QModelIndex(), self.count, self.count + len(entries) - 1)
+        for entry in entries:
+            self.items[(self.start + self.count) % self.capacity] = entry
+            self.count += 1
+        self.endInsertRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self.items = [None] * self.capacity
+        self.start = 0
+        self.count = 0
+        self.endResetModel()
+
+
+class LogFilterProxy(QSortFilterProxyModel):
+    """Filtra por nivel mínimo y por texto en el nombre de la tabla (sin distinguir mayúsculas)"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.min_level = logging.NOTSET
+        self.table_text = ""
+
+    def set_min_level(self, level):
+        self.min_level = level
+        self.invalidateFilter()
+
+    def set_table_text(self, text):
+        self.table_text = text.strip().lower()
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        entry = self.sourceModel().entry(source_row)
+        if entry.level < self.min_level:
+            return False
+        return not self.table_text or (entry.table is not None and self.table_text in entry.table.lower())
+
+
+class LogBridge(QObject):
+    """
+    Lleva los registros de cualquier hilo al modelo. push() solo encola bajo un lock;
+    el primer registro de un lote emite una señal encolada y flush() agrega en el hilo
+    de la interfaz todo lo acumulado hasta ese momento. Si la interfaz se atrasa, la
+    cola descarta los más viejos igual que el búfer.
+    """
+
+    pending_ready = pyqtSignal()
+
+    def __init__(self, model, parent=None):
+        super().__init__(parent)
+        self.model = model
+        self.lock = threading.Lock()
+        self.pending = deque(maxlen=model.capacity)
+        self.pending_ready.connect(self.flush, Qt.QueuedConnection)
+
+    def push(self, entry):
+        with self.lock:
+            self.pending.append(entry)
+            first = len(self.pending) == 1
+        if first:
+            self.pending_ready.emit()
+
+    def flush(self):
+        with self.lock:
+            entries = list(self.pending)
+            self.pending.clear()
+        self.model.append_entries(entries)
+
+
+class LogBridgeHandler(logging.Handler):
+    """Handler de logging que envía cada registro al panel por el LogBridge"""
+
+    def __init__(self, bridge):
+        super().__init__()
+        self.bridge = bridge
+
+    def emit(self, record):
+        try:
+            text = self.format(record)
+            table = getattr(record, 'table', None) or table_of(record.getMessage())
+            self.bridge.push(LogEntry(record.levelno, table, text))
+        except Exception:
+            self.handleError(record)
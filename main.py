@@ -3,22 +3,36 @@ import os
 import platform
 import pyodbc
 import logging
-from collections import deque
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                              QLabel, QLineEdit, QPushButton, QComboBox, QCheckBox,
-                             QTabWidget, QTextEdit, QMessageBox, QGroupBox, QTableWidget,
+                             QTabWidget, QListView, QMessageBox, QGroupBox, QTableWidget,
                              QTableWidgetItem, QHeaderView, QAction, QMenu, QDialog,
                              QDialogButtonBox, QInputDialog, QFormLayout, QAbstractItemView,
-                             QSplitter)
-from PyQt5.QtCore import (Qt)
-from PyQt5 import QtGui
-import math
-import argparse
-
-parser = argparse.ArgumentParser(
-    description='SQL Column Adder - v1.0',
-    epilog='Desarrollado por Ivan Gulfo (ivansicol@gmail.com)'
-)
+                             QSplitter, QSpinBox, QTableView, QFileDialog, QListWidget, QListWidgetItem)
+from PyQt5.QtCore import (Qt, QTimer, pyqtSignal)
+from batch_migration import (BatchMigration, select_tables, STATUS_PENDING, STATUS_RUNNING, STATUS_DONE,
+                             STATUS_SKIPPED, STATUS_FAILED, STATUS_CANCELLED)
+from catalog import CatalogCache
+from catalog_snapshot import CatalogSnapshot
+from column_grid import ColumnFilterProxy, ExistingColumnsModel
+from column_editor import COL_AFTER, COL_TYPE, ColumnSpecModel, new_column, position_delegate, type_delegate
+from column_spec import ColumnSpecError, dump_column_spec, load_column_spec
+from connection_config import build_connection_string
+from connection_pool import PURPOSE_DDL, PURPOSE_METADATA, close_pool, get_pool
+from index_builder import IndexBuilder
+from log_files import LOG_FILE, LOG_FORMAT, start_logging
+from log_view import (LogBridge, LogBridgeHandler, LogBufferModel, LogEntry, LogFilterProxy, entries_from_lines,
+                      tail_lines)
+from partition_copy import PartitionCopier
+from cancellation import MigrationCancelled
+from migration import ColumnMigration
+from planner import format_estimate
+from pacing import PacingController, SqlMetricsSource
+from progress import ProgressMonitor, format_progress
+from search_index import SearchIndex, describe_result
+from telemetry import MigrationTelemetry
+from type_change import STRATEGY_MANUAL, format_type_change
+from workers import JobRunner
 
 class SQLServerColumnAdder(QMainWindow):
     def __init__(self):
@@ -26,12 +40,27 @@ class SQLServerColumnAdder(QMainWindow):
         self.setWindowTitle("SQL Server Column Adder")
         self.setGeometry(100, 100, 900, 700)
         
-        # Configuración de logging
-        logging.basicConfig(filename='sql_column_adder.log', level=logging.INFO,
-                            format='%(asctime)s - %(levelname)s - %(message)s', encoding='utf-8')
-        
-        self.connection = None
+        self.pool = None
+        self.conn_str = None
+        # Todas las consultas a la base de datos corren en segundo plano: los cambios
+        # de esquema en una cola y las lecturas del catálogo en otra, cada una con su sesión
+        self.jobs = JobRunner(self)
+        self.metadata_jobs = JobRunner(self)
+        # Caché de esquemas/tablas/columnas de la conexión actual y su copia local por servidor/base
+        self.catalog = CatalogCache()
+        # Se usa también desde los trabajadores: registra solo en el archivo de log
+        self.snapshot = CatalogSnapshot()
+        self.snapshot_key = None
+        # Búsqueda de tablas y columnas de todos los esquemas, construida desde la caché
+        self.search_index = SearchIndex()
         self.setup_ui()
+        self.jobs.busy_changed.connect(self.on_jobs_busy_changed)
+        self.metadata_jobs.busy_changed.connect(self.on_jobs_busy_changed)
+
+        # Detección periódica de cambios externos en el catálogo
+        self.catalog_timer = QTimer(self)
+        self.catalog_timer.setInterval(30000)
+        self.catalog_timer.timeout.connect(self.poll_catalog)
         
     def setup_ui(self):
         # Widget central y layout principal
@@ -56,69 +85,91 @@ class SQLServerColumnAdder(QMainWindow):
         
         # Barra de estado
         self.statusBar().showMessage("Listo")
+        self.cancel_button = QPushButton("⏹ Cancelar")
+        self.cancel_button.setEnabled(False)
+        self.cancel_button.clicked.connect(self.cancel_jobs)
+        self.statusBar().addPermanentWidget(self.cancel_button)
         
         #Cargar log al inicio
         self.setup_logging()
         
     def setup_logging(self):
-        """Configura el sistema de logging para escribir en archivo y en la UI"""
-        log_file = 'sql_column_adder.log'
-        
-        # Crear logger
+        """Configura el sistema de logging para escribir en archivo y en el panel de registro"""
         self.logger = logging.getLogger('SQLColumnAdder')
-        self.logger.setLevel(logging.INFO)
-        
-        # Formato
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-        
-        # Handler para archivo
-        file_handler = logging.FileHandler(log_file)
-        file_handler.setFormatter(formatter)
-        
-        # Handler para la UI
-        class QTextEditLogger(logging.Handler):
-            def __init__(self, widget):
-                super().__init__()
-                self.widget = widget
-            
-            def emit(self, record):
-                msg = self.format(record)
-                self.widget.append(msg)
-                # Auto-scroll
-                self.widget.moveCursor(QtGui.QTextCursor.End)
-        
-        ui_handler = QTextEditLogger(self.log_output)
-        ui_handler.setFormatter(formatter)
-        
-        # Agregar handlers
-        self.logger.addHandler(file_handler)
-        self.logger.addHandler(ui_handler)
-        
-        # Cargar log existente
+
+        # Cargar log existente antes de que el listener empiece a escribir
         self.load_initial_log()
+
+        # Handler para el panel: los registros llegan al hilo de la UI en lotes por una señal encolada
+        self.log_bridge = LogBridge(self.log_model, self)
+        ui_handler = LogBridgeHandler(self.log_bridge)
+        ui_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+        # Log de texto y auditoría JSON rotativos, escritos desde el hilo del listener:
+        # registrar solo encola, sin E/S en el hilo que llama
+        self.log_listener = start_logging(handlers=[ui_handler])
+        QApplication.instance().aboutToQuit.connect(self.log_listener.stop)
         
     def load_initial_log(self):
         """Carga el historial del log al iniciar"""
-        log_file = 'sql_column_adder.log'
         try:
-            if os.path.exists(log_file):
-                with open(log_file, 'r', encoding='utf-8') as f:
-                    # Leer las últimas 500 líneas para no sobrecargar la UI
-                    lines = deque(f, maxlen=500)
-                    self.log_output.setPlainText(''.join(lines)+'============================== LOG ANTIGUO CARGADO =============================')
-                    self.log_output.moveCursor(QtGui.QTextCursor.End)
+            if os.path.exists(LOG_FILE):
+                # Solo las últimas líneas, leídas desde el final del archivo
+                entries = entries_from_lines(tail_lines(LOG_FILE))
+                entries.append(LogEntry(logging.INFO, None, '============================== LOG ANTIGUO CARGADO ============================='))
+                self.log_model.append_entries(entries)
+                self.log_output.scrollToBottom()
         except Exception as e:
             self.logger.error(f"Error al cargar log inicial: {str(e)}")
     
     def log(self, message, level=logging.INFO):
-        """Registra un mensaje en el log y en la interfaz"""
+        """Registra un mensaje en el log; el panel de registro lo recibe por su handler"""
         logging.log(level, message)
-        self.log_output.append(f"[{level}] {message}")
         
         # Mostrar mensajes importantes en la barra de estado
         if level >= logging.WARNING:
             self.statusBar().showMessage(message, 5000)
     
+    def on_jobs_busy_changed(self, busy):
+        self.cancel_button.setEnabled(self.jobs.busy or self.metadata_jobs.busy)
+
+    def cancel_jobs(self):
+        """Cancela la operación en curso (SQLCancel y, si no responde, KILL de la sesión)"""
+        self.log("Cancelando operación en curso...", level=logging.WARNING)
+        self.jobs.cancel_all()
+        self.metadata_jobs.cancel_all()
+
+    def run_db_job(self, fn, on_finished=None, error_title="Error", error_message="Error", purpose=PURPOSE_DDL):
+        """
+        Ejecuta fn(job) en segundo plano con una sesión del pool en job.connection;
+        purpose=None no reserva sesión (el trabajo abre las suyas).
+        Los errores se muestran y registran en el hilo de la UI
+        """
+        def on_failed(e):
+            if isinstance(e, MigrationCancelled):
+                self.log(str(e), level=logging.WARNING)
+                return
+            QMessageBox.critical(self, error_title, f"{error_message}: {str(e)}")
+            self.log(f"{error_message}: {str(e)}", level=logging.ERROR)
+
+        pool = self.pool
+
+        def work(job):
+            if purpose is None:
+                return fn(job)
+            with pool.session(purpose) as pooled:
+                job.connection = pooled.connection
+                job.kill_target = (pool.conn_str, pooled.spid)
+                try:
+                    return fn(job)
+                finally:
+                    job.kill_target = None
+                    job.connection = None
+
+        runner = self.metadata_jobs if purpose == PURPOSE_METADATA else self.jobs
+        return runner.submit(work, on_finished=on_finished, on_failed=on_failed, on_progress=self.log,
+                             on_status=self.statusBar().showMessage)
+
     def setup_about_dialog(self):
         about_action = QAction('Acerca de', self)
         about_action.triggered.connect(self.show_about)
@@ -204,21 +255,40 @@ class SQLServerColumnAdder(QMainWindow):
         schema_layout = QHBoxLayout()
         schema_layout.addWidget(QLabel("Esquema:"))
         self.schema_combo = QComboBox()
+        self.schema_combo.currentTextChanged.connect(self.refresh_tables)
         schema_layout.addWidget(self.schema_combo)
         
         # Tabla
         table_select_layout = QHBoxLayout()
         table_select_layout.addWidget(QLabel("Tabla:"))
         self.table_combo = QComboBox()
+        self.table_combo.currentTextChanged.connect(self.load_table_columns)
         table_select_layout.addWidget(self.table_combo)
         
         # Botón para refrescar tablas
         refresh_button = QPushButton("Refrescar Tablas")
-        refresh_button.clicked.connect(self.refresh_tables)
+        refresh_button.clicked.connect(lambda: self.poll_catalog(force=True))
         table_select_layout.addWidget(refresh_button)
         
+        # Búsqueda en todos los esquemas mientras se escribe
+        search_layout = QHBoxLayout()
+        search_layout.addWidget(QLabel("Buscar:"))
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Tabla o columna en todos los esquemas (ej. cliente, ventas.ped, Pedido.fecha)...")
+        self.search_input.setClearButtonEnabled(True)
+        self.search_input.textChanged.connect(self.search_catalog)
+        search_layout.addWidget(self.search_input)
+
+        self.search_results = QListWidget()
+        self.search_results.setMaximumHeight(200)
+        self.search_results.setVisible(False)
+        self.search_results.itemActivated.connect(self.open_search_result)
+        self.search_results.itemClicked.connect(self.open_search_result)
+
         table_layout.addLayout(schema_layout)
         table_layout.addLayout(table_select_layout)
+        table_layout.addLayout(search_layout)
+        table_layout.addWidget(self.search_results)
         table_group.setLayout(table_layout)
         
         # Agregar grupos a la pestaña
@@ -244,12 +314,28 @@ class SQLServerColumnAdder(QMainWindow):
         self.table_title_label.setStyleSheet("font-weight: bold; font-size: 12px;")
         columns_layout.addWidget(self.table_title_label)
         
-        # Tabla de columnas existentes con menú contextual
-        self.existing_columns_table = QTableWidget()
+        # Filtro por nombre o tipo de columna
+        self.column_filter_input = QLineEdit()
+        self.column_filter_input.setPlaceholderText("Filtrar columnas por nombre o tipo...")
+        self.column_filter_input.setClearButtonEnabled(True)
+        columns_layout.addWidget(self.column_filter_input)
+
+        # Tabla de columnas existentes con menú contextual; el modelo guarda los metadatos
+        # en arreglos y la vista solo pide las celdas visibles
+        self.existing_columns_model = ExistingColumnsModel(self)
+        self.existing_columns_proxy = ColumnFilterProxy(self)
+        self.existing_columns_proxy.setSourceModel(self.existing_columns_model)
+        self.column_filter_input.textChanged.connect(self.existing_columns_proxy.set_filter_text)
+
+        self.existing_columns_table = QTableView()
+        self.existing_columns_table.setModel(self.existing_columns_proxy)
         self.existing_columns_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
-        self.existing_columns_table.resizeColumnsToContents() 
-        self.existing_columns_table.setColumnCount(5)  # +1 columna para acciones
-        self.existing_columns_table.setHorizontalHeaderLabels(["Nombre", "Tipo", "Nulo", "Valor Pred.", "Posición"])
+        self.existing_columns_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.existing_columns_table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.existing_columns_table.setSortingEnabled(True)
+        self.existing_columns_table.sortByColumn(4, Qt.AscendingOrder)
+        self.existing_columns_table.verticalHeader().setVisible(False)
+        self.existing_columns_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
         self.existing_columns_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         self.existing_columns_table.setContextMenuPolicy(Qt.CustomContextMenu)
         self.existing_columns_table.customContextMenuRequested.connect(self.show_column_context_menu)
@@ -261,11 +347,16 @@ class SQLServerColumnAdder(QMainWindow):
         multi_column_group = QGroupBox("Gestión Avanzada de Columnas")
         multi_layout = QVBoxLayout()
         
-        # Tabla para edición múltiple
-        self.multi_columns_table = QTableWidget()
-        self.multi_columns_table.resizeColumnsToContents() 
-        self.multi_columns_table.setColumnCount(6)
-        self.multi_columns_table.setHorizontalHeaderLabels(["Nombre", "Tipo", "Parámetros", "Nullable", "Default", "Posición"])
+        # Tabla para edición múltiple: modelo con delegados, sin widgets por celda
+        self.column_model = ColumnSpecModel(self)
+        self.multi_columns_table = QTableView()
+        self.multi_columns_table.setModel(self.column_model)
+        self.multi_columns_table.setItemDelegateForColumn(COL_TYPE, type_delegate(self.multi_columns_table))
+        self.multi_columns_table.setItemDelegateForColumn(COL_AFTER,
+                                                          position_delegate(self.column_model, self.multi_columns_table))
+        self.multi_columns_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.multi_columns_table.setEditTriggers(QAbstractItemView.DoubleClicked | QAbstractItemView.SelectedClicked
+                                                 | QAbstractItemView.EditKeyPressed | QAbstractItemView.AnyKeyPressed)
         self.multi_columns_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         
         # Barra de herramientas
@@ -279,7 +370,49 @@ class SQLServerColumnAdder(QMainWindow):
         
         clear_btn = QPushButton("🧹 Limpiar Todo")
         clear_btn.clicked.connect(self.clear_multi_columns)
-        
+
+        # Especificaciones en CSV, JSON o YAML (las mismas que acepta cli.py)
+        import_btn = QPushButton("📂 Importar...")
+        import_btn.clicked.connect(self.import_column_spec)
+
+        export_btn = QPushButton("📤 Exportar...")
+        export_btn.clicked.connect(self.export_column_spec)
+        
+        # Tamaño de lote para la copia de datos (0 = todo en una sola transacción)
+        self.batch_size_spin = QSpinBox()
+        self.batch_size_spin.setRange(0, 10000000)
+        self.batch_size_spin.setSingleStep(10000)
+        self.batch_size_spin.setValue(0)
+        self.batch_size_spin.setSpecialValueText("Sin lotes")
+        self.batch_size_spin.setToolTip("Filas por lote al copiar datos. Cada lote se confirma por separado y la copia puede reanudarse.")
+
+        # Modo en línea: tabla sombra + captura de cambios + intercambio con sp_rename
+        self.online_check = QCheckBox("En línea")
+        self.online_check.setToolTip("Reconstruye en una tabla sombra sin bloquear la tabla durante la copia")
+
+        # Sesiones para crear índices en paralelo (solo con lotes o en línea)
+        self.index_workers_spin = QSpinBox()
+        self.index_workers_spin.setRange(1, 16)
+        self.index_workers_spin.setValue(1)
+        self.index_workers_spin.setPrefix("Índices: ")
+        self.index_workers_spin.setToolTip("Sesiones en paralelo para crear los índices no clúster al reconstruir "
+                                           "con lotes o en línea. El índice clúster siempre se crea primero.")
+
+        # Tablas particionadas: sesiones por partición y carga con SWITCH desde staging
+        self.partition_workers_spin = QSpinBox()
+        self.partition_workers_spin.setRange(1, 16)
+        self.partition_workers_spin.setValue(1)
+        self.partition_workers_spin.setPrefix("Particiones: ")
+        self.partition_workers_spin.setToolTip("Sesiones en paralelo para copiar las particiones de una tabla "
+                                               "particionada. Cada partición se confirma por separado.")
+        self.switch_check = QCheckBox("SWITCH")
+        self.switch_check.setToolTip("Carga cada partición en una tabla de staging en su filegroup y la incorpora "
+                                     "con ALTER TABLE ... SWITCH (requiere índices alineados)")
+
+        # Agregar las mismas columnas a muchas tablas
+        batch_btn = QPushButton("🗂 Varias Tablas...")
+        batch_btn.clicked.connect(self.show_batch_migration)
+
         execute_btn = QPushButton("💾 Guardar Cambios")
         execute_btn.clicked.connect(self.save_multi_columns)
         execute_btn.setStyleSheet("background-color: #4CAF50; color: white;")
@@ -287,7 +420,16 @@ class SQLServerColumnAdder(QMainWindow):
         tool_layout.addWidget(add_row_btn)
         tool_layout.addWidget(remove_row_btn)
         tool_layout.addWidget(clear_btn)
+        tool_layout.addWidget(import_btn)
+        tool_layout.addWidget(export_btn)
         tool_layout.addStretch()
+        tool_layout.addWidget(QLabel("Tamaño de lote:"))
+        tool_layout.addWidget(self.batch_size_spin)
+        tool_layout.addWidget(self.online_check)
+        tool_layout.addWidget(self.index_workers_spin)
+        tool_layout.addWidget(self.partition_workers_spin)
+        tool_layout.addWidget(self.switch_check)
+        tool_layout.addWidget(batch_btn)
         tool_layout.addWidget(execute_btn)
         
         multi_layout.addWidget(self.multi_columns_table)
@@ -313,9 +455,16 @@ class SQLServerColumnAdder(QMainWindow):
         
         tab_widget.addTab(column_tab, "Gestión de Columnas")
     
+    def selected_column_row(self):
+        """Fila del modelo de columnas existentes (no de la vista filtrada) seleccionada, o -1"""
+        index = self.existing_columns_table.currentIndex()
+        if not index.isValid():
+            return -1
+        return self.existing_columns_proxy.mapToSource(index).row()
+
     def show_column_context_menu(self, position):
         menu = QMenu()
-        selected_row = self.existing_columns_table.currentRow()
+        selected_row = self.selected_column_row()
         
         if selected_row >= 0:
             rename_action = menu.addAction("✏️ Renombrar Columna")
@@ -324,8 +473,6 @@ class SQLServerColumnAdder(QMainWindow):
             
             action = menu.exec_(self.existing_columns_table.viewport().mapToGlobal(position))
             
-            col_name = self.existing_columns_table.item(selected_row, 0).text()
-            
             if action == rename_action:
                 self.rename_column(selected_row)
             elif action == edit_action:
@@ -389,56 +536,14 @@ class SQLServerColumnAdder(QMainWindow):
 
     def add_multi_column_row(self, column_data=None):
         """Añade una nueva fila con datos opcionales (para edición)"""
-        row = self.multi_columns_table.rowCount()
-        self.multi_columns_table.insertRow(row)
-        
-        # Configurar widgets para cada celda
-        name_item = QTableWidgetItem(column_data['name'] if column_data else "")
-        self.multi_columns_table.setItem(row, 0, name_item)
-        
-        type_combo = QComboBox()
-        types = ["int", "bigint", "smallint", "tinyint", "bit",
-            "decimal", "numeric", "money", "smallmoney",
-            "float", "real",
-            "date", "datetime", "datetime2", "smalldatetime", "time",
-            "char", "varchar", "text", "nchar", "nvarchar", "ntext",
-            "binary", "varbinary", "image",
-            "uniqueidentifier", "xml", "sql_variant"]
-        type_combo.addItems(types)
-        if column_data:
-            base_type = column_data['type'].split('(')[0]
-            type_combo.setCurrentText(base_type)
-        self.multi_columns_table.setCellWidget(row, 1, type_combo)
-        
-        params = ""
-        if column_data and '(' in column_data['type']:
-            params = column_data['type'].split('(')[1].split(')')[0]
-
-        params_item = QTableWidgetItem(params)
-        self.multi_columns_table.setItem(row, 2, params_item)
-        
-        allow_null = QCheckBox(column_data['allow_null'] if column_data else "")
-        self.multi_columns_table.setCellWidget(row, 3, allow_null)
-
-        default_item = QTableWidgetItem(column_data['default'] if column_data else "")
-        self.multi_columns_table.setItem(row, 4, default_item)
-        
-        position_combo = QComboBox()
-        position_combo.addItem("(al inicio)", "-1")
-        for i in range(self.existing_columns_table.rowCount()):
-            col_name = self.existing_columns_table.item(i, 0).text()
-            position_combo.addItem(col_name, col_name)
-        if column_data and column_data['after']:
-            idx = position_combo.findData(column_data['after'])
-            if idx >= 0:
-                position_combo.setCurrentIndex(idx+1)
-
-        position_combo.addItem("(al final)", None)
-        self.multi_columns_table.setCellWidget(row, 5, position_combo)
+        self.column_model.add_columns([column_data or new_column()])
+        row = self.column_model.rowCount() - 1
+        self.multi_columns_table.scrollToBottom()
+        self.multi_columns_table.edit(self.column_model.index(row, 0))
 
     def clear_multi_columns(self):
         """Limpia toda la tabla de edición"""
-        if self.multi_columns_table.rowCount() > 0:
+        if self.column_model.rowCount() > 0:
             reply = QMessageBox.question(
                 self,
                 "Limpiar tabla",
@@ -447,14 +552,67 @@ class SQLServerColumnAdder(QMainWindow):
                 QMessageBox.No
             )
             if reply == QMessageBox.Yes:
-                self.multi_columns_table.setRowCount(0)
+                self.column_model.clear()
+
+    def import_column_spec(self):
+        """Carga columnas desde un archivo CSV, JSON o YAML"""
+        path, _ = QFileDialog.getOpenFileName(self, "Importar columnas", "",
+                                              "Especificaciones (*.csv *.json *.yaml *.yml);;Todos los archivos (*)")
+        if not path:
+            return
+        try:
+            columns = load_column_spec(path)
+        except (ColumnSpecError, OSError) as e:
+            QMessageBox.warning(self, "Error al importar", str(e))
+            return
+
+        if self.column_model.rowCount() > 0:
+            reply = QMessageBox.question(
+                self,
+                "Importar columnas",
+                "¿Reemplazar las columnas de la lista? (No = agregarlas al final)",
+                QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel,
+                QMessageBox.No
+            )
+            if reply == QMessageBox.Cancel:
+                return
+            if reply == QMessageBox.Yes:
+                self.column_model.clear()
+        self.column_model.add_columns(columns)
+        self.log(f"{len(columns)} columna(s) importada(s) desde {path}")
+
+    def export_column_spec(self):
+        """Guarda las columnas de la lista como CSV, JSON o YAML según la extensión elegida"""
+        columns = self.get_multi_columns()
+        if not columns:
+            return
+        path, _ = QFileDialog.getSaveFileName(self, "Exportar columnas", "columnas.json",
+                                              "JSON (*.json);;YAML (*.yaml *.yml);;CSV (*.csv)")
+        if not path:
+            return
+        try:
+            dump_column_spec(columns, path)
+        except (ColumnSpecError, OSError) as e:
+            QMessageBox.warning(self, "Error al exportar", str(e))
+            return
+        self.log(f"{len(columns)} columna(s) exportada(s) a {path}")
+
+    def get_multi_columns(self):
+        """Columnas del editor múltiple como diccionarios; None si falta algún dato"""
+        columns = self.column_model.columns()
+        if not columns:
+            QMessageBox.warning(self, "Tabla vacía", "No hay columnas para guardar")
+            return None
+
+        for row, col_data in enumerate(columns):
+            # Validación básica
+            if not col_data['name']:
+                QMessageBox.warning(self, "Error", f"Fila {row+1}: Nombre no puede estar vacío")
+                return None
+        return columns
 
     def save_multi_columns(self):
         """Guarda todos los cambios de columnas"""
-        if self.multi_columns_table.rowCount() == 0:
-            QMessageBox.warning(self, "Tabla vacía", "No hay columnas para guardar")
-            return
-        
         schema = self.schema_combo.currentText()
         table = self.table_combo.currentText()
         
@@ -462,52 +620,42 @@ class SQLServerColumnAdder(QMainWindow):
             QMessageBox.warning(self, "Error", "Seleccione esquema y tabla")
             return
         
-        # Preparar datos
-        columns = []
-        for row in range(self.multi_columns_table.rowCount()):
-            col_data = {
-                'name': self.multi_columns_table.item(row, 0).text(),
-                'type': self.multi_columns_table.cellWidget(row, 1).currentText(),
-                'params': self.multi_columns_table.item(row, 2).text(),
-                'allow_null': self.multi_columns_table.cellWidget(row, 3).isChecked(),
-                'default': self.multi_columns_table.item(row, 4).text(),
-                'after': self.multi_columns_table.cellWidget(row, 5).currentData(),
-            }
-            
-            # Validación básica
-            if not col_data['name']:
-                QMessageBox.warning(self, "Error", f"Fila {row+1}: Nombre no puede estar vacío")
-                return
-                
-            columns.append(col_data)
-        
-        # Confirmación final
-        reply = QMessageBox.question(
-            self,
-            "Confirmar cambios",
-            f"¿Aplicar los siguientes cambios a la tabla {schema}.{table}?\n\n" +
-            "\n".join([f"- {col['name']} ({col['type']})" for col in columns]),
-            QMessageBox.Yes | QMessageBox.No,
-            QMessageBox.No
-        )
+        columns = self.get_multi_columns()
+        if not columns:
+            return
         
-        if reply == QMessageBox.Yes:
-            try:
+        # Plan y estimaciones antes de la confirmación final
+        batch_size = self.batch_size_spin.value()
+        online = self.online_check.isChecked()
+        self.statusBar().showMessage("Calculando plan...")
+
+        def work(job):
+            return ColumnMigration(job.connection, schema, table, log=job.log).estimate(columns, batch_size, online)
+
+        def done(estimate):
+            self.statusBar().showMessage("Listo")
+            reply = QMessageBox.question(
+                self,
+                "Confirmar cambios",
+                f"¿Aplicar los siguientes cambios a la tabla {schema}.{table}?\n\n" +
+                "\n".join([f"- {col['name']} ({col['type']})" for col in columns]) +
+                "\n\n" + format_estimate(estimate),
+                QMessageBox.Yes | QMessageBox.No,
+                QMessageBox.No
+            )
+            
+            if reply == QMessageBox.Yes:
                 self.apply_column_changes(columns)
-                self.load_table_columns()
-                QMessageBox.information(self, "Éxito", "Cambios aplicados correctamente")
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"No se pudieron aplicar los cambios:\n{str(e)}")
-            finally:
-                self.multi_columns_table.setRowCount(0)  # Limpiar tabla
+
+        self.run_db_job(work, done, error_message="Error al calcular el plan", purpose=PURPOSE_METADATA)
 
     def remove_multi_column_row(self):
         """Elimina la fila seleccionada o la última si no hay selección"""
-        selected_rows = sorted(set(index.row() for index in self.multi_columns_table.selectedIndexes()))
+        selected_rows = sorted(set(index.row() for index in self.multi_columns_table.selectionModel().selectedIndexes()))
         
         if not selected_rows:
             # Si no hay selección, preguntar si eliminar la última fila
-            last_row = self.multi_columns_table.rowCount() - 1
+            last_row = self.column_model.rowCount() - 1
             if last_row >= 0:
                 reply = QMessageBox.question(
                     self,
@@ -517,7 +665,7 @@ class SQLServerColumnAdder(QMainWindow):
                     QMessageBox.No
                 )
                 if reply == QMessageBox.Yes:
-                    self.multi_columns_table.removeRow(last_row)
+                    self.column_model.remove_rows([last_row])
             else:
                 QMessageBox.warning(
                     self,
@@ -526,7 +674,6 @@ class SQLServerColumnAdder(QMainWindow):
                     QMessageBox.Ok
                 )
         else:
-            # Eliminar filas seleccionadas (en orden inverso para evitar problemas de índices)
             reply = QMessageBox.question(
                 self,
                 "Confirmar eliminación",
@@ -536,11 +683,10 @@ class SQLServerColumnAdder(QMainWindow):
             )
             
             if reply == QMessageBox.Yes:
-                for row in sorted(selected_rows, reverse=True):
-                    self.multi_columns_table.removeRow(row)
+                self.column_model.remove_rows(selected_rows)
 
     def rename_column(self, row):
-        old_name = self.existing_columns_table.item(row, 0).text()
+        old_name = self.existing_columns_model.column(row).column_name
         new_name, ok = QInputDialog.getText(
             self,
             "Renombrar Columna",
@@ -551,32 +697,26 @@ class SQLServerColumnAdder(QMainWindow):
         
         if ok and new_name and new_name != old_name:
             self.statusBar().showMessage(f"Renombrando columna {old_name}...")
-            try:
-                schema = self.schema_combo.currentText()
-                table = self.table_combo.currentText()
-                
-                cursor = self.connection.cursor()
-                cursor.execute("BEGIN TRANSACTION")
-
-                cursor.execute(f"""
-                    EXEC sp_rename '{schema}.{table}.{old_name}', '{new_name}', 'COLUMN'
-                """)
-                cursor.execute("COMMIT TRANSACTION")
-                self.connection.commit()
-                
+            schema = self.schema_combo.currentText()
+            table = self.table_combo.currentText()
+
+            def work(job):
+                ColumnMigration(job.connection, schema, table, log=job.log).rename_column(old_name, new_name)
+
+            def done(_):
+                self.catalog.invalidate(schema, table)
                 self.load_table_columns()
-                self.log(f"Columna renombrada: {old_name} → {new_name}")
                 self.statusBar().showMessage(f"Columna renombrada {old_name} → {new_name}")
-                
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"No se pudo renombrar: {str(e)}")
+
+            self.run_db_job(work, done, error_message="No se pudo renombrar")
 
     def edit_column(self, row):
         # Implementación similar a la anterior pero más completa
-        col_name = self.existing_columns_table.item(row, 0).text()
-        col_type = self.existing_columns_table.item(row, 1).text()
-        col_nullable = self.existing_columns_table.item(row, 2).text() == "Sí"
-        col_default = self.existing_columns_table.item(row, 3).text()
+        column = self.existing_columns_model.column(row)
+        col_name = column.column_name
+        col_type = self.existing_columns_model.type_string(row)
+        col_nullable = column.is_nullable
+        col_default = column.default_value
         
         dialog = ColumnEditorDialog(col_name, col_type, col_nullable, col_default, self)
         if dialog.exec_() == QDialog.Accepted:
@@ -584,14 +724,13 @@ class SQLServerColumnAdder(QMainWindow):
             try:
                 # Implementar lógica ALTER COLUMN según el RDBMS
                 self.execute_column_change(col_name, new_def)
-                self.load_table_columns()
                 
             except Exception as e:
                 QMessageBox.critical(self, "Error", str(e))
 
     def execute_column_change(self, old_name, new_data):
         """
-        Ejecuta los cambios en una columna existente
+        Ejecuta los cambios en una columna existente en segundo plano
         :param old_name: Nombre actual de la columna
         :param new_data: Diccionario con:
             - 'type': Nuevo tipo de dato (ej. "varchar(255)")
@@ -604,67 +743,46 @@ class SQLServerColumnAdder(QMainWindow):
         if not schema or not table or table == 'Seleccione':
             raise ValueError("Esquema y tabla deben estar seleccionados")
 
-        self.statusBar().showMessage(f"Actualizando columna {old_name}...")
-        try:
-            cursor = self.connection.cursor()
-            cursor.execute("BEGIN TRANSACTION")
+        # Impacto y estrategia antes de la confirmación
+        batch_size = self.batch_size_spin.value()
+        self.statusBar().showMessage(f"Analizando cambio de la columna {old_name}...")
 
-            # 2. Alterar tipo de dato y nulabilidad
-            alter_sql = f"ALTER TABLE [{schema}].[{table}] ALTER COLUMN [{old_name}] {new_data['type']}"
-            alter_sql += " NULL" if new_data.get('nullable', True) else " NOT NULL"
-            
-            cursor.execute(alter_sql)
-            
-            # 3. Manejar valor por defecto
-            if 'default' in new_data:
-                # Primero eliminar el default existente si hay uno
-                cursor.execute(f"""
-                    DECLARE @constraint_name NVARCHAR(256)
-                    SELECT @constraint_name = name 
-                    FROM sys.default_constraints
-                    WHERE parent_object_id = OBJECT_ID('{schema}.{table}')
-                    AND parent_column_id = (
-                        SELECT column_id 
-                        FROM sys.columns 
-                        WHERE object_id = OBJECT_ID('{schema}.{table}') 
-                        AND name = '{old_name}'
-                    )
-                    
-                    IF @constraint_name IS NOT NULL
-                        EXEC('ALTER TABLE [{schema}].[{table}] DROP CONSTRAINT ' + @constraint_name)
-                """)
-                
-                # Agregar nuevo default si se especificó
-                if new_data['default']:
-                    default_value = new_data['default']
-                    # Manejar valores especiales como funciones
-                    if default_value.upper() in ('GETDATE()', 'NEWID()'):
-                        default_expr = default_value
-                    else:
-                        # Determinar si necesita comillas
-                        if any(t in new_data['type'].lower() for t in ['char', 'text', 'date', 'time']):
-                            default_expr = f"N'{default_value}'" if 'n' in new_data['type'].lower() else f"'{default_value}'"
-                        else:
-                            default_expr = default_value
-                    
-                    cursor.execute(f"""
-                        ALTER TABLE [{schema}].[{table}] 
-                        ADD CONSTRAINT [DF_{table}_{old_name}] 
-                        DEFAULT {default_expr} FOR [{old_name}]
-                    """)
-            
-            cursor.execute("COMMIT TRANSACTION")
-            self.connection.commit()
-            self.log(f"Columna {old_name} modificada exitosamente")
-            self.statusBar().showMessage(f"Columna {old_name} modificada exitosamente")
+        def analyze(job):
+            return ColumnMigration(job.connection, schema, table, log=job.log).analyze_column_change(old_name, new_data)
 
-        except Exception as e:
-            cursor.execute("ROLLBACK TRANSACTION")
-            self.log(f"Error al modificar columna {old_name}: {str(e)}", level=logging.ERROR)
-            raise
+        def analyzed(analysis):
+            self.statusBar().showMessage("Listo")
+            if analysis['strategy'] == STRATEGY_MANUAL:
+                QMessageBox.warning(self, "Cambio bloqueado", format_type_change(analysis))
+                return
+            reply = QMessageBox.question(
+                self,
+                "Confirmar cambio",
+                f"¿Modificar la columna {old_name}?\n\n" + format_type_change(analysis),
+                QMessageBox.Yes | QMessageBox.No,
+                QMessageBox.No
+            )
+            if reply != QMessageBox.Yes:
+                return
+
+            self.statusBar().showMessage(f"Actualizando columna {old_name}...")
+
+            def work(job):
+                return ColumnMigration(job.connection, schema, table, log=job.log).alter_column(
+                    old_name, new_data, analysis['strategy'], batch_size)
+
+            def done(_):
+                self.statusBar().showMessage(f"Columna {old_name} modificada exitosamente")
+                self.catalog.invalidate(schema, table)
+                self.load_table_columns()
+
+            self.run_db_job(work, done, error_message=f"Error al modificar columna {old_name}")
+
+        self.run_db_job(analyze, analyzed, error_message=f"Error al analizar el cambio de {old_name}",
+                        purpose=PURPOSE_METADATA)
                 
     def delete_column(self, row):
-        col_name = self.existing_columns_table.item(row, 0).text()
+        col_name = self.existing_columns_model.column(row).column_name
         
         reply = QMessageBox.question(
             self,
@@ -676,49 +794,69 @@ class SQLServerColumnAdder(QMainWindow):
         
         if reply == QMessageBox.Yes:
             self.statusBar().showMessage(f"Eliminando columna {col_name}...")
-            try:
-                schema = self.schema_combo.currentText()
-                table = self.table_combo.currentText()
-                
-                cursor = self.connection.cursor()
-                cursor.execute("BEGIN TRANSACTION")
-
-                cursor.execute(f"""
-                    DECLARE @constraint_name NVARCHAR(256)
-                    SELECT @constraint_name = name 
-                    FROM sys.default_constraints
-                    WHERE parent_object_id = OBJECT_ID('{schema}.{table}')
-                    AND parent_column_id = (
-                        SELECT column_id 
-                        FROM sys.columns 
-                        WHERE object_id = OBJECT_ID('{schema}.{table}') 
-                        AND name = '{col_name}'
-                    )
-                    
-                    IF @constraint_name IS NOT NULL
-                        EXEC('ALTER TABLE [{schema}].[{table}] DROP CONSTRAINT ' + @constraint_name)
-                """)
+            schema = self.schema_combo.currentText()
+            table = self.table_combo.currentText()
 
-                cursor.execute(f"ALTER TABLE [{schema}].[{table}] DROP COLUMN [{col_name}]")
-                cursor.execute("COMMIT TRANSACTION")
-                self.connection.commit()
-                
+            def work(job):
+                ColumnMigration(job.connection, schema, table, log=job.log).drop_column(col_name)
+
+            def done(_):
+                self.catalog.invalidate(schema, table)
                 self.load_table_columns()
-                self.log(f"Columna eliminada: {col_name}")
                 self.statusBar().showMessage(f"Columna eliminada: {col_name}")
-                
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"No se pudo eliminar: {str(e)}")
+
+            self.run_db_job(work, done, error_message="No se pudo eliminar")
 
     def setup_log_tab(self, tab_widget):
         log_tab = QWidget()
         layout = QVBoxLayout(log_tab)
         
-        self.log_output = QTextEdit()
-        self.log_output.setReadOnly(True)
-        
+        # Filtros por nivel mínimo y por tabla
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("Nivel:"))
+        self.log_level_combo = QComboBox()
+        for label, level in (("Todos", logging.NOTSET), ("Información", logging.INFO),
+                             ("Advertencias", logging.WARNING), ("Errores", logging.ERROR)):
+            self.log_level_combo.addItem(label, level)
+        self.log_level_combo.currentIndexChanged.connect(
+            lambda _: self.log_proxy.set_min_level(self.log_level_combo.currentData()))
+        filter_layout.addWidget(self.log_level_combo)
+        filter_layout.addWidget(QLabel("Tabla:"))
+        self.log_table_filter = QLineEdit()
+        self.log_table_filter.setPlaceholderText("esquema.tabla")
+        self.log_table_filter.setClearButtonEnabled(True)
+        filter_layout.addWidget(self.log_table_filter)
+        clear_log_button = QPushButton("Limpiar")
+        filter_layout.addWidget(clear_log_button)
+        layout.addLayout(filter_layout)
+
+        # Búfer circular con los últimos registros; la vista solo pinta las filas visibles
+        self.log_model = LogBufferModel(parent=self)
+        self.log_proxy = LogFilterProxy(self)
+        self.log_proxy.setSourceModel(self.log_model)
+        self.log_table_filter.textChanged.connect(self.log_proxy.set_table_text)
+        clear_log_button.clicked.connect(self.log_model.clear)
+
+        self.log_output = QListView()
+        self.log_output.setModel(self.log_proxy)
+        self.log_output.setUniformItemSizes(True)
+        self.log_output.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.log_output.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        # Seguir el final solo si la vista ya estaba al final antes de agregar
+        self.log_follow = True
+        self.log_proxy.rowsAboutToBeInserted.connect(self.on_log_rows_about_to_be_inserted)
+        self.log_proxy.rowsInserted.connect(self.on_log_rows_inserted)
+
         layout.addWidget(self.log_output)
         tab_widget.addTab(log_tab, "Registro")
+
+    def on_log_rows_about_to_be_inserted(self, *_):
+        scroll_bar = self.log_output.verticalScrollBar()
+        self.log_follow = scroll_bar.value() == scroll_bar.maximum()
+
+    def on_log_rows_inserted(self, *_):
+        if self.log_follow:
+            self.log_output.scrollToBottom()
     
     def toggle_auth_fields(self):
         auth_type = self.auth_combo.currentText()
@@ -733,26 +871,6 @@ class SQLServerColumnAdder(QMainWindow):
             self.pass_input.setVisible(True)
             self.pass_layout.itemAt(0).widget().setVisible(True)
     
-    def get_driver_specific_params(self, driver_name):
-        driver_name_lower = driver_name.lower()
-        
-        # Detección por patrones en el nombre del driver
-        if 'freetds' in driver_name_lower:
-            return {"TDS_Version": "8.0"}
-        elif 'odbc driver 13' in driver_name_lower:
-            return {"Encrypt": "yes", "TrustServerCertificate": "no"}
-        elif 'odbc driver' in driver_name_lower:
-            return {"Encrypt": "optional", "TrustServerCertificate": "no"}
-        elif 'native client' in driver_name_lower:
-            return { "TrustServerCertificate": "yes"}
-        elif 'msodbcsql17' in driver_name_lower:
-            return {"Encrypt": "optional"}
-        elif 'sql server' in driver_name_lower and not ('odbc driver' in driver_name_lower):
-            return {}  # Driver genérico (pocos parámetros extra)
-        else:
-            # Parámetros por defecto para drivers desconocidos (puedes ajustarlos)
-            return {"Encrypt": "optional"}
-   
     def connect_to_db(self):
         server = self.server_input.text()
         database = self.db_input.text()
@@ -762,256 +880,260 @@ class SQLServerColumnAdder(QMainWindow):
             QMessageBox.warning(self, "Error", "Servidor y base de datos son requeridos")
             return
         
-        try:
-            if auth_type == "Windows":
-                conn_str = f"DRIVER={{SQL Server}};SERVER={server};DATABASE={database};Trusted_Connection=yes;"
-            else:
-                username = self.user_input.text()
-                password = self.pass_input.text()
-                
-                # Construye la cadena base
-                conn_str = f"DRIVER={{{auth_type}}};SERVER={server};DATABASE={database};UID={username};PWD={password};"
-                
-                # Añade parámetros específicos detectados automáticamente
-                driver_params = self.get_driver_specific_params(auth_type)
-                for key, value in driver_params.items():
-                    conn_str += f"{key}={value};"
-            
-            self.statusBar().showMessage("Conectando a la base de datos...")
-            self.connection = pyodbc.connect(conn_str)
+        conn_str = build_connection_string(server, database, auth_type,
+                                           self.user_input.text(), self.pass_input.text())
+        
+        self.statusBar().showMessage("Conectando a la base de datos...")
+        self.connect_button.setEnabled(False)
+
+        def work(job):
+            # La primera sesión valida la conexión y queda libre en el pool
+            pool = get_pool(conn_str)
+            try:
+                with pool.session(PURPOSE_METADATA):
+                    pass
+            except Exception:
+                close_pool(conn_str)
+                raise
+            # La instantánea local (miles de tablas) se lee aquí y no en el hilo de la interfaz
+            catalog = CatalogCache()
+            if not self.snapshot.load(server, database, catalog):
+                return pool, None, None
+            return pool, catalog, SearchIndex.from_catalog(catalog)
+
+        def done(result):
+            pool, catalog, index = result
+            self.pool = pool
+            self.conn_str = conn_str
+            self.catalog = catalog or CatalogCache()
+            self.snapshot_key = (server, database)
+            self.catalog_timer.start()
 
-            # Resto del código...
             self.statusBar().showMessage(f"Conectado a {server}/{database}")
-            self.connect_button.setEnabled(False)
             self.disconnect_button.setEnabled(True)
-            
-            # Cargar esquemas
-            self.load_schemas()
-            
             self.log("Conexión exitosa a la base de datos")
-            # Simular operación larga
-        except pyodbc.Error as e:
+            
+            # Con una instantánea local se muestra al instante y se trae solo lo que cambió
+            if catalog is not None:
+                self.log(f"Catálogo cargado desde la instantánea local ({self.catalog.table_count} tablas), "
+                         f"buscando cambios...")
+                self.set_search_index(index)
+                self.show_schemas(self.catalog.schemas)
+                self.poll_catalog(force=True, row_counts=True)
+            else:
+                self.load_schemas()
+
+        def failed(e):
+            self.connect_button.setEnabled(True)
             QMessageBox.critical(self, "Error de Conexión", str(e))
             self.log(f"Error de conexión: {str(e)}", level=logging.ERROR)
 
+        self.metadata_jobs.submit(work, on_finished=done, on_failed=failed)
+
     def disconnect_from_db(self):
-        if self.connection:
-            self.connection.close()
-            self.connection = None
+        if self.pool:
+            conn_str = self.conn_str
+            self.pool = None
+            self.conn_str = None
+            self.snapshot_key = None
+            self.catalog_timer.stop()
+            self.catalog.clear()
+            self.set_search_index(SearchIndex())
+            # Las sesiones libres se cierran ya; las que están en uso al devolverse al pool
+            close_pool(conn_str)
             self.statusBar().showMessage("Desconectado")
             self.connect_button.setEnabled(True)
             self.disconnect_button.setEnabled(False)
             self.schema_combo.clear()
             self.table_combo.clear()
-            self.existing_columns_table.setRowCount(0)
+            self.existing_columns_model.clear()
             self.log("Desconectado de la base de datos")
     
     def load_schemas(self):
-        if not self.connection:
+        if not self.pool:
             return
         
         self.statusBar().showMessage("Cargando schemas...")
-        try:
-            # Crear nuevo cursor
-            cursor = self.connection.cursor()
-
-
-            cursor.execute("""
-                SELECT name 
-                FROM sys.schemas 
-                WHERE name NOT IN ('guest', 'INFORMATION_SCHEMA', 'sys', 'db_owner', 'db_accessadmin', 
-                                 'db_securityadmin', 'db_ddladmin', 'db_backupoperator', 
-                                 'db_datareader', 'db_datawriter', 'db_denydatareader', 'db_denydatawriter')
-                ORDER BY name
-            """)
-            
-            self.schema_combo.clear()
-            for row in cursor:
-                self.schema_combo.addItem(row.name)
-            
-            self.log("Esquemas cargados exitosamente")
-            self.statusBar().showMessage("Esquemas cargados exitosamente")
 
-            self.refresh_tables()
-        except pyodbc.Error as e:
-            QMessageBox.critical(self, "Error", f"No se pudieron cargar los esquemas: {str(e)}")
-            self.log(f"Error al cargar esquemas: {str(e)}", level=logging.ERROR)
+        snapshot_key = self.snapshot_key
+
+        def work(job):
+            # Una sola consulta carga esquemas, tablas y columnas
+            self.catalog.load(job.connection)
+            self.snapshot.save(*snapshot_key, self.catalog)
+            return self.catalog.schemas, SearchIndex.from_catalog(self.catalog)
+
+        def done(result):
+            schemas, index = result
+            self.set_search_index(index)
+            self.show_schemas(schemas)
+
+        self.run_db_job(work, done, error_message="No se pudieron cargar los esquemas", purpose=PURPOSE_METADATA)
+
+    def show_schemas(self, schemas):
+        """Llena el combo de esquemas, conservando la selección actual, y después el de tablas"""
+        current = self.schema_combo.currentText()
+        self.schema_combo.blockSignals(True)
+        self.schema_combo.clear()
+        self.schema_combo.addItems(schemas)
+        if current in schemas:
+            self.schema_combo.setCurrentText(current)
+        self.schema_combo.blockSignals(False)
+
+        self.log("Esquemas cargados exitosamente")
+        self.statusBar().showMessage("Esquemas cargados exitosamente")
+
+        self.refresh_tables()
     
     def refresh_tables(self):
+        """Llena el combo de tablas desde la caché, conservando la selección actual"""
         schema = self.schema_combo.currentText()
-        if not schema or not self.connection:
+        if not schema or not self.pool:
             return
-        
-        self.statusBar().showMessage(f"Cargando tablas del esquema {schema}...")
-        try: 
-            
-            # Crear nuevo cursor
-            cursor = self.connection.cursor()
-
-            cursor.execute(f"""
-                SELECT t.name 
-                FROM sys.tables t
-                JOIN sys.schemas s ON t.schema_id = s.schema_id
-                WHERE s.name = ?
-                ORDER BY t.name
-            """, schema)
-            
-            self.table_combo.clear()
-            self.table_combo.addItem("Seleccione")
-            for row in cursor:
-                self.table_combo.addItem(row.name)
 
-            # Cuando se selecciona una tabla, cargar sus columnas
-            self.table_combo.currentTextChanged.connect(self.load_table_columns)
-            
-            #self.load_table_columns()
-            self.log(f"Tablas del esquema {schema} cargadas exitosamente")
-            self.statusBar().showMessage(f"Tablas del esquema {schema} cargadas exitosamente")
-            
-        except pyodbc.Error as e:
-            QMessageBox.critical(self, "Error", f"No se pudieron cargar las tablas: {str(e)}")
-            self.log(f"Error al cargar tablas: {str(e)}", level=logging.ERROR)
+        tables = self.catalog.get_tables(schema)
+        if tables is None:
+            self.load_schemas()
+            return
+
+        current = self.table_combo.currentText()
+
+        # Evitar que llenar el combo dispare la carga de columnas
+        self.table_combo.blockSignals(True)
+        self.table_combo.clear()
+        self.table_combo.addItem("Seleccione")
+        self.table_combo.addItems(tables)
+        if current in tables:
+            self.table_combo.setCurrentText(current)
+        self.table_combo.blockSignals(False)
+
+        if current not in tables:
+            self.existing_columns_model.clear()
+            self.table_title_label.setText("Tabla: Ninguna seleccionada")
+
+        self.statusBar().showMessage(f"Tablas del esquema {schema} cargadas exitosamente")
+
+    def poll_catalog(self, force=False, row_counts=False):
+        """
+        Busca cambios externos del catálogo por modify_date, actualiza lo que se muestra
+        y guarda en la instantánea local solo las tablas que cambiaron; row_counts relee
+        además las filas de todas las tablas (después de cargar una instantánea)
+        """
+        if not self.pool:
+            return
+        # El sondeo periódico no se encola ni compite con los bloqueos de un cambio en curso
+        if (self.jobs.busy or self.metadata_jobs.busy) and not force:
+            return
+
+        schema = self.schema_combo.currentText()
+        table = self.table_combo.currentText()
+
+        def done(changed):
+            if changed is None:
+                self.log("Catálogo recargado por cambios externos")
+                self.rebuild_search_index()
+            elif changed:
+                self.log(f"Tablas modificadas externamente: {', '.join(f'{s}.{t}' for s, t in changed)}")
+                self.search_index.update_tables(self.catalog, changed)
+                self.search_catalog(self.search_input.text())
+            else:
+                return
+
+            self.refresh_tables()
+            if changed is None or (schema, table) in changed:
+                self.load_table_columns()
+
+        snapshot_key = self.snapshot_key
+
+        def work(job):
+            changed = self.catalog.poll(job.connection)
+            if changed is None or changed:
+                self.snapshot.save(*snapshot_key, self.catalog, changed)
+            if row_counts:
+                self.catalog.refresh_row_counts(job.connection)
+                self.snapshot.save_row_counts(*snapshot_key, self.catalog)
+            return changed
+
+        self.run_db_job(work, done, error_message="Error al verificar cambios del catálogo", purpose=PURPOSE_METADATA)
     
     def load_table_columns(self):
         schema = self.schema_combo.currentText()
         table = self.table_combo.currentText()
         
-        if not schema or not table or not self.connection:
+        if not schema or not table or not self.pool:
             return
         
         if table == 'Seleccione':
             return
         
+        row_count = self.catalog.get_row_count(schema, table)
+        self.table_title_label.setText(f"Tabla: [{schema}].[{table}]"
+                                       + (f" (~{row_count:,} filas)" if row_count is not None else ""))
+
+        columns = self.catalog.get_columns(schema, table)
+        if columns is not None:
+            self.show_table_columns(schema, table, columns)
+            return
+
         self.statusBar().showMessage(f"Cargando columnas de la tabla {table}...")
-        self.table_title_label.setText(f"Tabla: [{schema}].[{table}]")
-        try:
 
-            # Crear nuevo cursor
-            cursor = self.connection.cursor()
-            
-            # Obtener información de columnas con orden explícito por column_id
-            cursor.execute(f"""
-                SELECT 
-                    c.name AS column_name,
-                    tp.name AS type_name,
-                    c.max_length,
-                    c.precision,
-                    c.scale,
-                    c.is_nullable,
-                    ISNULL(dc.definition, '') AS default_value,
-                    c.column_id
-                FROM sys.columns c
-                JOIN sys.types tp ON c.user_type_id = tp.user_type_id
-                JOIN sys.tables t ON c.object_id = t.object_id
-                JOIN sys.schemas s ON t.schema_id = s.schema_id
-                LEFT JOIN sys.default_constraints dc ON c.default_object_id = dc.object_id
-                WHERE s.name = ? AND t.name = ?
-                ORDER BY c.column_id
-            """, schema, table)
-            
-            columns = cursor.fetchall()
+        snapshot_key = self.snapshot_key
 
-            # Limpiar y configurar la tabla
-            self.existing_columns_table.setRowCount(len(columns))
+        def work(job):
+            self.catalog.refresh_table(job.connection, schema, table)
+            self.snapshot.save(*snapshot_key, self.catalog, [(schema, table)])
+            return self.catalog.get_columns(schema, table) or []
 
-            columns_list = list(columns)  # Convertir a lista explícita
-            for i, col in enumerate(columns_list):
-                # Nombre
-                self.existing_columns_table.setItem(i, 0, QTableWidgetItem(col.column_name))
-                
-                # Tipo con parámetros
-                type_str = col.type_name
-                if col.type_name in ('varchar', 'char'):
-                    type_str += f"({col.max_length})"
-                elif col.type_name in ('nvarchar', 'nchar'):
-                    type_str += f"({math.floor(col.max_length/2)})"
-                elif col.type_name in ('decimal', 'numeric'):
-                    type_str += f"({col.precision},{col.scale})"
-                elif col.type_name in ('datetime2', 'datetimeoffset', 'time'):
-                    type_str += f"({col.scale})"
-                
-                self.existing_columns_table.setItem(i, 1, QTableWidgetItem(type_str))
-                
-                # Nulo
-                nullable_item = QTableWidgetItem()
-                nullable_item.setData(Qt.DisplayRole, "Sí" if col.is_nullable else "No")
-                self.existing_columns_table.setItem(i, 2, nullable_item)
-                
-                # Valor por defecto
-                self.existing_columns_table.setItem(i, 3, QTableWidgetItem(col.default_value))
-                
-                # Posición
-                self.existing_columns_table.setItem(i, 4, QTableWidgetItem(str(col.column_id)))
-
-            self.log(f"Columnas de {schema}.{table} cargadas exitosamente")
-            self.statusBar().showMessage(f"Columnas de {schema}.{table} cargadas exitosamente")
-        except pyodbc.Error as e:
-            QMessageBox.critical(self, "Error", f"No se pudieron cargar las columnas de la tabla {table}: {str(e)}")
-            self.log(f"Error al cargar columnas de la tabla {table}: {str(e)}", level=logging.ERROR)
-    
-    def getNewCreateTable(self, create_table, columns): 
-        for column in columns:
-            # Parsear el SQL para encontrar la lista de columnas
-            opening_paren_index = create_table.index('(')
-            closing_paren_index = create_table.rindex(')')
-            
-            before_columns = create_table[:opening_paren_index + 1]
-            columns_part = create_table[opening_paren_index + 1:closing_paren_index]
-            after_columns = create_table[closing_paren_index:]
-            
-            # Dividir las columnas existentes, manteniendo las comas originales
-            existing_columns = [line.strip() for line in columns_part.split('\n') 
-                                if line.strip() and not line.strip().startswith('CONSTRAINT')]
-            
-            # Construir definición de la nueva columna
-            column_def = f"[{column['name']}] {column['type']}({column['params']})" if column['params'] else  f"[{column['name']}] {column['type']}"
-            
-            if not column['allow_null']:
-                column_def += " NOT NULL"
-            
-            if column['default']:
-                if column['default'].upper() in ('GETDATE()', 'SYSDATETIME()', 'NEWID()', 'NEWSEQUENTIALID()', 'CURRENT_TIMESTAMP'):
-                    column_def += f" DEFAULT {column['default']}"
-                elif  column['type'] in ('int', 'bigint', 'smallint', 'tinyint', 'bit', 'decimal', 'numeric', 
-                                    'float', 'real', 'money', 'smallmoney'):
-                    column_def += f" DEFAULT {column['default']}"
-                else:
-                    column_def += f" DEFAULT N'{column['default']}'"
-            
-            column_def += ","
-            
-            # Encontrar posición para insertar
-            if column['after']:
-                # Buscar la columna después de la cual insertar
-                if(column['after'] == "-1"):
-                    existing_columns.insert(0, column_def)
-
-                for i, col in enumerate(existing_columns):
-                    if f"[{column['after']}]" in col:
-                        existing_columns.insert(i + 1, column_def)
-                        break
-                else:
-                    # Si no se encuentra, agregar al final
-                    if(column['after'] != "-1"):
-                        existing_columns.append(column_def)
-            else:
-                # Agregar al final
-                existing_columns.append(column_def)
-            
-            # Encontrar constraints para mantenerlas al final
-            constraints = [line.strip() for line in columns_part.split('\n') 
-                            if line.strip().startswith('CONSTRAINT')]
-            
-            # Reconstruir el SQL
-            all_columns = existing_columns + constraints
-            new_columns_part = '\n'.join(all_columns)
-            create_table = before_columns + new_columns_part + after_columns
+        def done(columns):
+            self.search_index.update_tables(self.catalog, [(schema, table)])
+            self.show_table_columns(schema, table, columns)
+
+        self.run_db_job(work, done, error_message=f"No se pudieron cargar las columnas de la tabla {table}",
+                        purpose=PURPOSE_METADATA)
+
+    def rebuild_search_index(self):
+        """Reconstruye el índice de búsqueda en segundo plano y lo reemplaza al terminar"""
+        self.metadata_jobs.submit(lambda job: SearchIndex.from_catalog(self.catalog),
+                                  on_finished=self.set_search_index)
+
+    def set_search_index(self, index):
+        self.search_index = index
+        self.search_catalog(self.search_input.text())
+
+    def search_catalog(self, text):
+        """Muestra las tablas y columnas que coinciden con el texto, en todos los esquemas"""
+        results = self.search_index.search(text) if text.strip() else []
+        self.search_results.clear()
+        for result in results:
+            item = QListWidgetItem(describe_result(result))
+            item.setData(Qt.UserRole, result)
+            self.search_results.addItem(item)
+        self.search_results.setVisible(bool(results))
+
+    def open_search_result(self, item):
+        """Selecciona el esquema y la tabla del resultado; una columna queda como filtro"""
+        result = item.data(Qt.UserRole)
+        self.schema_combo.setCurrentText(result.schema)
+        if result.table:
+            self.table_combo.setCurrentText(result.table)
+        self.column_filter_input.setText(result.column or "")
+
+    def show_table_columns(self, schema, table, columns):
+        # Se descarta el resultado si el usuario ya cambió de tabla
+        if (schema, table) != (self.schema_combo.currentText(), self.table_combo.currentText()):
+            return
 
-        #self.log(create_table)
-        return create_table
+        # Las posiciones del editor múltiple se ofrecen respecto de estas columnas
+        self.column_model.set_existing_columns([col.column_name for col in columns])
+
+        # El texto de cada celda se arma al pintarla (ver column_grid)
+        self.existing_columns_model.set_columns(columns)
+
+        self.log(f"Columnas de {schema}.{table} cargadas exitosamente")
+        self.statusBar().showMessage(f"Columnas de {schema}.{table} cargadas exitosamente")
 
     def apply_column_changes(self, columns):
-        """Aplica todos los cambios de columnas en una sola transacción"""
+        """Aplica los cambios de columnas en segundo plano eligiendo la estrategia adecuada"""
         schema = self.schema_combo.currentText()
         table = self.table_combo.currentText()
 
@@ -1020,350 +1142,243 @@ class SQLServerColumnAdder(QMainWindow):
             QMessageBox.warning(self, "Error", "Seleccione un esquema y una tabla")
             return
 
-        try:
-            self.statusBar().showMessage("Agregando nuevas columnas...")
-            cursor = self.connection.cursor()
-            
-            # Ejecutar en una transacción
-            self.log(f"Iniciando transacción para agregar columna(s)")
-            cursor.execute("BEGIN TRANSACTION")
+        batch_size = self.batch_size_spin.value()
+        online = self.online_check.isChecked()
+        self.statusBar().showMessage("Agregando nuevas columnas...")
+
+        conn_str = self.conn_str
+        index_builder = IndexBuilder(conn_str, workers=self.index_workers_spin.value())
+        partition_copier = PartitionCopier(conn_str, workers=self.partition_workers_spin.value(),
+                                           switch=self.switch_check.isChecked())
+
+        def work(job):
+            connection = job.connection
+            telemetry = MigrationTelemetry(connection, f"{schema}.{table}", conn_str=conn_str)
+            progress = ProgressMonitor(conn_str, on_progress=lambda report: job.status(format_progress(report)),
+                                       log=job.log)
+            pacing = PacingController(SqlMetricsSource(connection, conn_str), log=job.log)
+            migration = ColumnMigration(connection, schema, table, log=job.log, cancel=job.cancel_token,
+                                        telemetry=telemetry, progress=progress, index_builder=index_builder,
+                                        pacing=pacing, partition_copier=partition_copier)
+            migration.apply(columns, batch_size=batch_size, online=online)
+            return migration.telemetry_summary
+
+        def done(summary):
+            self.log_telemetry_summary(summary)
+            QMessageBox.information(self, "Éxito", f"Columna(s) agregada exitosamente a '{schema}.{table}'")
+            self.column_model.clear()
             
-            try:
-                # 1. Crear tabla temporal con los datos
-                self.log("Creando tabla temporal...")
-                cursor.execute(f"""
-                    SELECT * INTO [{schema}].[{table}_TEMP] 
-                    FROM [{schema}].[{table}]
-                """)
-                
-                # 2. Obtener y eliminar FK que referencian esta tabla
-                self.log("Manejando claves foráneas...")
-                cursor.execute(f"""
-                    SELECT 
-                        fk.name AS constraint_name,
-                        sch.name AS schema_name,
-                        tab.name AS table_name,
-                        'ALTER TABLE [' + sch.name + '].[' + tab.name + '] ADD CONSTRAINT [' + fk.name + '] ' +
-                        'FOREIGN KEY (' + 
-                        STUFF((
-                            SELECT ', [' + col.name + ']'
-                            FROM sys.foreign_key_columns fkc
-                            JOIN sys.columns col ON fkc.parent_object_id = col.object_id AND fkc.parent_column_id = col.column_id
-                            WHERE fkc.constraint_object_id = fk.object_id
-                            FOR XML PATH('')
-                        ), 1, 2, '') + 
-                        ') REFERENCES [{schema}].[{table}] (' +
-                        STUFF((
-                            SELECT ', [' + col.name + ']'
-                            FROM sys.foreign_key_columns fkc
-                            JOIN sys.columns col ON fkc.referenced_object_id = col.object_id AND fkc.referenced_column_id = col.column_id
-                            WHERE fkc.constraint_object_id = fk.object_id
-                            FOR XML PATH('')
-                        ), 1, 2, '') + 
-                        ')' AS create_script,
-                        'ALTER TABLE [' + sch.name + '].[' + tab.name + '] DROP CONSTRAINT [' + fk.name + ']' AS drop_script
-                    FROM sys.foreign_keys fk
-                    JOIN sys.tables tab ON fk.parent_object_id = tab.object_id
-                    JOIN sys.schemas sch ON tab.schema_id = sch.schema_id
-                    WHERE EXISTS (
-                        SELECT 1 
-                        FROM sys.foreign_key_columns fkc
-                        JOIN sys.tables ref_tab ON fkc.referenced_object_id = ref_tab.object_id
-                        JOIN sys.schemas ref_sch ON ref_tab.schema_id = ref_sch.schema_id
-                        WHERE fkc.constraint_object_id = fk.object_id
-                        AND ref_tab.name = '{table}' 
-                        AND ref_sch.name = '{schema}'
-                    )
-                """)
-                
-                referencing_fks = cursor.fetchall()
-                
-                for fk in referencing_fks:
-                    self.log(f"Eliminando FK {fk.constraint_name} que referencia a {schema}.{table}")
-                    cursor.execute(fk.drop_script)
-
-                # self.log("Obtener COLLATION de DATABASE")
-                # cursor.execute(f"""
-                #     SELECT DATABASEPROPERTYEX(DB_NAME(), 'Collation')
-                # """)
-                # dbCollation = cursor.fetchone()[0]
-                
-                # 3. Obtener permisos
-                self.log("Obteniendo permisos...")
-                cursor.execute(f"""
-                    SELECT 
-                        perm.permission_name,
-                        perm.state_desc,
-                        prin.name AS principal_name,
-                        prin.type_desc AS principal_type,
-                        CONCAT(
-                            'REVOKE ', perm.permission_name COLLATE DATABASE_DEFAULT, 
-                            ' ON [{schema}].[{table}] FROM [', 
-                            prin.name COLLATE DATABASE_DEFAULT, ']'
-                        ) AS revoke_script,
-                        CASE 
-                            WHEN perm.state_desc = 'GRANT_WITH_GRANT_OPTION' 
-                            THEN CONCAT(
-                                'GRANT ', perm.permission_name COLLATE DATABASE_DEFAULT, 
-                                ' ON [{schema}].[{table}] TO [', 
-                                prin.name COLLATE DATABASE_DEFAULT, '] WITH GRANT OPTION'
-                            )
-                            ELSE CONCAT(
-                                perm.state_desc COLLATE DATABASE_DEFAULT, ' ', 
-                                perm.permission_name COLLATE DATABASE_DEFAULT, 
-                                ' ON [{schema}].[{table}] TO [', 
-                                prin.name COLLATE DATABASE_DEFAULT, ']'
-                            )
-                        END AS grant_script
-                    FROM sys.database_permissions perm
-                    JOIN sys.database_principals prin ON perm.grantee_principal_id = prin.principal_id
-                    WHERE perm.major_id = OBJECT_ID('{schema}.{table}')
-                """)
-                
-                table_permissions = cursor.fetchall()
-                
-                # 4. Obtener DDL completo de la tabla
-                self.log("Obteniendo DDL de la tabla...")
-                try:
-                    # 1. Obtener CREATE TABLE
-                    cursor.execute(f"""
-                        SELECT 
-                            'CREATE TABLE [{schema}].[{table}] (' + CHAR(13) + CHAR(10) +
-                            (
-                                SELECT 
-                                    '    [' + c.name + '] ' + 
-                                    tp.name + 
-                                    CASE 
-                                        WHEN tp.name IN ('varchar', 'char') 
-                                        THEN '(' + IIF(c.max_length = -1, 'MAX', CAST(c.max_length AS VARCHAR)) + ')'
-                                        WHEN tp.name IN ('nvarchar', 'nchar') 
-                                        THEN '(' + IIF(c.max_length = -1, 'MAX', CAST(c.max_length/2 AS VARCHAR)) + ')'
-                                        WHEN tp.name IN ('decimal', 'numeric') 
-                                        THEN '(' + CAST(c.precision AS VARCHAR) + ',' + CAST(c.scale AS VARCHAR) + ')'
-                                        WHEN tp.name IN ('datetime2', 'datetimeoffset', 'time') 
-                                        THEN '(' + CAST(c.scale AS VARCHAR) + ')'
-                                        ELSE ''
-                                    END + 
-                                    CASE WHEN c.is_identity = 1 
-                                        THEN ' IDENTITY(' + CAST(IDENT_SEED('{schema}.{table}') AS VARCHAR) + 
-                                            ',' + CAST(IDENT_INCR('{schema}.{table}') AS VARCHAR) + ')' 
-                                        ELSE '' 
-                                    END +
-                                    CASE WHEN c.is_nullable = 0 THEN ' NOT NULL' ELSE ' NULL' END +
-                                    CASE WHEN dc.definition IS NOT NULL 
-                                        THEN ' DEFAULT ' + 
-                                            CASE 
-                                                WHEN dc.definition LIKE '%getdate%' THEN 'GETDATE()'
-                                                WHEN dc.definition LIKE '%sysdatetime%' THEN 'SYSDATETIME()'
-                                                WHEN dc.definition LIKE '%newid%' THEN 'NEWID()'
-                                                WHEN dc.definition LIKE '%newsequentialid%' THEN 'NEWSEQUENTIALID()'
-                                                WHEN dc.definition LIKE '%current_timestamp%' THEN 'CURRENT_TIMESTAMP'
-                                                ELSE REPLACE(REPLACE(CAST(dc.definition AS NVARCHAR(MAX)), '(', ''), ')', '')
-                                            END
-                                        ELSE '' 
-                                    END +
-                                    ',' + CHAR(13) + CHAR(10)
-                                FROM sys.columns c
-                                JOIN sys.types tp ON c.user_type_id = tp.user_type_id
-                                LEFT JOIN sys.default_constraints dc ON c.default_object_id = dc.object_id
-                                WHERE c.object_id = OBJECT_ID('{schema}.{table}')
-                                ORDER BY c.column_id
-                                FOR XML PATH(''), TYPE
-                            ).value('.', 'NVARCHAR(MAX)') +
-                            
-                            CASE 
-                                WHEN EXISTS (SELECT 1 FROM sys.key_constraints WHERE parent_object_id = OBJECT_ID('{schema}.{table}') AND type = 'PK')
-                                THEN 
-                                    '    CONSTRAINT [' + (SELECT name FROM sys.key_constraints WHERE parent_object_id = OBJECT_ID('{schema}.{table}') AND type = 'PK') + '] ' +
-                                    'PRIMARY KEY ' + 
-                                    (SELECT CASE WHEN index_id = 1 THEN 'CLUSTERED' ELSE 'NONCLUSTERED' END 
-                                    FROM sys.indexes 
-                                    WHERE object_id = OBJECT_ID('{schema}.{table}') AND is_primary_key = 1) +
-                                    ' (' + 
-                                    (
-                                        SELECT STRING_AGG('[' + c.name + ']', ', ')
-                                        FROM sys.index_columns ic
-                                        JOIN sys.columns c ON ic.object_id = c.object_id AND ic.column_id = c.column_id
-                                        WHERE ic.object_id = OBJECT_ID('{schema}.{table}') 
-                                        AND ic.index_id = (SELECT index_id FROM sys.indexes WHERE object_id = OBJECT_ID('{schema}.{table}') AND is_primary_key = 1)
-                                    ) + ')' + CHAR(13) + CHAR(10)
-                                ELSE ''
-                            END + ')' AS createTable
-                    """)
-                    create_table = cursor.fetchone()[0] + ";\n"
-
-                    # 2. Obtener índices
-                    cursor.execute(f"""
-                        SELECT 
-                            'CREATE ' + 
-                            CASE WHEN i.is_unique = 1 THEN 'UNIQUE ' ELSE '' END +
-                            CASE WHEN i.type_desc = 'CLUSTERED' THEN 'CLUSTERED ' ELSE 'NONCLUSTERED ' END +
-                            'INDEX [' + i.name + '] ON [{schema}].[{table}] (' +
-                            (
-                                SELECT STRING_AGG('[' + c.name + ']' + CASE WHEN ic.is_descending_key = 1 THEN ' DESC' ELSE ' ASC' END, ', ')
-                                FROM sys.index_columns ic
-                                JOIN sys.columns c ON ic.object_id = c.object_id AND ic.column_id = c.column_id
-                                WHERE ic.object_id = i.object_id AND ic.index_id = i.index_id AND ic.key_ordinal > 0
-                            ) + ')' +
-                            CASE 
-                                WHEN i.has_filter = 1 
-                                THEN ' WHERE ' + REPLACE(REPLACE(CAST(i.filter_definition AS NVARCHAR(MAX)), '[', ''), ']', '')
-                                ELSE ''
-                            END AS createIdx
-                        FROM sys.indexes i
-                        WHERE i.object_id = OBJECT_ID('{schema}.{table}') 
-                        AND i.is_primary_key = 0 
-                        AND i.type_desc IN ('CLUSTERED', 'NONCLUSTERED')
-                    """)
-                    create_idx = [row.createIdx for row in cursor.fetchall()]
-
-                    # 3. Obtener Check Constraints
-                    cursor.execute(f"""
-                        SELECT 
-                            'ALTER TABLE [{schema}].[{table}] ' +
-                            'ADD CONSTRAINT [' + cc.name + '] CHECK ' + 
-                            REPLACE(REPLACE(CAST(cc.definition AS NVARCHAR(MAX)), '(', ''), ')', '') AS createConstraint
-                        FROM sys.check_constraints cc
-                        WHERE cc.parent_object_id = OBJECT_ID('{schema}.{table}')
-                    """)
-                    create_constraint = [row.createConstraint for row in cursor.fetchall()]
-
-                    # 4. Obtener Foreign Keys
-                    cursor.execute(f"""
-                        SELECT 
-                            'ALTER TABLE [{schema}].[{table}] ' +
-                            'ADD CONSTRAINT [' + fk.name + '] FOREIGN KEY (' +
-                            (
-                                SELECT STRING_AGG('[' + c.name + ']', ', ')
-                                FROM sys.foreign_key_columns fkc
-                                JOIN sys.columns c ON fkc.parent_object_id = c.object_id AND fkc.parent_column_id = c.column_id
-                                WHERE fkc.constraint_object_id = fk.object_id
-                            ) + ') ' +
-                            'REFERENCES [' + SCHEMA_NAME(ref_tab.schema_id) + '].[' + ref_tab.name + '] (' +
-                            (
-                                SELECT STRING_AGG('[' + c.name + ']', ', ')
-                                FROM sys.foreign_key_columns fkc
-                                JOIN sys.columns c ON fkc.referenced_object_id = c.object_id AND fkc.referenced_column_id = c.column_id
-                                WHERE fkc.constraint_object_id = fk.object_id
-                            ) + ')' +
-                            CASE 
-                                WHEN fk.delete_referential_action = 1 THEN ' ON DELETE CASCADE'
-                                WHEN fk.delete_referential_action = 2 THEN ' ON DELETE SET NULL'
-                                WHEN fk.delete_referential_action = 3 THEN ' ON DELETE SET DEFAULT'
-                                ELSE ''
-                            END +
-                            CASE 
-                                WHEN fk.update_referential_action = 1 THEN ' ON UPDATE CASCADE'
-                                WHEN fk.update_referential_action = 2 THEN ' ON UPDATE SET NULL'
-                                WHEN fk.update_referential_action = 3 THEN ' ON UPDATE SET DEFAULT'
-                                ELSE ''
-                            END AS createFk
-                        FROM sys.foreign_keys fk
-                        JOIN sys.tables ref_tab ON fk.referenced_object_id = ref_tab.object_id
-                        WHERE fk.parent_object_id = OBJECT_ID('{schema}.{table}')
-                    """)
-                    create_fk = [row.createFk for row in cursor.fetchall()]
-
-                except pyodbc.Error as e:
-                    self.log(f"Error al obtener DDL: {str(e)}", level=logging.ERROR)
-                    raise
-                
-                # 5. Eliminar tabla original
-                self.log("Eliminando tabla original...")
-                cursor.execute(f"DROP TABLE [{schema}].[{table}]")
-                
-                # 6. Crear nueva tabla con la columna adicional
-                # Modificar el CREATE TABLE para incluir la nueva columna
-                self.log("Modificando DDL para incluir nuevas columnas...")
-                new_create_table = self.getNewCreateTable(create_table, columns)
-                
-                self.log("Creando nueva tabla con la columna(s) adicional(es)...")
-                cursor.execute(new_create_table)
-                
-                # 7. Copiar datos de la tabla temporal
-                self.log("Copiando datos desde tabla temporal...")
-                
-                # Obtener columnas de la tabla temporal
-                cursor.execute(f"""
-                    SELECT STRING_AGG(QUOTENAME(name), ', ')
-                    FROM sys.columns
-                    WHERE object_id = OBJECT_ID('{schema}.{table}_TEMP')
-                """)
-                columns_list = cursor.fetchone()[0]
-                
-                # Copiar datos con IDENTITY INSERT si es necesario
-                cursor.execute(f"""
-                    -- Verificar si la tabla tiene columnas identity
-                    DECLARE @has_identity BIT = 0;
-                    SELECT @has_identity = 1 
-                    FROM sys.columns 
-                    WHERE object_id = OBJECT_ID('{schema}.{table}') 
-                    AND is_identity = 1;
-                    
-                    IF @has_identity = 1
-                        SET IDENTITY_INSERT [{schema}].[{table}] ON;
-                    
-                    INSERT INTO [{schema}].[{table}] ({columns_list})
-                    SELECT {columns_list}
-                    FROM [{schema}].[{table}_TEMP];
-                    
-                    IF @has_identity = 1
-                        SET IDENTITY_INSERT [{schema}].[{table}] OFF;
-                """)
-                
-                # 8. Eliminar tabla temporal
-                self.log("Eliminando tabla temporal...")
-                cursor.execute(f"DROP TABLE [{schema}].[{table}_TEMP]")
-                
-                # 9. Recrear índices
-                self.log("Recreando índices...")
-                for idx_sql in create_idx:
-                    cursor.execute(idx_sql)
-                
-                # 10. Recrear constraints CHECK
-                self.log("Recreando constraints CHECK...")
-                for constraint_sql in create_constraint:
-                    cursor.execute(constraint_sql)
-                
-                # 11. Recrear FK (que la tabla referencia)
-                self.log("Recreando claves foráneas...")
-                for fk_sql in create_fk:
-                    cursor.execute(fk_sql)
-                
-                # 12. Recrear FK que referencian esta tabla
-                self.log("Recreando claves foráneas que referencian esta tabla...")
-                for fk in referencing_fks:
-                    cursor.execute(fk.create_script)
-                
-                # 13. Restaurar permisos
-                self.log("Restaurando permisos...")
-                for perm in table_permissions:
-                    cursor.execute(perm.grant_script)
-                
-                # Confirmar transacción
-                cursor.execute("COMMIT TRANSACTION")
-                self.connection.commit()
-                self.log("Transacción completada exitosamente")
-                QMessageBox.information(self, "Éxito", f"Columna(s) agregada exitosamente a '{schema}.{table}'")
-                self.multi_columns_table.setRowCount(0)
-                
-                # Refrescar lista de columnas
-                self.load_table_columns()
-                
-            except Exception as e:
-                cursor.execute("ROLLBACK TRANSACTION")
-                self.log(f"Error durante la transacción: {str(e)} - Realizando ROLLBACK", level=logging.ERROR)
-                QMessageBox.critical(self, "Error", f"Error al agregar columna: {str(e)}")
-                raise
-        
-        except pyodbc.Error as e:
-            QMessageBox.critical(self, "Error", f"Error de base de datos: {str(e)}")
-            self.log(f"Error de base de datos: {str(e)}", level=logging.ERROR)
-            raise
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Error inesperado: {str(e)}")
-            self.log(f"Error inesperado: {str(e)}", level=logging.ERROR)
-            raise
+            # Refrescar lista de columnas
+            self.catalog.invalidate(schema, table)
+            self.load_table_columns()
+
+        message = "Error al agregar columna"
+        if batch_size or online:
+            message += " (vuelva a ejecutar para reanudar desde el último checkpoint)"
+        self.run_db_job(work, done, error_message=message)
+
+    def log_telemetry_summary(self, summary):
+        """Tiempos por fase de la última migración en el registro"""
+        if not summary:
+            return
+        phases = ", ".join(f"{p['phase']}={p['seconds']}s" for p in summary['phases'])
+        self.log(f"Duración total {summary['seconds']}s; fase dominante: {summary['dominant_phase']} ({phases})")
+        if summary['top_waits']:
+            self.log("Esperas principales: " + ", ".join(f"{w} ({n})" for w, n in summary['top_waits'].items()))
+
+    def show_batch_migration(self):
+        """Abre el lote para agregar las columnas del editor a varias tablas"""
+        if not self.pool:
+            QMessageBox.warning(self, "Error", "Conéctese a una base de datos")
+            return
+        columns = self.get_multi_columns()
+        if not columns:
+            return
+        dialog = BatchMigrationDialog(self, columns)
+        dialog.exec_()
+
+class BatchMigrationDialog(QDialog):
+    """Selección de tablas por patrón y tablero de avance del lote"""
+
+    # Se emite desde los hilos del lote; Qt lo entrega en el hilo de la interfaz
+    table_event = pyqtSignal(object)
+
+    STATUS_LABELS = {
+        STATUS_PENDING: "Pendiente",
+        STATUS_RUNNING: "En curso",
+        STATUS_DONE: "Completada",
+        STATUS_SKIPPED: "Omitida",
+        STATUS_FAILED: "Error",
+        STATUS_CANCELLED: "Cancelada",
+    }
+
+    def __init__(self, main_window, columns):
+        super().__init__(main_window)
+        self.main_window = main_window
+        self.columns = columns
+        self.batch = None
+        self.job = None
+        self.rows = {}
+        self.setWindowTitle("Agregar columnas a varias tablas")
+        self.resize(800, 500)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel("Columnas: " + ", ".join(f"{c['name']} ({c['type']})" for c in columns)))
+
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("Esquema (LIKE):"))
+        self.schema_input = QLineEdit(main_window.schema_combo.currentText() or "%")
+        filter_layout.addWidget(self.schema_input)
+        filter_layout.addWidget(QLabel("Tabla (LIKE):"))
+        self.table_input = QLineEdit("%")
+        filter_layout.addWidget(self.table_input)
+        self.search_button = QPushButton("🔍 Buscar")
+        self.search_button.clicked.connect(self.search_tables)
+        filter_layout.addWidget(self.search_button)
+        layout.addLayout(filter_layout)
+
+        self.tables_table = QTableWidget()
+        self.tables_table.setColumnCount(5)
+        self.tables_table.setHorizontalHeaderLabels(["Tabla", "Estado", "Estrategia", "Tiempo (s)", "Mensaje"])
+        self.tables_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.tables_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        layout.addWidget(self.tables_table)
+
+        self.summary_label = QLabel("")
+        layout.addWidget(self.summary_label)
+
+        run_layout = QHBoxLayout()
+        run_layout.addWidget(QLabel("Conexiones en paralelo:"))
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, 32)
+        self.workers_spin.setValue(4)
+        run_layout.addWidget(self.workers_spin)
+        run_layout.addStretch()
+        self.run_button = QPushButton("▶ Ejecutar")
+        self.run_button.setEnabled(False)
+        self.run_button.clicked.connect(self.run_batch)
+        self.stop_button = QPushButton("⏹ Cancelar")
+        self.stop_button.setEnabled(False)
+        self.stop_button.clicked.connect(self.cancel_batch)
+        close_button = QPushButton("Cerrar")
+        close_button.clicked.connect(self.close)
+        run_layout.addWidget(self.run_button)
+        run_layout.addWidget(self.stop_button)
+        run_layout.addWidget(close_button)
+        layout.addLayout(run_layout)
+
+        self.table_event.connect(self.update_table_row)
+
+    def search_tables(self):
+        """Busca las tablas y calcula el plan de cada una"""
+        schema_pattern = self.schema_input.text() or "%"
+        table_pattern = self.table_input.text() or "%"
+        conn_str = self.main_window.conn_str
+        columns = self.columns
+        self.search_button.setEnabled(False)
+        self.run_button.setEnabled(False)
+
+        def work(job):
+            tables = select_tables(job.connection, schema_pattern, table_pattern)
+            batch = BatchMigration(conn_str, tables, columns)
+            batch.plan(job.connection)
+            return batch
+
+        def done(batch):
+            self.search_button.setEnabled(True)
+            self.batch = batch
+            self.show_plans()
+            self.run_button.setEnabled(any(p.status == STATUS_PENDING for p in batch.plans.values()))
+
+        job = self.main_window.run_db_job(work, done, error_message="Error al buscar tablas",
+                                          purpose=PURPOSE_METADATA)
+        job.signals.failed.connect(lambda e: self.search_button.setEnabled(True))
+
+    def show_plans(self):
+        plans = [self.batch.plans[key] for group in self.batch.groups for key in group]
+        self.tables_table.setRowCount(len(plans))
+        self.rows = {}
+        for row, plan in enumerate(plans):
+            self.rows[plan.key] = row
+            self.tables_table.setItem(row, 0, QTableWidgetItem(plan.name))
+            self.update_table_row(plan)
+        self.update_summary()
+
+    def update_table_row(self, plan):
+        row = self.rows.get(plan.key)
+        if row is None:
+            return
+        if plan.error:
+            message = plan.error
+        elif plan.existing:
+            message = "Ya existen: " + ", ".join(plan.existing)
+        else:
+            message = "; ".join(plan.reasons)
+        self.tables_table.setItem(row, 1, QTableWidgetItem(self.STATUS_LABELS.get(plan.status, plan.status)))
+        self.tables_table.setItem(row, 2, QTableWidgetItem(plan.result or plan.strategy or ""))
+        self.tables_table.setItem(row, 3, QTableWidgetItem(f"{plan.elapsed:.1f}" if plan.elapsed is not None else ""))
+        self.tables_table.setItem(row, 4, QTableWidgetItem(message))
+        self.update_summary()
+
+    def update_summary(self):
+        counts = {}
+        for plan in self.batch.plans.values():
+            counts[plan.status] = counts.get(plan.status, 0) + 1
+        self.summary_label.setText(" | ".join(f"{self.STATUS_LABELS[status]}: {count}"
+                                              for status, count in counts.items()))
+
+    def run_batch(self):
+        pending = sum(1 for p in self.batch.plans.values() if p.status == STATUS_PENDING)
+        reply = QMessageBox.question(
+            self,
+            "Confirmar lote",
+            f"¿Agregar las columnas a {pending} tabla(s)?",
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.No
+        )
+        if reply != QMessageBox.Yes:
+            return
+
+        batch = self.batch
+        batch.max_workers = self.workers_spin.value()
+        batch.batch_size = self.main_window.batch_size_spin.value()
+        batch.online = self.main_window.online_check.isChecked()
+        batch.index_builder = IndexBuilder(self.main_window.conn_str,
+                                           workers=self.main_window.index_workers_spin.value())
+        batch.partition_copier = PartitionCopier(self.main_window.conn_str,
+                                                 workers=self.main_window.partition_workers_spin.value(),
+                                                 switch=self.main_window.switch_check.isChecked())
+        batch.on_event = self.table_event.emit
+
+        def work(job):
+            batch.log = job.log
+            batch.cancel = job.cancel_token
+            return batch.run()
+
+        def done(plans):
+            self.stop_button.setEnabled(False)
+            self.search_button.setEnabled(True)
+            for plan in plans:
+                if plan.status == STATUS_DONE:
+                    self.main_window.catalog.invalidate(plan.schema, plan.table)
+            self.main_window.load_table_columns()
+            failed = sum(1 for p in plans if p.status == STATUS_FAILED)
+            if failed:
+                QMessageBox.warning(self, "Lote terminado", f"{failed} tabla(s) con error; revise el registro")
+            else:
+                QMessageBox.information(self, "Lote terminado", "Columnas agregadas en todas las tablas")
+
+        self.run_button.setEnabled(False)
+        self.search_button.setEnabled(False)
+        self.stop_button.setEnabled(True)
+        # Cada tabla del lote toma su propia sesión del pool
+        self.job = self.main_window.run_db_job(work, done, error_message="Error en el lote", purpose=None)
+        self.job.signals.failed.connect(lambda e: self.stop_button.setEnabled(False))
+
+    def cancel_batch(self):
+        if self.job:
+            self.main_window.log("Cancelando lote...", level=logging.WARNING)
+            self.job.cancel()
 
 class ColumnEditorDialog(QDialog):
     def __init__(self, name, col_type, nullable, default, parent=None):
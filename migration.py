@@ -0,0 +1,799 @@
+import time
+import logging
+import pyodbc
+
+from backfill import Backfill
+from cancellation import MigrationCancelled, as_cancelled
+from batch_copy import (BatchCopier, ensure_checkpoint_table, load_checkpoint, save_checkpoint,
+                        clear_checkpoint, get_copy_key)
+from online_migration import OnlineMigration
+from planner import (MODE_ALTER, MODE_ONLINE, MODE_BATCHED, MODE_PARTITIONED, DEFAULT_ONLINE_BATCH_SIZE,
+                     build_column_definition,
+                     build_alter_add, choose_mode, estimate_migration, get_engine_edition, get_table_size,
+                     plan_column_changes, record_throughput, stage_columns)
+from table_definition import extract_table_definition
+from index_builder import SERIAL_INDEX_BUILDER
+from journal import NULL_JOURNAL, MigrationJournal
+from pacing import PacingController, SqlMetricsSource, is_in_availability_group
+from partition_copy import SERIAL_PARTITION_COPIER, PartitionCopier, get_partition_layout, is_partitioned
+from progress import NULL_PROGRESS
+from telemetry import NULL_TELEMETRY
+from type_change import (STRATEGY_ALTER, STRATEGY_ALTER_DEPENDENTS, STRATEGY_MANUAL, STRATEGY_SWAP,
+                         analyze_type_change, get_column_dependencies)
+
+
+class ColumnMigration:
+    """
+    Lógica de cambios de columnas sobre una tabla, independiente de la interfaz.
+    Los mensajes de avance se envían a la función log, la operación puede
+    cancelarse con un CancelToken desde otro hilo y cada fase se mide con telemetry.
+    index_builder decide cómo se recrean los índices (opciones y sesiones en paralelo),
+    partition_copier cómo se copian las tablas particionadas y pacing regula los pasos
+    masivos; por defecto mide las DMV con la misma conexión.
+    """
+
+    def __init__(self, connection, schema, table, log=None, cancel=None, telemetry=None, progress=None,
+                 index_builder=None, pacing=None, partition_copier=None):
+        self.connection = connection
+        self.schema = schema
+        self.table = table
+        self.log = log or (lambda message, level=logging.INFO: logging.log(level, message))
+        self.cancel = cancel
+        self.telemetry = telemetry or NULL_TELEMETRY
+        self.telemetry_summary = None
+        self.progress = progress or NULL_PROGRESS
+        self.index_builder = index_builder or SERIAL_INDEX_BUILDER
+        self.partition_copier = partition_copier or SERIAL_PARTITION_COPIER
+        self.engine_edition = None
+        self.journal = NULL_JOURNAL
+        self.backfills = []
+        self.pacing = pacing or PacingController(SqlMetricsSource(connection), log=self.log)
+
+    def _cursor(self):
+        cursor = self.connection.cursor()
+        if self.cancel:
+            self.cancel.track(cursor)
+        return cursor
+
+    def _check_cancel(self):
+        if self.cancel:
+            self.cancel.check()
+
+    def get_table_definition(self, cursor, source_table=None):
+        """
+        Lee en una sola ida y vuelta la definición de la tabla (columnas, índices,
+        constraints, FK y permisos); source_table permite leerla de otra tabla (ej. la _TEMP)
+        """
+        try:
+            return extract_table_definition(cursor, self.schema, self.table, source_table)
+        except pyodbc.Error as e:
+            self.log(f"Error al obtener DDL: {str(e)}", level=logging.ERROR)
+            raise
+
+    def get_new_create_table(self, definition, columns, include_storage=True, table_name=None, pk_name=None):
+        """CREATE TABLE con las nuevas columnas en su posición, conservando partición y compresión"""
+        new_columns = [(column['name'], column['after'], build_column_definition(column)) for column in columns]
+        return definition.create_table_sql(include_storage, new_columns, table_name, pk_name)
+
+    def apply(self, columns, batch_size=0, online=False):
+        """Agrega las columnas eligiendo la estrategia adecuada; devuelve la estrategia usada"""
+        try:
+            mode = self._apply(columns, batch_size, online)
+        except Exception as e:
+            error = as_cancelled(e, self.cancel)
+            status = 'cancelled' if isinstance(error, MigrationCancelled) else 'error'
+            self.telemetry_summary = self.telemetry.finish(status, str(e))
+            if error is e:
+                raise
+            raise error from e
+        finally:
+            self.pacing.close()
+        self.telemetry_summary = self.telemetry.finish('ok')
+        return mode
+
+    def _apply(self, columns, batch_size, online):
+        schema, table = self.schema, self.table
+        cursor = self._cursor()
+
+        self.engine_edition = get_engine_edition(cursor)
+        journal = MigrationJournal(self.connection, schema, table, log=self.log)
+        pending = journal.find_pending()
+        if pending:
+            # Lo que ya cambió en la base manda sobre los parámetros de esta ejecución
+            mode, batch_size, columns = pending['mode'], pending['batch_size'], pending['columns']
+            self.log(f"Se reanuda la migración interrumpida {pending['run_id']} (modo {mode}) con sus columnas: "
+                     f"{', '.join(c['name'] for c in columns)}", level=logging.WARNING)
+            journal.resume(pending)
+        # Las columnas con expresión se crean con NULL y se rellenan después de la reconstrucción
+        self.backfills = [c for c in columns if c.get('expression')]
+        staged = stage_columns(columns)
+        plan = plan_column_changes(staged, self.engine_edition)
+        if not pending:
+            # Si todas las columnas van al final no hace falta reconstruir la tabla
+            replicated = is_in_availability_group(cursor)
+            mode = choose_mode(plan, batch_size, online, replicated, is_partitioned(cursor, schema, table))
+            if mode in (MODE_BATCHED, MODE_PARTITIONED) and replicated and not batch_size:
+                self.log("La base está en un grupo de disponibilidad: la copia se hace en lotes regulados "
+                         "en lugar de una sola transacción", level=logging.WARNING)
+                batch_size = DEFAULT_ONLINE_BATCH_SIZE
+            if mode == MODE_ALTER and not self.backfills:
+                self.apply_in_place(staged, plan)
+                return mode
+            for reason in plan['reasons']:
+                self.log(f"Se requiere reconstruir la tabla: {reason}")
+            journal.start(mode, columns, batch_size)
+        self.journal = journal
+        self.telemetry.set_migration_id(journal.run_id)
+
+        if mode == MODE_ALTER:
+            if not journal.done('rebuild'):
+                self.apply_in_place(staged, plan)
+            self.apply_backfills(batch_size or DEFAULT_ONLINE_BATCH_SIZE)
+            return mode
+
+        sizes = get_table_size(cursor, schema, table)
+        row_count, data_bytes = next(((size[1], size[2]) for index_id, size in sizes.items() if index_id in (0, 1)), (0, 0))
+        self.connection.commit()
+        start = time.monotonic()
+
+        # Con tamaño de lote la copia se hace por lotes confirmados por separado
+        if journal.done('rebuild'):
+            self.log("La reconstrucción ya había terminado, se continúa con el relleno de columnas")
+        else:
+            if mode == MODE_ONLINE:
+                self.apply_online(staged, batch_size or DEFAULT_ONLINE_BATCH_SIZE)
+            elif mode == MODE_BATCHED:
+                self.apply_batched(staged, batch_size)
+            elif mode == MODE_PARTITIONED:
+                self.apply_batched(staged, batch_size, partitioned=True)
+            else:
+                self.apply_rebuild(staged)
+
+            # La velocidad medida alimenta las estimaciones del planificador
+            try:
+                record_throughput(cursor, schema, table, mode, row_count or 0, data_bytes or 0,
+                                  time.monotonic() - start)
+                self.connection.commit()
+            except pyodbc.Error as e:
+                self.connection.rollback()
+                self.log(f"No se pudo guardar la velocidad de copia: {str(e)}", level=logging.WARNING)
+
+        self.apply_backfills(batch_size or DEFAULT_ONLINE_BATCH_SIZE)
+        return mode
+
+    def _finish_journal(self):
+        """
+        Se llama dentro de la transacción final de la reconstrucción: cierra el diario o,
+        si faltan columnas por rellenar, deja registrado que la reconstrucción terminó
+        """
+        if self.backfills:
+            self.journal.record('rebuild', commit=False)
+        else:
+            self.journal.finish(commit=False)
+
+    def apply_backfills(self, batch_size):
+        """
+        Rellena las columnas con expresión por lotes y, al final, pasa a NOT NULL
+        las que lo piden en una sola transacción que también cierra el diario.
+        El relleno recorre la clave una sola vez: las filas insertadas mientras tanto
+        detrás del recorrido o después del último lote se completan en esa transacción,
+        con la tabla bloqueada, antes de cambiar la nulabilidad.
+        """
+        if not self.backfills:
+            return
+        schema, table = self.schema, self.table
+        for column in self.backfills:
+            self.log(f"Rellenando {column['name']} con {column['expression']} en lotes de {batch_size} filas...")
+            with self.telemetry.phase('backfill') as phase:
+                phase.rows = Backfill(self.connection, schema, table, column['name'], column['expression'],
+                                      batch_size, log=self.log, cancel=self.cancel, telemetry=self.telemetry,
+                                      journal=self.journal, pacing=self.pacing).run()
+
+        not_null = [c for c in self.backfills if not c['allow_null']]
+        cursor = self._cursor()
+        cursor.execute("BEGIN TRANSACTION")
+        try:
+            with self.telemetry.phase('backfill_final') as phase:
+                # TOP (0) no abre la tabla y no tomaría el bloqueo: se lee una fila y el UPDATE
+                # lo pide también, para que nadie inserte NULL antes del ALTER COLUMN
+                cursor.execute(f"SELECT TOP (1) 1 FROM [{schema}].[{table}] WITH (TABLOCKX, HOLDLOCK)")
+                phase.rows = 0
+                for column in self.backfills:
+                    cursor.execute(f"UPDATE [{schema}].[{table}] WITH (TABLOCKX, HOLDLOCK) "
+                                   f"SET [{column['name']}] = {column['expression']} "
+                                   f"WHERE [{column['name']}] IS NULL")
+                    if cursor.rowcount > 0:
+                        self.log(f"{cursor.rowcount} filas nuevas de {column['name']} completadas al final")
+                        phase.rows += cursor.rowcount
+            with self.telemetry.phase('not_null'):
+                for column in not_null:
+                    col_type = f"{column['type']}({column['params']})" if column['params'] else column['type']
+                    self.log(f"Cambiando {column['name']} a NOT NULL...")
+                    cursor.execute(f"ALTER TABLE [{schema}].[{table}] ALTER COLUMN [{column['name']}] {col_type} NOT NULL")
+            self.journal.finish(commit=False)
+            cursor.execute("COMMIT TRANSACTION")
+            self.connection.commit()
+        except Exception:
+            cursor.execute("ROLLBACK TRANSACTION")
+            raise
+
+    def estimate(self, columns, batch_size=0, online=False):
+        """Plan y estimaciones sin modificar la tabla"""
+        estimate = estimate_migration(self._cursor(), self.schema, self.table, columns, batch_size, online)
+        self.connection.commit()
+        return estimate
+
+    def apply_rebuild(self, columns):
+        """Reconstruye la tabla con las nuevas columnas en una sola transacción"""
+        schema, table = self.schema, self.table
+        cursor = self._cursor()
+
+        # Ejecutar en una transacción
+        self.log(f"Iniciando transacción para agregar columna(s)")
+        cursor.execute("BEGIN TRANSACTION")
+
+        try:
+            # 1. Crear tabla temporal con los datos
+            self.log("Creando tabla temporal...")
+            with self.telemetry.phase('temp_copy') as phase:
+                cursor.execute(f"""
+                    SELECT * INTO [{schema}].[{table}_TEMP] 
+                    FROM [{schema}].[{table}]
+                """)
+                phase.rows = temp_rows = cursor.rowcount
+            self._check_cancel()
+
+            # 2. Obtener la definición completa (DDL, FK entrantes y permisos) de una vez
+            self.log("Obteniendo DDL, claves foráneas y permisos...")
+            with self.telemetry.phase('ddl_fetch'):
+                definition = self.get_table_definition(cursor)
+
+            # 3. Eliminar FK que referencian esta tabla
+            self.log("Manejando claves foráneas...")
+            with self.telemetry.phase('fk_drop') as phase:
+                for fk in definition.referencing_fks:
+                    self.log(f"Eliminando FK {fk.constraint_name} que referencia a {schema}.{table}")
+                    cursor.execute(fk.drop_script)
+                phase.rows = len(definition.referencing_fks)
+
+            # 4. Eliminar tabla original
+            self.log("Eliminando tabla original...")
+            with self.telemetry.phase('drop'):
+                cursor.execute(f"DROP TABLE [{schema}].[{table}]")
+
+            # 5. Crear nueva tabla con la columna adicional
+            self.log("Modificando DDL para incluir nuevas columnas...")
+            new_create_table = self.get_new_create_table(definition, columns)
+
+            self.log("Creando nueva tabla con la columna(s) adicional(es)...")
+            with self.telemetry.phase('create'):
+                cursor.execute(new_create_table)
+
+            # 6. Copiar datos de la tabla temporal (sin columnas calculadas ni rowversion)
+            self.log("Copiando datos desde tabla temporal...")
+            columns_list = definition.insertable_columns_sql()
+
+            with self.telemetry.phase('copy_back') as phase, \
+                    self.progress.watch(self.connection, (schema, table), temp_rows):
+                if definition.has_identity:
+                    cursor.execute(f"SET IDENTITY_INSERT [{schema}].[{table}] ON")
+                cursor.execute(f"""
+                    INSERT INTO [{schema}].[{table}] ({columns_list})
+                    SELECT {columns_list}
+                    FROM [{schema}].[{table}_TEMP]
+                """)
+                phase.rows = cursor.rowcount
+                if definition.has_identity:
+                    cursor.execute(f"SET IDENTITY_INSERT [{schema}].[{table}] OFF")
+            self._check_cancel()
+
+            # 7. Eliminar tabla temporal
+            self.log("Eliminando tabla temporal...")
+            with self.telemetry.phase('temp_drop'):
+                cursor.execute(f"DROP TABLE [{schema}].[{table}_TEMP]")
+
+            # 8-12. Índices, CHECK, FK y permisos
+            self.recreate_objects(cursor, definition, [fk.create_script for fk in definition.referencing_fks])
+
+            # Confirmar transacción (el diario se cierra en la misma)
+            self._finish_journal()
+            cursor.execute("COMMIT TRANSACTION")
+            self.connection.commit()
+            self.log("Transacción completada exitosamente")
+
+        except Exception as e:
+            cursor.execute("ROLLBACK TRANSACTION")
+            self.log(f"Error durante la transacción: {str(e)} - Realizando ROLLBACK", level=logging.ERROR)
+            raise
+
+    def rebuild_indexes(self, cursor, definition, in_transaction=True):
+        """Crea los índices de la tabla nueva, el clúster primero; fuera de una transacción pueden ir en paralelo"""
+        if self.engine_edition is None:
+            self.engine_edition = get_engine_edition(cursor)
+        self.log("Recreando índices...")
+        with self.telemetry.phase('index_rebuild') as phase:
+            timings = self.index_builder.build(self.connection, self.schema, self.table, definition.secondary_indexes,
+                                               self.engine_edition, in_transaction=in_transaction,
+                                               log=self.log, cancel=self.cancel, telemetry=self.telemetry,
+                                               pacing=self.pacing)
+            phase.rows = len(timings)
+        return len(timings)
+
+    def recreate_objects(self, cursor, definition, referencing_fk_scripts, indexes=True):
+        """Recrea índices, CHECK, FK salientes y entrantes y permisos de la tabla nueva"""
+        if indexes:
+            self.rebuild_indexes(cursor, definition)
+
+        self.log("Recreando constraints CHECK...")
+        with self.telemetry.phase('check_replay') as phase:
+            for constraint_sql in definition.check_sql():
+                cursor.execute(constraint_sql)
+            phase.rows = len(definition.checks)
+
+        self.log("Recreando claves foráneas...")
+        with self.telemetry.phase('fk_replay') as phase:
+            for fk_sql in definition.foreign_key_sql():
+                cursor.execute(fk_sql)
+
+            self.log("Recreando claves foráneas que referencian esta tabla...")
+            for fk_sql in referencing_fk_scripts:
+                cursor.execute(fk_sql)
+            phase.rows = len(definition.foreign_keys) + len(referencing_fk_scripts)
+
+        self.log("Restaurando permisos...")
+        with self.telemetry.phase('grant_replay') as phase:
+            for perm in definition.permissions:
+                cursor.execute(perm.grant_script)
+            phase.rows = len(definition.permissions)
+
+    def apply_in_place(self, columns, plan):
+        """Agrega las columnas al final con ALTER TABLE ... ADD, sin copiar datos"""
+        cursor = self._cursor()
+
+        if plan['metadata_only']:
+            self.log("Todas las columnas van al final: ALTER TABLE ADD solo en metadatos")
+        else:
+            for reason in plan['reasons']:
+                self.log(f"ALTER TABLE ADD actualizará las filas existentes: {reason}", level=logging.WARNING)
+
+        cursor.execute("BEGIN TRANSACTION")
+        try:
+            with self.telemetry.phase('alter_add'):
+                cursor.execute(build_alter_add(self.schema, self.table, columns))
+            self._finish_journal()
+            cursor.execute("COMMIT TRANSACTION")
+            self.connection.commit()
+        except Exception as e:
+            cursor.execute("ROLLBACK TRANSACTION")
+            self.log(f"Error durante la transacción: {str(e)} - Realizando ROLLBACK", level=logging.ERROR)
+            raise
+
+        self.log("Columna(s) agregada(s) con ALTER TABLE ADD")
+
+    def apply_online(self, columns, batch_size):
+        """Reconstruye la tabla en una tabla sombra mientras la original sigue en uso"""
+        schema, table = self.schema, self.table
+        cursor = self._cursor()
+
+        self.log("Obteniendo DDL, claves foráneas y permisos...")
+        with self.telemetry.phase('ddl_fetch'):
+            definition = self.get_table_definition(cursor)
+        self.connection.commit()
+
+        # Las FK a sí misma se recrean después del intercambio, como las entrantes
+        migration = OnlineMigration(self.connection, schema, table,
+                                    self.get_new_create_table(definition, columns),
+                                    definition.secondary_indexes, definition.check_sql(), definition.foreign_key_sql(),
+                                    definition.referencing_fks + definition.self_referencing_fks,
+                                    definition.permissions, batch_size,
+                                    log=self.log, cancel=self.cancel, telemetry=self.telemetry,
+                                    progress=self.progress, index_builder=self.index_builder,
+                                    engine_edition=self.engine_edition, journal=self.journal,
+                                    finish_journal=self._finish_journal, pacing=self.pacing)
+        migration.run()
+
+    def _use_switch(self, definition):
+        """Las particiones entran con SWITCH si se pidió y todos los índices están alineados"""
+        return self.partition_copier.switch and PartitionCopier.can_switch(definition.indexes)
+
+    def _prepare_partitioned_target(self, cursor, definition, layout):
+        """
+        Ajusta la tabla nueva (vacía) para la copia por particiones: la compresión de
+        cada partición como en la original, escalado de bloqueos por partición para
+        que varias sesiones carguen a la vez y, con SWITCH, los índices ya creados
+        (el destino de un SWITCH debe tenerlos todos)
+        """
+        schema, table = self.schema, self.table
+        base = definition.storage.data_compression if definition.storage else None
+        for partition in layout.partitions:
+            if partition.compression != (base or 'NONE'):
+                cursor.execute(f"ALTER TABLE [{schema}].[{table}] REBUILD PARTITION = {int(partition.number)} "
+                               f"WITH (DATA_COMPRESSION = {partition.compression})")
+        cursor.execute(f"ALTER TABLE [{schema}].[{table}] SET (LOCK_ESCALATION = AUTO)")
+        if self._use_switch(definition):
+            self.log("Creando los índices en la tabla nueva vacía para recibir las particiones con SWITCH...")
+            for index in definition.secondary_indexes:
+                cursor.execute(index.create_sql(schema, table))
+        elif self.partition_copier.switch:
+            self.log("Hay índices no alineados con el esquema de partición: se copia con INSERT en lugar de SWITCH",
+                     level=logging.WARNING)
+
+    def _copy_partitions(self, cursor, definition, columns, batch_size, source, target):
+        """Copia la _TEMP partición por partición; devuelve las filas copiadas"""
+        schema, table = self.schema, self.table
+        layout = get_partition_layout(cursor, *source)
+        self.connection.commit()
+
+        def create_staging(name):
+            return self.get_new_create_table(definition, columns, include_storage=False, table_name=name,
+                                             pk_name=f"PK_{name}")
+
+        with self.telemetry.phase('copy_back') as phase, \
+                self.progress.watch(self.connection, target, layout.total_rows):
+            rows = self.partition_copier.copy(self.connection, source, target, layout,
+                                              definition.insertable_columns_sql(), batch_size,
+                                              identity_insert=definition.has_identity,
+                                              create_staging=create_staging, indexes=definition.secondary_indexes,
+                                              switch=self._use_switch(definition), log=self.log, cancel=self.cancel,
+                                              telemetry=self.telemetry, pacing=self.pacing, journal=self.journal,
+                                              index_builder=self.index_builder)
+            phase.rows = rows
+        return rows, layout
+
+    def apply_batched(self, columns, batch_size, partitioned=False):
+        """
+        Reconstruye la tabla copiando los datos en lotes.
+        1. (transacción corta) Renombra la original a _TEMP y crea la nueva tabla.
+        2. Copia por lotes recorriendo la clave clúster, con checkpoint en cada lote.
+        3. Crea los índices, confirmando cada uno (los ya creados se omiten al reanudar).
+        4. (transacción) Elimina _TEMP y recrea constraints, FK y permisos.
+        Si la copia se interrumpe, volver a ejecutar reanuda desde el último checkpoint.
+        Con partitioned la nueva tabla queda en el mismo esquema de partición y el paso 2
+        copia partición por partición (ver PartitionCopier); al reanudar se sigue con las
+        particiones que faltan.
+        """
+        schema, table = self.schema, self.table
+        temp_table = f"{table}_TEMP"
+        source = (schema, temp_table)
+        target = (schema, table)
+
+        cursor = self._cursor()
+
+        ensure_checkpoint_table(cursor)
+        self.connection.commit()
+
+        checkpoint = load_checkpoint(cursor, source, target)
+        cursor.execute("SELECT OBJECT_ID(?)", f"[{schema}].[{temp_table}]")
+        temp_exists = cursor.fetchone()[0] is not None
+
+        if checkpoint and temp_exists:
+            self.log(f"Se encontró una migración interrumpida de {schema}.{table}, reanudando...", level=logging.WARNING)
+            pending_fks = checkpoint['pending_scripts']
+        else:
+            if temp_exists:
+                raise Exception(f"Ya existe la tabla [{schema}].[{temp_table}] sin checkpoint asociado")
+
+            # 1. Fase de metadatos: renombrar la original y crear la nueva tabla
+            self.log("Iniciando transacción de metadatos...")
+            cursor.execute("BEGIN TRANSACTION")
+            try:
+                self.log("Obteniendo DDL, claves foráneas y permisos...")
+                with self.telemetry.phase('ddl_fetch'):
+                    definition = self.get_table_definition(cursor)
+
+                with self.telemetry.phase('fk_drop') as phase:
+                    for fk in definition.referencing_fks:
+                        self.log(f"Eliminando FK {fk.constraint_name} que referencia a {schema}.{table}")
+                        cursor.execute(fk.drop_script)
+                    phase.rows = len(definition.referencing_fks)
+                pending_fks = [fk.create_script for fk in definition.referencing_fks]
+
+                # El nombre de la PK es único en el esquema: se renombra en la tabla original
+                pk = definition.primary_key
+
+                self.log(f"Renombrando tabla original a {temp_table}...")
+                with self.telemetry.phase('rename'):
+                    cursor.execute(f"EXEC sp_rename '{schema}.{table}', '{temp_table}'")
+                    if pk:
+                        cursor.execute(f"EXEC sp_rename '{schema}.{pk.name}', '{pk.name}_TEMP', 'OBJECT'")
+
+                self.log("Creando nueva tabla con la columna(s) adicional(es)...")
+                with self.telemetry.phase('create'):
+                    cursor.execute(self.get_new_create_table(definition, columns))
+                    if partitioned:
+                        self._prepare_partitioned_target(cursor, definition,
+                                                         get_partition_layout(cursor, schema, temp_table))
+
+                save_checkpoint(cursor, source, target, None, 0, pending_fks)
+                self.journal.record('metadata', commit=False)
+                cursor.execute("COMMIT TRANSACTION")
+                self.connection.commit()
+            except Exception:
+                cursor.execute("ROLLBACK TRANSACTION")
+                raise
+
+        # 2. Copia por lotes; la definición de la _TEMP sirve también para la fase final
+        definition = self.get_table_definition(cursor, temp_table)
+        self.connection.commit()
+
+        layout = None
+        if self.journal.done('copy_back'):
+            rows = self.journal.rows('copy_back')
+            self.log(f"La copia ya había terminado ({rows} filas), se continúa con los índices")
+        elif partitioned:
+            rows, layout = self._copy_partitions(cursor, definition, columns, batch_size, source, target)
+            self.journal.record('copy_back', rows=rows)
+            self.log(f"Copia completada: {rows} filas")
+        else:
+            key = get_copy_key(cursor, schema, temp_table)
+            self.log(f"Copiando datos en lotes de {batch_size} filas (clave: {', '.join(key) or 'ninguna'})...")
+            copier = BatchCopier(self.connection, source, target, definition.insertable_columns_sql(), key, batch_size,
+                                 identity_insert=definition.has_identity, log=self.log, cancel=self.cancel,
+                                 pacing=self.pacing)
+            total_rows = sum(size[1] or 0 for index_id, size in get_table_size(cursor, schema, temp_table).items()
+                             if index_id in (0, 1))
+            self.connection.commit()
+            with self.telemetry.phase('copy_back') as phase, self.progress.watch(self.connection, target, total_rows):
+                rows = copier.run()
+                phase.rows = rows
+            self.journal.record('copy_back', rows=rows)
+            self.log(f"Copia completada: {rows} filas")
+
+        # 3. Los índices se crean antes de la transacción final, cada uno confirmado por
+        # separado y en paralelo si el constructor tiene varias sesiones
+        if not self.journal.done('index_rebuild'):
+            self.journal.record('index_rebuild', rows=self.rebuild_indexes(cursor, definition, in_transaction=False))
+
+        # 4. Fase final: constraints, FK y permisos leídos de la tabla _TEMP
+        if partitioned:
+            layout = layout or get_partition_layout(cursor, schema, temp_table)
+            cursor.execute("SELECT lock_escalation_desc FROM sys.tables WHERE object_id = OBJECT_ID(?)",
+                           f"[{schema}].[{temp_table}]")
+            lock_escalation = cursor.fetchone()[0]
+            self.connection.commit()
+        cursor.execute("BEGIN TRANSACTION")
+        try:
+            self.log("Eliminando tabla temporal...")
+            with self.telemetry.phase('temp_drop'):
+                cursor.execute(f"DROP TABLE [{schema}].[{temp_table}]")
+
+            self.recreate_objects(cursor, definition, pending_fks, indexes=False)
+
+            if partitioned:
+                cursor.execute(f"ALTER TABLE [{schema}].[{table}] SET (LOCK_ESCALATION = {lock_escalation})")
+                PartitionCopier.clear_checkpoints(cursor, source, target, layout)
+            clear_checkpoint(cursor, source, target)
+            self._finish_journal()
+            cursor.execute("COMMIT TRANSACTION")
+            self.connection.commit()
+        except Exception:
+            cursor.execute("ROLLBACK TRANSACTION")
+            raise
+
+        self.log("Migración por lotes completada exitosamente")
+
+    def rename_column(self, old_name, new_name):
+        schema, table = self.schema, self.table
+        cursor = self._cursor()
+        cursor.execute("BEGIN TRANSACTION")
+
+        cursor.execute(f"""
+            EXEC sp_rename '{schema}.{table}.{old_name}', '{new_name}', 'COLUMN'
+        """)
+        cursor.execute("COMMIT TRANSACTION")
+        self.connection.commit()
+        self.log(f"Columna renombrada: {old_name} → {new_name}")
+
+    def _drop_default(self, cursor, col_name):
+        """Quita el DEFAULT de la columna si tiene uno"""
+        schema, table = self.schema, self.table
+        cursor.execute(f"""
+            DECLARE @constraint_name NVARCHAR(256)
+            SELECT @constraint_name = name 
+            FROM sys.default_constraints
+            WHERE parent_object_id = OBJECT_ID(?)
+            AND parent_column_id = (
+                SELECT column_id 
+                FROM sys.columns 
+                WHERE object_id = OBJECT_ID(?) 
+                AND name = ?
+            )
+            
+            IF @constraint_name IS NOT NULL
+                EXEC('ALTER TABLE [{schema}].[{table}] DROP CONSTRAINT ' + QUOTENAME(@constraint_name))
+        """, f"[{schema}].[{table}]", f"[{schema}].[{table}]", col_name)
+
+    def _add_default(self, cursor, col_name, col_type, default_value):
+        """Agrega DF_{tabla}_{columna} con el valor del editor"""
+        schema, table = self.schema, self.table
+        # Manejar valores especiales como funciones
+        if default_value.upper() in ('GETDATE()', 'NEWID()'):
+            default_expr = default_value
+        else:
+            # Determinar si necesita comillas
+            if any(t in col_type.lower() for t in ['char', 'text', 'date', 'time']):
+                default_expr = f"N'{default_value}'" if 'n' in col_type.lower() else f"'{default_value}'"
+            else:
+                default_expr = default_value
+
+        cursor.execute(f"""
+            ALTER TABLE [{schema}].[{table}] 
+            ADD CONSTRAINT [DF_{table}_{col_name}] 
+            DEFAULT {default_expr} FOR [{col_name}]
+        """)
+
+    def _restore_default(self, cursor, col_name, new_data, old_default):
+        """DEFAULT después del cambio: el nuevo si se indicó, si no el que tenía la columna"""
+        schema, table = self.schema, self.table
+        if 'default' in new_data:
+            if new_data['default']:
+                self._add_default(cursor, col_name, new_data['type'], new_data['default'])
+        elif old_default:
+            name, definition = old_default
+            cursor.execute(f"ALTER TABLE [{schema}].[{table}] ADD CONSTRAINT [{name}] DEFAULT {definition} FOR [{col_name}]")
+
+    def drop_column(self, col_name):
+        schema, table = self.schema, self.table
+        cursor = self._cursor()
+        cursor.execute("BEGIN TRANSACTION")
+
+        self._drop_default(cursor, col_name)
+
+        cursor.execute(f"ALTER TABLE [{schema}].[{table}] DROP COLUMN [{col_name}]")
+        cursor.execute("COMMIT TRANSACTION")
+        self.connection.commit()
+        self.log(f"Columna eliminada: {col_name}")
+
+    def analyze_column_change(self, col_name, new_data):
+        """Impacto, dependencias, costo y estrategia de un cambio de columna sin modificar la tabla"""
+        analysis = analyze_type_change(self._cursor(), self.schema, self.table, col_name,
+                                       new_data['type'], new_data.get('nullable', True))
+        self.connection.commit()
+        return analysis
+
+    def alter_column(self, old_name, new_data, strategy=None, batch_size=0):
+        """
+        Ejecuta los cambios en una columna existente
+        :param old_name: Nombre actual de la columna
+        :param new_data: Diccionario con:
+            - 'type': Nuevo tipo de dato (ej. "varchar(255)")
+            - 'nullable': Si permite NULL
+            - 'default': Valor por defecto
+        :param strategy: Estrategia de type_change (None = la que propone el análisis)
+        :param batch_size: Filas por lote al rellenar la columna con la estrategia swap
+        :return: Estrategia usada
+        """
+        analysis = self.analyze_column_change(old_name, new_data)
+        for reason in analysis['reasons']:
+            self.log(f"{old_name}: {reason}")
+        if analysis['strategy'] == STRATEGY_MANUAL:
+            raise Exception(f"No se puede modificar la columna {old_name}: {'; '.join(analysis['blockers'])}")
+
+        strategy = strategy or analysis['strategy']
+        # Caer al ALTER en el lugar bloquearía la tabla que el swap pedido debía proteger
+        if strategy == STRATEGY_SWAP and not analysis['swap_possible']:
+            raise Exception(f"No se puede usar la estrategia swap en {old_name}: "
+                            f"{'; '.join(analysis['swap_blockers'])}")
+        if strategy == STRATEGY_SWAP:
+            self.swap_column(old_name, new_data, analysis, batch_size or DEFAULT_ONLINE_BATCH_SIZE)
+            return STRATEGY_SWAP
+        # Con dependencias el ALTER directo fallaría: siempre se quitan y se recrean
+        self.alter_column_in_place(old_name, new_data, analysis)
+        return STRATEGY_ALTER_DEPENDENTS if analysis['strategy'] == STRATEGY_ALTER_DEPENDENTS else STRATEGY_ALTER
+
+    def alter_column_in_place(self, old_name, new_data, analysis):
+        """
+        ALTER COLUMN en una transacción. Los índices, estadísticas, CHECK y DEFAULT
+        que lo impedirían (analysis['drop']) se quitan antes y se recrean después.
+        """
+        schema, table = self.schema, self.table
+        cursor = self._cursor()
+        drop = analysis['drop']
+        index_names = [name for kind, name, _ in drop if kind == 'index']
+        indexes = []
+        if index_names:
+            definition = self.get_table_definition(cursor)
+            indexes = [index for index in definition.indexes if index.name in index_names]
+        old_default = next(((name, detail) for kind, name, detail in drop if kind == 'default'), None)
+        try:
+            cursor.execute("BEGIN TRANSACTION")
+
+            # 1. Quitar lo que depende de la columna (el clúster al final para no reconstruir los demás)
+            for kind, name, detail in drop:
+                if kind == 'check':
+                    cursor.execute(f"ALTER TABLE [{schema}].[{table}] DROP CONSTRAINT [{name}]")
+                elif kind == 'statistics':
+                    cursor.execute(f"DROP STATISTICS [{schema}].[{table}].[{name}]")
+            for index in sorted(indexes, key=lambda i: i.is_clustered):
+                cursor.execute(f"DROP INDEX [{index.name}] ON [{schema}].[{table}]")
+            if old_default or 'default' in new_data:
+                self._drop_default(cursor, old_name)
+
+            # 2. Alterar tipo de dato y nulabilidad
+            alter_sql = f"ALTER TABLE [{schema}].[{table}] ALTER COLUMN [{old_name}] {new_data['type']}"
+            alter_sql += " NULL" if new_data.get('nullable', True) else " NOT NULL"
+            
+            cursor.execute(alter_sql)
+            
+            # 3. Valor por defecto y dependencias
+            self._restore_default(cursor, old_name, new_data, old_default)
+            if indexes:
+                self.index_builder.build(self.connection, schema, table, indexes, in_transaction=True,
+                                         log=self.log, cancel=self.cancel, telemetry=self.telemetry)
+            for kind, name, detail in drop:
+                if kind == 'statistics':
+                    cursor.execute(f"CREATE STATISTICS [{name}] ON [{schema}].[{table}] ({detail})")
+                elif kind == 'check':
+                    cursor.execute(f"ALTER TABLE [{schema}].[{table}] ADD CONSTRAINT [{name}] CHECK {detail}")
+            
+            cursor.execute("COMMIT TRANSACTION")
+            self.connection.commit()
+            self.log(f"Columna {old_name} modificada exitosamente")
+
+        except Exception as e:
+            cursor.execute("ROLLBACK TRANSACTION")
+            self.log(f"Error al modificar columna {old_name}: {str(e)}", level=logging.ERROR)
+            raise
+
+    def swap_column(self, old_name, new_data, analysis, batch_size):
+        """
+        Cambia el tipo sin reescribir la tabla dentro de una sola transacción larga.
+        1. Agrega la columna nueva como NULL (solo metadatos) y un trigger que la mantiene
+           al día con los INSERT/UPDATE concurrentes.
+        2. Rellena la columna nueva por lotes de la clave única, confirmando cada lote.
+        3. (transacción corta) Quita el trigger y la columna vieja, renombra la nueva,
+           aplica NOT NULL y recrea el DEFAULT.
+        La columna queda al final de la tabla. Si se interrumpe, volver a ejecutarlo
+        continúa con las filas que falten.
+        """
+        schema, table = self.schema, self.table
+        new_name = f"{old_name}__new"
+        trigger = f"[{schema}].[TR_{table}_{old_name}_swap]"
+        cursor = self._cursor()
+
+        # Nombres entre corchetes como parámetros: un esquema o tabla con espacios o puntos
+        # daría NULL y al reanudar se intentaría agregar otra vez la columna
+        cursor.execute("SELECT COL_LENGTH(?, ?)", f"[{schema}].[{table}]", new_name)
+        if cursor.fetchone()[0] is None:
+            cursor.execute(f"ALTER TABLE [{schema}].[{table}] ADD [{new_name}] {new_data['type']} NULL")
+        cursor.execute("SELECT OBJECT_ID(?)", trigger)
+        if cursor.fetchone()[0] is not None:
+            cursor.execute(f"DROP TRIGGER {trigger}")
+        join = " AND ".join(f"t.[{k}] = i.[{k}]" for k in analysis['key'])
+        cursor.execute(f"""
+            CREATE TRIGGER {trigger} ON [{schema}].[{table}] AFTER INSERT, UPDATE AS
+            BEGIN
+                SET NOCOUNT ON;
+                IF NOT UPDATE([{old_name}]) RETURN;
+                UPDATE t SET [{new_name}] = CAST(i.[{old_name}] AS {new_data['type']})
+                FROM [{schema}].[{table}] t
+                JOIN inserted i ON {join};
+            END
+        """)
+        self.connection.commit()
+        self.log(f"Columna {new_name} creada, rellenando en lotes de {batch_size} filas...")
+
+        # Al reanudar solo faltan las filas que el trigger o un lote anterior no completaron
+        Backfill(self.connection, schema, table, new_name, f"CAST([{old_name}] AS {new_data['type']})", batch_size,
+                 condition=f"[{new_name}] IS NULL AND [{old_name}] IS NOT NULL",
+                 log=self.log, cancel=self.cancel, telemetry=self.telemetry, pacing=self.pacing).run()
+
+        old_default = next(((name, detail) for kind, name, detail in
+                            get_column_dependencies(cursor, schema, table, old_name) if kind == 'default'), None)
+        try:
+            cursor.execute("BEGIN TRANSACTION")
+            cursor.execute(f"DROP TRIGGER {trigger}")
+            self._drop_default(cursor, old_name)
+            cursor.execute(f"ALTER TABLE [{schema}].[{table}] DROP COLUMN [{old_name}]")
+            cursor.execute("EXEC sp_rename ?, ?, 'COLUMN'", f"[{schema}].[{table}].[{new_name}]", old_name)
+            if not new_data.get('nullable', True):
+                cursor.execute(f"ALTER TABLE [{schema}].[{table}] ALTER COLUMN [{old_name}] {new_data['type']} NOT NULL")
+            self._restore_default(cursor, old_name, new_data, old_default)
+            cursor.execute("COMMIT TRANSACTION")
+            self.connection.commit()
+        except Exception as e:
+            cursor.execute("ROLLBACK TRANSACTION")
+            self.log(f"Error al intercambiar la columna {old_name}: {str(e)}", level=logging.ERROR)
+            raise
+        self.log(f"Columna {old_name} modificada exitosamente (el espacio de la columna anterior "
+                 f"se libera al reconstruir la tabla)")
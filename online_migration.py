@@ -0,0 +1,314 @@
+import re
+import logging
+
+from progress import NULL_PROGRESS
+from telemetry import NULL_TELEMETRY
+from index_builder import SERIAL_INDEX_BUILDER
+from journal import NULL_JOURNAL
+from pacing import NULL_PACING
+from batch_copy import (BatchCopier, ensure_checkpoint_table, clear_checkpoint, get_copy_key,
+                        _object_name)
+
+_CONSTRAINT_NAME = re.compile(r"ADD CONSTRAINT \[([^\]]+)\]")
+
+
+class OnlineMigration:
+    """
+    Migración "en línea" a una tabla sombra:
+    1. Crea [tabla_SHADOW] con el nuevo diseño, una tabla de cambios [tabla_CHANGES]
+       y un trigger sobre la original que registra las claves modificadas.
+    2. Copia los datos por lotes (reanudable) y construye índices y constraints en la sombra.
+    3. Aplica los cambios capturados hasta que quedan pocos pendientes.
+    4. Bajo un bloqueo exclusivo breve aplica el resto y hace el intercambio con sp_rename.
+    Los escritores solo quedan bloqueados durante el paso 4.
+    """
+
+    SHADOW_SUFFIX = "_SHADOW"
+    CHANGES_SUFFIX = "_CHANGES"
+    OLD_SUFFIX = "_OLD"
+
+    def __init__(self, connection, schema, table, new_create_table, indexes, create_constraint,
+                 create_fk, referencing_fks, table_permissions, batch_size, log=None, cancel=None,
+                 telemetry=None, progress=None, index_builder=None, engine_edition=None, journal=None,
+                 finish_journal=None, pacing=None):
+        self.connection = connection
+        self.schema = schema
+        self.table = table
+        self.new_create_table = new_create_table
+        self.indexes = indexes
+        self.create_constraint = create_constraint
+        self.create_fk = create_fk
+        self.referencing_fks = referencing_fks
+        self.table_permissions = table_permissions
+        self.batch_size = batch_size
+        self.log = log or (lambda message, level=logging.INFO: logging.log(level, message))
+        self.cancel = cancel
+        self.telemetry = telemetry or NULL_TELEMETRY
+        self.progress = progress or NULL_PROGRESS
+        self.index_builder = index_builder or SERIAL_INDEX_BUILDER
+        self.engine_edition = engine_edition
+        self.journal = journal or NULL_JOURNAL
+        # Cierra el diario dentro de la transacción de limpieza (el llamador puede dejarlo abierto)
+        self.finish_journal = finish_journal or (lambda: self.journal.finish(commit=False))
+        self.pacing = pacing or NULL_PACING
+
+        self.shadow = f"{table}{self.SHADOW_SUFFIX}"
+        self.changes = f"{table}{self.CHANGES_SUFFIX}"
+        self.trigger = f"TR_{table}{self.CHANGES_SUFFIX}"
+
+    def _name(self, table):
+        return _object_name((self.schema, table))
+
+    def _exists(self, cursor, table):
+        cursor.execute("SELECT OBJECT_ID(?)", self._name(table))
+        return cursor.fetchone()[0] is not None
+
+    def _shadow_script(self, script):
+        """
+        Redirige un script 'ALTER TABLE [s].[t] ADD CONSTRAINT [x]' a la sombra
+        con nombre temporal (también el NOCHECK CONSTRAINT que le sigue si estaba
+        deshabilitada). Devuelve el script y el nombre temporal.
+        """
+        script = script.replace(f"ALTER TABLE {self._name(self.table)}", f"ALTER TABLE {self._name(self.shadow)}")
+        match = _CONSTRAINT_NAME.search(script)
+        if not match:
+            return script, None
+        name = f"{match.group(1)}{self.SHADOW_SUFFIX}"
+        return script.replace(f"CONSTRAINT [{match.group(1)}]", f"CONSTRAINT [{name}]"), name
+
+    def run(self):
+        cursor = self.connection.cursor()
+        if self.cancel:
+            self.cancel.track(cursor)
+
+        # Tras el intercambio la tabla ya es la nueva: solo queda la limpieza
+        if self.journal.done('swap'):
+            self.log("El intercambio ya se había completado, terminando la limpieza...", level=logging.WARNING)
+            with self.telemetry.phase('cleanup'):
+                self.cleanup(cursor)
+            return
+
+        self.key = get_copy_key(cursor, self.schema, self.table, unique_only=True)
+        if not self.key:
+            raise Exception(f"El modo en línea requiere una clave única sin NULLs en {self.schema}.{self.table}")
+
+        # Las columnas calculadas y rowversion no admiten valores explícitos
+        cursor.execute("""
+            SELECT STRING_AGG(QUOTENAME(c.name), ', ') FROM sys.columns c
+            JOIN sys.types tp ON c.user_type_id = tp.user_type_id
+            WHERE c.object_id = OBJECT_ID(?) AND c.is_computed = 0 AND tp.name <> 'timestamp'
+        """, self._name(self.table))
+        self.columns_list = cursor.fetchone()[0]
+        cursor.execute("SELECT COUNT(*) FROM sys.columns WHERE object_id = OBJECT_ID(?) AND is_identity = 1",
+                       self._name(self.table))
+        self.has_identity = cursor.fetchone()[0] > 0
+
+        ensure_checkpoint_table(cursor)
+        self.connection.commit()
+
+        if self._exists(cursor, self.shadow):
+            self.log(f"La tabla sombra {self.shadow} ya existe, reanudando migración en línea...", level=logging.WARNING)
+        else:
+            with self.telemetry.phase('prepare'):
+                self.prepare(cursor)
+            self.journal.record('prepare')
+
+        if not self.journal.done('copy_back'):
+            cursor.execute("""
+                SELECT ISNULL(SUM(rows), 0) FROM sys.partitions WHERE object_id = OBJECT_ID(?) AND index_id IN (0, 1)
+            """, self._name(self.table))
+            total_rows = cursor.fetchone()[0]
+            self.connection.commit()
+            with self.telemetry.phase('copy_back') as phase, \
+                    self.progress.watch(self.connection, (self.schema, self.shadow), total_rows):
+                phase.rows = self.backfill()
+            self.journal.record('copy_back', rows=phase.rows)
+        if not self.journal.done('index_rebuild'):
+            with self.telemetry.phase('index_rebuild'):
+                self.build_shadow_objects(cursor)
+            self.journal.record('index_rebuild')
+
+        # Ponerse al día hasta que el resto quepa en un lote; la marca se guarda con cada lote aplicado
+        last_change = (self.journal.high_water('catch_up') or [0])[0]
+        with self.telemetry.phase('catch_up') as phase:
+            phase.rows = 0
+            while True:
+                if self.cancel:
+                    self.cancel.check()
+                self.pacing.wait(self.cancel)
+                last_change, applied = self.apply_changes(cursor, last_change)
+                self.journal.record('catch_up', rows=phase.rows + applied, high_water=[last_change], commit=False)
+                self.connection.commit()
+                phase.rows += applied
+                self.log(f"Cambios concurrentes aplicados: {applied}")
+                if applied < self.batch_size:
+                    break
+
+        with self.telemetry.phase('swap'):
+            self.swap(cursor, last_change)
+        with self.telemetry.phase('cleanup'):
+            self.cleanup(cursor)
+
+    def prepare(self, cursor):
+        """Crea la tabla sombra, la tabla de cambios y el trigger de captura"""
+        key_cols = ", ".join(f"[{k}]" for k in self.key)
+
+        cursor.execute("""
+            SELECT name FROM sys.key_constraints WHERE parent_object_id = OBJECT_ID(?) AND type = 'PK'
+        """, self._name(self.table))
+        pk = cursor.fetchone()
+
+        shadow_ddl = self.new_create_table.replace(f"CREATE TABLE {self._name(self.table)}",
+                                                   f"CREATE TABLE {self._name(self.shadow)}", 1)
+        if pk:
+            shadow_ddl = shadow_ddl.replace(f"CONSTRAINT [{pk.name}]", f"CONSTRAINT [{pk.name}{self.SHADOW_SUFFIX}]", 1)
+
+        cursor.execute("BEGIN TRANSACTION")
+        try:
+            self.log(f"Creando tabla sombra {self.shadow}...")
+            cursor.execute(shadow_ddl)
+
+            # UNION ALL evita heredar la propiedad IDENTITY de la clave
+            self.log(f"Creando tabla de cambios {self.changes}...")
+            cursor.execute(f"""
+                SELECT TOP (0) {key_cols} INTO {self._name(self.changes)} FROM {self._name(self.table)}
+                UNION ALL
+                SELECT TOP (0) {key_cols} FROM {self._name(self.table)}
+            """)
+            cursor.execute(f"ALTER TABLE {self._name(self.changes)} ADD change_id BIGINT IDENTITY(1,1) NOT NULL PRIMARY KEY")
+
+            self.log("Creando trigger de captura de cambios...")
+            cursor.execute(f"""
+                CREATE TRIGGER [{self.schema}].[{self.trigger}] ON {self._name(self.table)}
+                AFTER INSERT, UPDATE, DELETE
+                AS
+                BEGIN
+                    SET NOCOUNT ON;
+                    INSERT INTO {self._name(self.changes)} ({key_cols})
+                    SELECT {key_cols} FROM inserted
+                    UNION
+                    SELECT {key_cols} FROM deleted;
+                END
+            """)
+            cursor.execute("COMMIT TRANSACTION")
+            self.connection.commit()
+        except Exception:
+            cursor.execute("ROLLBACK TRANSACTION")
+            raise
+
+    def backfill(self):
+        self.log(f"Copiando datos a la tabla sombra en lotes de {self.batch_size} filas...")
+        copier = BatchCopier(self.connection, (self.schema, self.table), (self.schema, self.shadow),
+                             self.columns_list, self.key, self.batch_size,
+                             identity_insert=self.has_identity, log=self.log, cancel=self.cancel, pacing=self.pacing)
+        rows = copier.run()
+        self.log(f"Copia inicial completada: {rows} filas")
+        return rows
+
+    def build_shadow_objects(self, cursor):
+        """Índices, CHECK y FK salientes se crean en la sombra antes del intercambio"""
+        existing = set()
+        cursor.execute("SELECT name FROM sys.objects WHERE parent_object_id = OBJECT_ID(?)", self._name(self.shadow))
+        existing.update(row.name for row in cursor.fetchall())
+
+        # Nadie lee la sombra todavía: los índices se crean sin ONLINE, en paralelo si se configuró
+        self.log("Creando índices en la tabla sombra...")
+        self.index_builder.build(self.connection, self.schema, self.shadow, self.indexes, self.engine_edition,
+                                 in_transaction=False, allow_online=False, log=self.log, cancel=self.cancel,
+                                 telemetry=self.telemetry, pacing=self.pacing)
+
+        self.log("Creando constraints CHECK y FK en la tabla sombra...")
+        for script in self.create_constraint + self.create_fk:
+            # Las FK a sí misma se tratan como entrantes y se recrean tras el intercambio
+            if f"REFERENCES {self._name(self.table)} " in script:
+                continue
+            shadow_script, name = self._shadow_script(script)
+            if name in existing:
+                continue
+            cursor.execute(shadow_script)
+            self.connection.commit()
+
+    def apply_changes(self, cursor, last_change, upper=None):
+        """Reaplica en la sombra las filas cuyas claves cambiaron desde last_change"""
+        if upper is None:
+            cursor.execute(f"SELECT ISNULL(MAX(change_id), 0) FROM {self._name(self.changes)}")
+            upper = cursor.fetchone()[0]
+        if upper <= last_change:
+            return last_change, 0
+
+        match = " AND ".join(f"c.[{k}] = t.[{k}]" for k in self.key)
+        in_range = "c.change_id > ? AND c.change_id <= ?"
+
+        cursor.execute(f"""
+            DELETE t FROM {self._name(self.shadow)} t
+            WHERE EXISTS (SELECT 1 FROM {self._name(self.changes)} c WHERE {in_range} AND {match})
+        """, last_change, upper)
+
+        if self.has_identity:
+            cursor.execute(f"SET IDENTITY_INSERT {self._name(self.shadow)} ON")
+        cursor.execute(f"""
+            INSERT INTO {self._name(self.shadow)} ({self.columns_list})
+            SELECT {self.columns_list} FROM {self._name(self.table)} t
+            WHERE EXISTS (SELECT 1 FROM {self._name(self.changes)} c WHERE {in_range} AND {match})
+        """, last_change, upper)
+        if self.has_identity:
+            cursor.execute(f"SET IDENTITY_INSERT {self._name(self.shadow)} OFF")
+
+        return upper, upper - last_change
+
+    def swap(self, cursor, last_change):
+        """Bloqueo exclusivo breve: últimos cambios, intercambio de nombres y FK entrantes"""
+        old = f"{self.table}{self.OLD_SUFFIX}"
+
+        self.log("Intercambiando tablas (bloqueo exclusivo)...")
+        cursor.execute("BEGIN TRANSACTION")
+        try:
+            # TOP (0) no llega a abrir la tabla y no tomaría el bloqueo: hay que leer una fila.
+            # DROP TRIGGER (Sch-M) además frena toda escritura hasta el COMMIT, así que
+            # después de él ya no puede aparecer un cambio que el trigger no registre
+            cursor.execute(f"SELECT TOP (1) 1 FROM {self._name(self.table)} WITH (TABLOCKX, HOLDLOCK)")
+            cursor.execute(f"DROP TRIGGER [{self.schema}].[{self.trigger}]")
+            self.apply_changes(cursor, last_change)
+
+            for fk in self.referencing_fks:
+                cursor.execute(fk.drop_script)
+
+            cursor.execute(f"EXEC sp_rename '{self.schema}.{self.table}', '{old}'")
+            cursor.execute(f"EXEC sp_rename '{self.schema}.{self.shadow}', '{self.table}'")
+            cursor.execute(f"DROP TABLE {self._name(old)}")
+
+            # Devolver a las constraints de la sombra sus nombres definitivos
+            cursor.execute("""
+                SELECT name FROM sys.objects
+                WHERE parent_object_id = OBJECT_ID(?) AND name LIKE ? ESCAPE '\\'
+            """, self._name(self.table), '%' + self.SHADOW_SUFFIX.replace('_', '\\_'))
+            for row in cursor.fetchall():
+                cursor.execute(f"EXEC sp_rename '{self.schema}.{row.name}', '{row.name[:-len(self.SHADOW_SUFFIX)]}', 'OBJECT'")
+
+            # FK entrantes sin validar dentro del bloqueo; se validan después
+            for fk in self.referencing_fks:
+                cursor.execute(fk.create_script.replace("] ADD CONSTRAINT [", "] WITH NOCHECK ADD CONSTRAINT [", 1))
+
+            for perm in self.table_permissions:
+                cursor.execute(perm.grant_script)
+
+            self.journal.record('swap', commit=False)
+            cursor.execute("COMMIT TRANSACTION")
+            self.connection.commit()
+        except Exception:
+            cursor.execute("ROLLBACK TRANSACTION")
+            raise
+
+    def cleanup(self, cursor):
+        self.log("Validando claves foráneas entrantes...")
+        # Las que ya no eran confiables o estaban deshabilitadas quedan como estaban
+        for fk in self.referencing_fks:
+            if fk.is_not_trusted or fk.is_disabled:
+                continue
+            cursor.execute(f"ALTER TABLE [{fk.schema_name}].[{fk.table_name}] WITH CHECK CHECK CONSTRAINT [{fk.constraint_name}]")
+
+        cursor.execute(f"DROP TABLE {self._name(self.changes)}")
+        clear_checkpoint(cursor, (self.schema, self.table), (self.schema, self.shadow))
+        self.finish_journal()
+        self.connection.commit()
+        self.log("Migración en línea completada")
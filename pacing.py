@@ -0,0 +1,295 @@
+import time
+import logging
+import threading
+from collections import namedtuple
+
+import pyodbc
+
+from connection_pool import PURPOSE_MONITOR, PoolTimeout, get_pool
+
+# Límites por defecto; None desactiva el límite
+DEFAULT_MAX_LOG_SEND_QUEUE_KB = 256 * 1024
+DEFAULT_MAX_REDO_QUEUE_KB = 512 * 1024
+DEFAULT_MAX_LOG_PERCENT = 70.0
+DEFAULT_MAX_BLOCKED_MS = 5000
+
+DEFAULT_PAUSE_SECONDS = 5.0
+DEFAULT_MIN_BATCH_SIZE = 1000
+DEFAULT_BLOCKING_INTERVAL = 0.5
+
+# Por debajo de esta fracción de todos los límites el lote vuelve a crecer
+_RELAXED = 0.5
+_GROWTH = 1.25
+
+Metrics = namedtuple('Metrics', ['log_send_queue_kb', 'redo_queue_kb', 'log_percent', 'blocked_sessions',
+                                 'blocked_ms'])
+
+PacingLimits = namedtuple('PacingLimits', ['max_log_send_queue_kb', 'max_redo_queue_kb', 'max_log_percent',
+                                           'max_blocked_ms'])
+
+DEFAULT_LIMITS = PacingLimits(DEFAULT_MAX_LOG_SEND_QUEUE_KB, DEFAULT_MAX_REDO_QUEUE_KB, DEFAULT_MAX_LOG_PERCENT,
+                              DEFAULT_MAX_BLOCKED_MS)
+
+
+def is_in_availability_group(cursor):
+    """La base actual tiene réplicas en un grupo de disponibilidad"""
+    try:
+        cursor.execute("SELECT COUNT(*) FROM sys.dm_hadr_database_replica_states WHERE database_id = DB_ID()")
+        return cursor.fetchone()[0] > 0
+    except pyodbc.Error:
+        return False
+
+
+class BlockingSampler(threading.Thread):
+    """
+    Muestrea desde una sesión de seguimiento del pool las sesiones bloqueadas por las
+    de la migración mientras corre un lote: entre lotes la migración ya confirmó y no
+    tiene bloqueos, así que medirlo desde su propia sesión nunca vería nada. Guarda el
+    peor valor visto hasta que take() lo lee y lo reinicia.
+    """
+
+    def __init__(self, conn_str, interval=DEFAULT_BLOCKING_INTERVAL):
+        super().__init__(daemon=True, name="blocking-sampler")
+        self.conn_str = conn_str
+        self.interval = interval
+        self.spids = set()
+        self.blocked_sessions = 0
+        self.blocked_ms = None
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+    def watch(self, spid):
+        with self.lock:
+            self.spids.add(spid)
+
+    def unwatch(self, spid):
+        with self.lock:
+            self.spids.discard(spid)
+
+    def take(self):
+        """Peor bloqueo desde la última lectura: (sesiones bloqueadas, espera máxima en ms)"""
+        with self.lock:
+            worst = (self.blocked_sessions, self.blocked_ms)
+            self.blocked_sessions, self.blocked_ms = 0, None
+        return worst
+
+    def run(self):
+        try:
+            pool = get_pool(self.conn_str)
+            pooled = pool.acquire(PURPOSE_MONITOR)
+        except (pyodbc.Error, PoolTimeout) as e:
+            logging.warning(f"No se pudo abrir la conexión de muestreo de bloqueos: {str(e)}")
+            return
+        try:
+            cursor = pooled.cursor()
+            while not self.stop_event.wait(self.interval):
+                with self.lock:
+                    spids = list(self.spids)
+                if not spids:
+                    continue
+                cursor.execute(f"""
+                    SELECT COUNT(*) AS blocked_sessions, MAX(wait_time) AS blocked_ms
+                    FROM sys.dm_exec_requests
+                    WHERE blocking_session_id IN ({', '.join('?' * len(spids))})
+                """, *spids)
+                row = cursor.fetchone()
+                pooled.connection.commit()
+                with self.lock:
+                    self.blocked_sessions = max(self.blocked_sessions, row.blocked_sessions or 0)
+                    if row.blocked_ms is not None:
+                        self.blocked_ms = max(self.blocked_ms or 0, row.blocked_ms)
+        except pyodbc.Error as e:
+            logging.warning(f"Muestreo de bloqueos detenido: {str(e)}")
+        finally:
+            pool.release(pooled)
+
+    def stop(self):
+        self.stop_event.set()
+
+
+class SqlMetricsSource:
+    """
+    Métricas leídas de las DMV (requiere VIEW SERVER STATE): colas de envío y de redo
+    de las secundarias del AG y porcentaje de log usado, con la conexión de la migración
+    entre lotes, y el peor bloqueo causado durante el lote por la sesión de la migración
+    y las de sus trabajadores (watch), muestreado por un BlockingSampler. Sin conn_str
+    no hay sesión de seguimiento y el límite de bloqueos no se aplica.
+    """
+
+    def __init__(self, connection, conn_str=None, interval=DEFAULT_BLOCKING_INTERVAL):
+        self.connection = connection
+        self.conn_str = conn_str
+        self.interval = interval
+        self.sampler = None
+
+    def _start_sampler(self):
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT @@SPID")
+        spid = cursor.fetchone()[0]
+        self.sampler = BlockingSampler(self.conn_str, self.interval)
+        self.sampler.watch(spid)
+        self.sampler.start()
+
+    def sample(self):
+        if self.conn_str and self.sampler is None:
+            self._start_sampler()
+        cursor = self.connection.cursor()
+        cursor.execute("""
+            SELECT (SELECT MAX(log_send_queue_size) FROM sys.dm_hadr_database_replica_states
+                    WHERE database_id = DB_ID() AND is_local = 0) AS log_send_queue_kb,
+                   (SELECT MAX(redo_queue_size) FROM sys.dm_hadr_database_replica_states
+                    WHERE database_id = DB_ID() AND is_local = 0) AS redo_queue_kb,
+                   (SELECT used_log_space_in_percent FROM sys.dm_db_log_space_usage) AS log_percent
+        """)
+        row = cursor.fetchone()
+        self.connection.commit()
+        blocked_sessions, blocked_ms = self.sampler.take() if self.sampler else (0, None)
+        return Metrics(row.log_send_queue_kb, row.redo_queue_kb, row.log_percent, blocked_sessions, blocked_ms)
+
+    def watch(self, spid):
+        if self.sampler:
+            self.sampler.watch(spid)
+
+    def unwatch(self, spid):
+        if self.sampler:
+            self.sampler.unwatch(spid)
+
+    def close(self):
+        if self.sampler:
+            self.sampler.stop()
+            self.sampler = None
+
+
+class PacingController:
+    """
+    Ritmo de los pasos masivos (copia por lotes, relleno, puesta al día e índices).
+    Antes de cada lote mide la fuente de métricas: si algún valor supera su límite,
+    reduce el lote a la mitad y espera hasta que todo vuelva bajo los límites; con
+    holgura (menos de la mitad de cada límite) el lote crece de nuevo hasta el pedido.
+    source es cualquier objeto con sample() que devuelva Metrics, así que las
+    decisiones pueden probarse con una fuente simulada; sleep y clock también se inyectan.
+    watch/unwatch agregan las sesiones de los trabajadores (índices, particiones) a la
+    medición de bloqueos si la fuente la hace, y close() la detiene al terminar.
+    """
+
+    def __init__(self, source, limits=None, min_batch_size=DEFAULT_MIN_BATCH_SIZE, pause=DEFAULT_PAUSE_SECONDS,
+                 log=None, sleep=time.sleep, clock=time.monotonic):
+        self.source = source
+        self.limits = limits or DEFAULT_LIMITS
+        self.min_batch_size = min_batch_size
+        self.pause = pause
+        self.log = log or (lambda message, level=logging.INFO: logging.log(level, message))
+        self.sleep = sleep
+        self.clock = clock
+        self.enabled = True
+        self.current = None
+        self.paused_seconds = 0.0
+        self.pauses = 0
+        self.last_metrics = None
+        # Los índices en paralelo consultan desde varios hilos con la misma conexión
+        self.lock = threading.Lock()
+
+    def _sample(self):
+        try:
+            self.last_metrics = self.source.sample()
+        except pyodbc.Error as e:
+            self.enabled = False
+            self.log(f"No se pueden leer las métricas de ritmo, se continúa sin regular: {str(e)}",
+                     level=logging.WARNING)
+            return None
+        return self.last_metrics
+
+    def pressure(self, metrics):
+        """Mayor cociente valor/límite y la descripción de los que se pasan"""
+        checks = (
+            (metrics.log_send_queue_kb, self.limits.max_log_send_queue_kb,
+             lambda v: f"cola de envío del AG de {v / 1024:.0f} MB"),
+            (metrics.redo_queue_kb, self.limits.max_redo_queue_kb,
+             lambda v: f"cola de redo del AG de {v / 1024:.0f} MB"),
+            (metrics.log_percent, self.limits.max_log_percent, lambda v: f"log al {v:.0f}%"),
+            (metrics.blocked_ms if metrics.blocked_sessions else None, self.limits.max_blocked_ms,
+             lambda v: f"{metrics.blocked_sessions} sesiones bloqueadas ({v / 1000:.0f}s)"),
+        )
+        worst = 0.0
+        exceeded = []
+        for value, limit, describe in checks:
+            if value is None or not limit:
+                continue
+            ratio = value / limit
+            worst = max(worst, ratio)
+            if ratio > 1:
+                exceeded.append(describe(value))
+        return worst, exceeded
+
+    def wait(self, cancel=None):
+        """Espera mientras algún límite esté excedido; devuelve la presión de la última medición"""
+        with self.lock:
+            return self._wait(cancel)
+
+    def _wait(self, cancel):
+        while self.enabled:
+            metrics = self._sample()
+            if metrics is None:
+                return 0.0
+            worst, exceeded = self.pressure(metrics)
+            if not exceeded:
+                return worst
+            if self.current is not None:
+                self.current = max(self.min_batch_size, self.current // 2)
+            self.log(f"Pausa de {self.pause:.0f}s: {', '.join(exceeded)}", level=logging.WARNING)
+            if cancel:
+                cancel.check()
+            self.pauses += 1
+            started = self.clock()
+            self.sleep(self.pause)
+            self.paused_seconds += self.clock() - started
+        return 0.0
+
+    def watch(self, spid):
+        if hasattr(self.source, 'watch'):
+            self.source.watch(spid)
+
+    def unwatch(self, spid):
+        if hasattr(self.source, 'unwatch'):
+            self.source.unwatch(spid)
+
+    def close(self):
+        if hasattr(self.source, 'close'):
+            self.source.close()
+
+    def batch_size(self, requested, cancel=None):
+        """Tamaño del próximo lote, como máximo requested; puede esperar antes de devolverlo"""
+        if self.current is None or self.current > requested:
+            self.current = requested
+        pauses = self.pauses
+        worst = self.wait(cancel)
+        if not self.enabled:
+            return requested
+        # Después de una pausa se arranca con el lote reducido; crece en los siguientes
+        if self.pauses == pauses and worst < _RELAXED and self.current < requested:
+            self.current = min(requested, int(self.current * _GROWTH) + 1)
+        return self.current
+
+
+class NullPacing:
+    """Sin regulación: lotes del tamaño pedido y sin pausas"""
+
+    paused_seconds = 0.0
+
+    def wait(self, cancel=None):
+        return 0.0
+
+    def batch_size(self, requested, cancel=None):
+        return requested
+
+    def watch(self, spid):
+        pass
+
+    def unwatch(self, spid):
+        pass
+
+    def close(self):
+        pass
+
+
+NULL_PACING = NullPacing()
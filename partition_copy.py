@@ -0,0 +1,423 @@
+import time
+import logging
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import replace
+
+from batch_copy import BatchCopier, clear_checkpoint, get_copy_key
+from connection_pool import PURPOSE_DDL, get_pool
+from index_builder import IndexBuilder
+from journal import NULL_JOURNAL
+from pacing import NULL_PACING
+from telemetry import NULL_TELEMETRY
+
+# Sufijo de las tablas de staging de cada partición (se excluyen de los lotes)
+STAGING_SUFFIX = '_STAGING'
+
+_NUMERIC_TYPES = ('tinyint', 'smallint', 'int', 'bigint', 'decimal', 'numeric', 'float', 'real', 'money',
+                  'smallmoney', 'bit')
+_TEXT_TYPES = ('char', 'varchar', 'nchar', 'nvarchar')
+_BINARY_TYPES = ('binary', 'varbinary')
+
+# Tabla particionada: función, esquema, columna y sentido de los límites
+_LAYOUT_QUERY = """
+SELECT pf.name AS function_name, ps.name AS scheme_name, pf.boundary_value_on_right, c.name AS column_name
+FROM sys.indexes i
+JOIN sys.partition_schemes ps ON ps.data_space_id = i.data_space_id
+JOIN sys.partition_functions pf ON pf.function_id = ps.function_id
+JOIN sys.index_columns ic ON ic.object_id = i.object_id AND ic.index_id = i.index_id AND ic.partition_ordinal = 1
+JOIN sys.columns c ON c.object_id = ic.object_id AND c.column_id = ic.column_id
+WHERE i.object_id = OBJECT_ID(?) AND i.index_id IN (0, 1)
+"""
+
+# Conversión de un límite (sql_variant) a texto sin pérdida, con el estilo de su propio tipo:
+# cada fecha con estilo 126 en su tipo (pasar un datetime por datetime2 da 7 decimales que
+# CONVERT(datetime, ...) rechaza), float/real con estilo 3 (17 dígitos) y money con estilo 2
+# (4 decimales); el estilo 0 redondea y el CHECK del staging no coincidiría con el límite real
+_BOUNDARY_STYLES = (
+    ('datetimeoffset', 'DATETIMEOFFSET', 126),
+    ('datetime2', 'DATETIME2', 126),
+    ('datetime', 'DATETIME', 126),
+    ('smalldatetime', 'SMALLDATETIME', 126),
+    ('date', 'DATE', 126),
+    ('binary', 'VARBINARY(8000)', 1),
+    ('varbinary', 'VARBINARY(8000)', 1),
+    ('float', 'FLOAT', 3),
+    ('real', 'FLOAT', 3),
+    ('money', 'MONEY', 2),
+    ('smallmoney', 'MONEY', 2),
+)
+
+
+def _boundary_text_sql(value):
+    base_type = f"CAST(SQL_VARIANT_PROPERTY({value}, 'BaseType') AS sysname)"
+    cases = "\n".join(f"            WHEN '{name}' THEN CONVERT(NVARCHAR(4000), CONVERT({target}, {value}), {style})"
+                      for name, target, style in _BOUNDARY_STYLES)
+    return f"CASE {base_type}\n{cases}\n            ELSE CONVERT(NVARCHAR(4000), {value}) END"
+
+
+# Cada partición con sus filas, filegroup, compresión y límites como texto
+_PARTITIONS_QUERY = f"""
+SELECT p.partition_number, p.rows, p.data_compression_desc, fg.name AS filegroup_name,
+       CAST(SQL_VARIANT_PROPERTY(lo.value, 'BaseType') AS sysname) AS boundary_type,
+       {_boundary_text_sql('lo.value')} AS lower_value,
+       CAST(SQL_VARIANT_PROPERTY(hi.value, 'BaseType') AS sysname) AS upper_type,
+       {_boundary_text_sql('hi.value')} AS upper_value
+FROM sys.partitions p
+JOIN sys.indexes i ON i.object_id = p.object_id AND i.index_id = p.index_id
+JOIN sys.partition_schemes ps ON ps.data_space_id = i.data_space_id
+JOIN sys.destination_data_spaces dds ON dds.partition_scheme_id = ps.data_space_id
+    AND dds.destination_id = p.partition_number
+JOIN sys.filegroups fg ON fg.data_space_id = dds.data_space_id
+LEFT JOIN sys.partition_range_values lo ON lo.function_id = ps.function_id AND lo.boundary_id = p.partition_number - 1
+LEFT JOIN sys.partition_range_values hi ON hi.function_id = ps.function_id AND hi.boundary_id = p.partition_number
+WHERE p.object_id = OBJECT_ID(?) AND p.index_id IN (0, 1)
+ORDER BY p.partition_number
+"""
+
+Partition = namedtuple('Partition', ['number', 'rows', 'compression', 'filegroup', 'lower', 'upper'])
+
+
+def boundary_literal(value, base_type):
+    """Literal T-SQL determinista de un límite de partición leído como texto"""
+    if value is None:
+        return None
+    if base_type in _NUMERIC_TYPES:
+        return value
+    if base_type in _BINARY_TYPES:
+        return value
+    if base_type in _TEXT_TYPES:
+        return "N'" + value.replace("'", "''") + "'"
+    if base_type == 'time':
+        return f"CONVERT(time, N'{value}')"
+    # Fechas con estilo 126 (ISO 8601) para que el CHECK no dependa del idioma de la sesión
+    return f"CONVERT({base_type}, N'{value}', 126)"
+
+
+class PartitionLayout:
+    """Función, esquema y columna de partición de una tabla, con sus particiones en orden"""
+
+    def __init__(self, function, scheme, column, range_right, partitions):
+        self.function = function
+        self.scheme = scheme
+        self.column = column
+        self.range_right = range_right
+        self.partitions = partitions
+
+    @property
+    def total_rows(self):
+        return sum(p.rows for p in self.partitions)
+
+    def filter_sql(self, number):
+        """Predicado de las filas de una partición (con eliminación de particiones)"""
+        return f"$PARTITION.[{self.function}]([{self.column}]) = {int(number)}"
+
+    def range_sql(self, partition):
+        """
+        CHECK equivalente a la partición, necesario para SWITCH: con RANGE RIGHT el
+        límite inferior es inclusivo y el superior exclusivo; con RANGE LEFT al revés.
+        Los NULL van siempre a la primera partición.
+        """
+        column = f"[{self.column}]"
+        lower_op, upper_op = ('>=', '<') if self.range_right else ('>', '<=')
+        conditions = []
+        if partition.lower is not None:
+            conditions.append(f"{column} {lower_op} {partition.lower}")
+        if partition.upper is not None:
+            conditions.append(f"{column} {upper_op} {partition.upper}")
+        if not conditions:
+            return "(1 = 1)"
+        if partition.number == 1:
+            return f"({column} IS NULL OR {' AND '.join(conditions)})"
+        return f"({column} IS NOT NULL AND {' AND '.join(conditions)})"
+
+
+def is_partitioned(cursor, schema, table):
+    """El heap o el índice clúster de la tabla está sobre un esquema de partición"""
+    cursor.execute("""
+        SELECT COUNT(*) FROM sys.indexes i
+        JOIN sys.data_spaces ds ON ds.data_space_id = i.data_space_id
+        WHERE i.object_id = OBJECT_ID(?) AND i.index_id IN (0, 1) AND ds.type = 'PS'
+    """, f"[{schema}].[{table}]")
+    return cursor.fetchone()[0] > 0
+
+
+def get_partition_layout(cursor, schema, table):
+    """Particiones de la tabla (filas, filegroup, compresión y límites); None si no está particionada"""
+    name = f"[{schema}].[{table}]"
+    cursor.execute(_LAYOUT_QUERY, name)
+    row = cursor.fetchone()
+    if not row:
+        return None
+    function, scheme, range_right, column = (row.function_name, row.scheme_name, bool(row.boundary_value_on_right),
+                                             row.column_name)
+    cursor.execute(_PARTITIONS_QUERY, name)
+    partitions = [Partition(r.partition_number, r.rows or 0, r.data_compression_desc, r.filegroup_name,
+                            boundary_literal(r.lower_value, r.boundary_type),
+                            boundary_literal(r.upper_value, r.upper_type))
+                  for r in cursor.fetchall()]
+    return PartitionLayout(function, scheme, column, range_right, partitions)
+
+
+def partition_checkpoint(source, number):
+    """Clave del checkpoint de la copia por lotes de una partición"""
+    schema, table = source
+    return (schema, f"{table}:p{int(number)}")
+
+
+class PartitionCopier:
+    """
+    Copia una tabla particionada partición por partición, en workers sesiones del pool.
+    Cada partición se confirma por separado y queda en el diario como 'partition:N',
+    así que una copia interrumpida sigue con las particiones que faltan:
+    - Por defecto se inserta directamente en la partición del destino; con batch_size
+      la partición se copia por lotes de la clave clúster con su propio checkpoint.
+    - Con switch cada partición se carga en una tabla de staging en su filegroup
+      (INSERT con TABLOCK, índices y CHECK del rango) y entra al destino con
+      ALTER TABLE ... SWITCH, que solo cambia metadatos. Requiere que todos los
+      índices estén alineados con el esquema de partición.
+    """
+
+    def __init__(self, conn_str=None, workers=1, switch=False):
+        self.conn_str = conn_str
+        self.workers = max(1, workers)
+        self.switch = switch
+
+    def copy(self, connection, source, target, layout, columns_list, batch_size=0, identity_insert=False,
+             create_staging=None, indexes=(), switch=None, log=None, cancel=None, telemetry=None, pacing=None,
+             journal=None, index_builder=None):
+        """
+        Copia todas las particiones de source a target; devuelve el total de filas.
+        create_staging(name) devuelve el CREATE TABLE de una tabla de staging sin
+        almacenamiento; indexes son los índices que también se crean en el staging.
+        """
+        log = log or (lambda message, level=logging.INFO: logging.log(level, message))
+        telemetry = telemetry or NULL_TELEMETRY
+        pacing = pacing or NULL_PACING
+        journal = journal or NULL_JOURNAL
+        switch = self.switch if switch is None else switch
+
+        pending = []
+        rows_done = 0
+        for partition in layout.partitions:
+            step = f"partition:{partition.number}"
+            if journal.done(step):
+                rows_done += journal.rows(step) or 0
+            else:
+                pending.append(partition)
+        total = len(layout.partitions)
+        if len(pending) < total:
+            log(f"{total - len(pending)} de {total} particiones ya estaban copiadas, se continúa con el resto")
+
+        parallel = bool(self.conn_str) and self.workers > 1 and len(pending) > 1
+        workers = min(self.workers, len(pending)) if parallel else 1
+        method = "SWITCH desde staging" if switch else ("lotes" if batch_size else "INSERT por partición")
+        log(f"Copiando {len(pending)} partición(es) de {layout.scheme}({layout.column}) con {method} "
+            f"en {workers} sesión(es)...")
+        pool = get_pool(self.conn_str, max_size=workers + 4) if parallel else None
+        # Índices del staging en su sesión, con las opciones del constructor de la migración
+        builder = IndexBuilder(maxdop=index_builder.maxdop, sort_in_tempdb=index_builder.sort_in_tempdb,
+                               online=False) if index_builder else IndexBuilder(online=False)
+
+        def run(partition):
+            if cancel:
+                cancel.check()
+            if not parallel:
+                return self._copy_partition(connection, source, target, layout, partition, columns_list, batch_size,
+                                            identity_insert, create_staging, indexes, switch, False, log, cancel,
+                                            telemetry, builder, pacing)
+            # Desde los hilos no se mide el ritmo (la medición usa la conexión de la migración),
+            # pero los bloqueos que causa cada sesión sí cuentan para la próxima medición
+            with pool.session(PURPOSE_DDL) as pooled:
+                pacing.watch(pooled.spid)
+                try:
+                    return self._copy_partition(pooled.connection, source, target, layout, partition, columns_list,
+                                                batch_size, identity_insert, create_staging, indexes, switch, True,
+                                                log, cancel, telemetry, builder, NULL_PACING)
+                finally:
+                    pacing.unwatch(pooled.spid)
+
+        def finished(partition, rows, seconds):
+            # El diario, el ritmo y la telemetría usan la conexión de la migración: solo este hilo
+            nonlocal rows_done
+            rows_done += rows
+            journal.record(f"partition:{partition.number}", rows=rows)
+            copied = total - len(pending) + len(done)
+            rate = rows / seconds if seconds > 0 else 0
+            log(f"Partición {partition.number} copiada ({copied}/{total}): {rows:,} filas en {seconds:.1f}s "
+                f"({rate:,.0f} filas/s, {rows_done:,} de ~{layout.total_rows:,} en total)")
+            telemetry.emit({'event': 'partition', 'partition': partition.number, 'rows': rows,
+                            'seconds': round(seconds, 3), 'rows_per_s': round(rate, 1),
+                            'method': 'switch' if switch else ('batched' if batch_size else 'insert')})
+
+        done = []
+        if not parallel:
+            for partition in pending:
+                pacing.wait(cancel)
+                started = time.monotonic()
+                rows = run(partition)
+                done.append(partition)
+                finished(partition, rows, time.monotonic() - started)
+            return rows_done
+
+        # Como mucho workers particiones en curso; cada una que termina deja lugar a la siguiente
+        queue = list(pending)
+        errors = []
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="partition") as executor:
+            running = {}
+            while queue or running:
+                while queue and len(running) < workers and not errors:
+                    pacing.wait(cancel)
+                    partition = queue.pop(0)
+                    running[executor.submit(run, partition)] = (partition, time.monotonic())
+                if not running:
+                    break
+                completed, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    partition, started = running.pop(future)
+                    if future.exception():
+                        errors.append(future.exception())
+                        continue
+                    done.append(partition)
+                    finished(partition, future.result(), time.monotonic() - started)
+        # Las particiones terminadas quedan en el diario aunque otra haya fallado
+        if errors:
+            raise errors[0]
+        return rows_done
+
+    def _copy_partition(self, connection, source, target, layout, partition, columns_list, batch_size,
+                        identity_insert, create_staging, indexes, switch, parallel, log, cancel, telemetry,
+                        builder, pacing):
+        cursor = connection.cursor()
+        if cancel:
+            cancel.track(cursor)
+        if switch:
+            return self._switch_partition(connection, cursor, source, target, layout, partition, columns_list,
+                                          identity_insert, create_staging, indexes, log, cancel, telemetry,
+                                          builder)
+
+        schema, table = target
+        dst = f"[{schema}].[{table}]"
+        src = f"[{source[0]}].[{source[1]}]"
+        condition = layout.filter_sql(partition.number)
+
+        if batch_size:
+            # Clave y checkpoint propios de la partición; varias sesiones no comparten la tabla de checkpoints
+            key = get_copy_key(cursor, *source)
+            connection.commit()
+            copier = BatchCopier(connection, source, target, columns_list, key, batch_size,
+                                 identity_insert=identity_insert, log=log, cancel=cancel, pacing=pacing,
+                                 condition=condition, checkpoint=partition_checkpoint(source, partition.number),
+                                 tablock=not parallel)
+            return copier.run()
+
+        # Una sola sentencia: si la partición destino ya tiene filas, esa inserción se confirmó
+        cursor.execute(f"SELECT TOP (1) 1 FROM {dst} WHERE {condition}")
+        if cursor.fetchone():
+            connection.commit()
+            cursor.execute(f"SELECT COUNT_BIG(*) FROM {dst} WHERE {condition}")
+            rows = cursor.fetchone()[0]
+            connection.commit()
+            log(f"La partición {partition.number} ya estaba en {schema}.{table} ({rows:,} filas)")
+            return rows
+        connection.commit()
+
+        if identity_insert:
+            cursor.execute(f"SET IDENTITY_INSERT {dst} ON")
+        try:
+            cursor.execute(f"""
+                INSERT INTO {dst} ({columns_list})
+                SELECT {columns_list}
+                FROM {src}
+                WHERE {condition}
+            """)
+            rows = cursor.rowcount
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            if identity_insert:
+                cursor.execute(f"SET IDENTITY_INSERT {dst} OFF")
+        return rows
+
+    def _switch_partition(self, connection, cursor, source, target, layout, partition, columns_list,
+                          identity_insert, create_staging, indexes, log, cancel, telemetry, builder):
+        schema, table = target
+        staging = f"{table}_P{partition.number}{STAGING_SUFFIX}"
+        stg = f"[{schema}].[{staging}]"
+        src = f"[{source[0]}].[{source[1]}]"
+        condition = layout.filter_sql(partition.number)
+
+        # Si la partición destino ya tiene filas, el SWITCH se confirmó antes de la interrupción
+        cursor.execute(f"SELECT TOP (1) 1 FROM [{schema}].[{table}] WHERE {condition}")
+        if cursor.fetchone():
+            connection.commit()
+            cursor.execute(f"SELECT COUNT_BIG(*) FROM [{schema}].[{table}] WHERE {condition}")
+            rows = cursor.fetchone()[0]
+            connection.commit()
+            log(f"La partición {partition.number} ya estaba en {schema}.{table} ({rows:,} filas)")
+            return rows
+
+        try:
+            # Un staging a medio cargar de una ejecución anterior se descarta
+            cursor.execute(f"IF OBJECT_ID(N'{stg}') IS NOT NULL DROP TABLE {stg}")
+            storage = f" ON [{partition.filegroup}]"
+            if partition.compression and partition.compression != 'NONE':
+                storage = f" WITH (DATA_COMPRESSION = {partition.compression})" + storage
+            cursor.execute(create_staging(staging) + storage)
+            if identity_insert:
+                cursor.execute(f"SET IDENTITY_INSERT {stg} ON")
+            # Tabla vacía y sin nadie más: TABLOCK permite minimal logging en SIMPLE/BULK_LOGGED
+            cursor.execute(f"""
+                INSERT INTO {stg} WITH (TABLOCK) ({columns_list})
+                SELECT {columns_list}
+                FROM {src}
+                WHERE {condition}
+            """)
+            rows = cursor.rowcount
+            if identity_insert:
+                cursor.execute(f"SET IDENTITY_INSERT {stg} OFF")
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+
+        if rows == 0:
+            cursor.execute(f"DROP TABLE {stg}")
+            connection.commit()
+            return 0
+
+        # Los mismos índices que el destino, en el filegroup de la partición
+        staging_indexes = [replace(index, data_space_name=partition.filegroup, data_space_type='FG',
+                                   data_compression=partition.compression if index.is_clustered
+                                   else index.data_compression)
+                           for index in indexes]
+        builder.build(connection, schema, staging, staging_indexes, in_transaction=False, allow_online=False,
+                      log=log, cancel=cancel, telemetry=telemetry)
+
+        cursor.execute("BEGIN TRANSACTION")
+        try:
+            cursor.execute(f"ALTER TABLE {stg} WITH CHECK ADD CONSTRAINT [CK_{staging}_range] "
+                           f"CHECK {layout.range_sql(partition)}")
+            cursor.execute(f"ALTER TABLE {stg} SWITCH TO [{schema}].[{table}] PARTITION {int(partition.number)}")
+            cursor.execute(f"DROP TABLE {stg}")
+            cursor.execute("COMMIT TRANSACTION")
+            connection.commit()
+        except Exception:
+            cursor.execute("ROLLBACK TRANSACTION")
+            raise
+        return rows
+
+    @staticmethod
+    def can_switch(indexes):
+        """SWITCH exige que todos los índices estén sobre el esquema de partición"""
+        return all(index.data_space_type == 'PS' for index in indexes)
+
+    @staticmethod
+    def clear_checkpoints(cursor, source, target, layout):
+        for partition in layout.partitions:
+            clear_checkpoint(cursor, partition_checkpoint(source, partition.number), target)
+
+
+SERIAL_PARTITION_COPIER = PartitionCopier()
@@ -0,0 +1,339 @@
+import pyodbc
+
+from pacing import is_in_availability_group
+from partition_copy import get_partition_layout
+from table_definition import extract_table_definition
+
+# Estrategias posibles para agregar columnas
+STRATEGY_ALTER = 'alter_add'
+STRATEGY_REBUILD = 'rebuild'
+
+# Modo con que ColumnMigration.apply ejecuta el cambio
+MODE_ALTER = 'alter'
+MODE_ONLINE = 'online'
+MODE_BATCHED = 'batched'
+MODE_REBUILD = 'rebuild'
+MODE_PARTITIONED = 'partitioned'
+
+DEFAULT_ONLINE_BATCH_SIZE = 50000
+
+# Historial de velocidades de copia medidas, para estimar duraciones
+HISTORY_TABLE = "[dbo].[ColumnAdder_History]"
+HISTORY_SAMPLES = 20
+# Velocidad supuesta cuando todavía no hay mediciones (MB/s)
+DEFAULT_THROUGHPUT_MB_S = 30.0
+
+# Funciones que se escriben tal cual como DEFAULT
+DEFAULT_FUNCTIONS = ('GETDATE()', 'SYSDATETIME()', 'NEWID()', 'NEWSEQUENTIALID()', 'CURRENT_TIMESTAMP')
+
+# Funciones que NO son constantes en tiempo de ejecución (se evalúan por fila)
+NON_CONSTANT_FUNCTIONS = ('NEWID()', 'NEWSEQUENTIALID()')
+
+NUMERIC_TYPES = ('int', 'bigint', 'smallint', 'tinyint', 'bit', 'decimal', 'numeric',
+                 'float', 'real', 'money', 'smallmoney')
+
+# SERVERPROPERTY('EngineEdition'): 3 = Enterprise/Developer, 5 = Azure SQL Database, 8 = Managed Instance
+ONLINE_ADD_COLUMN_EDITIONS = (3, 5, 8)
+
+
+def build_column_definition(column, with_values=False):
+    """Construye la definición SQL de una columna nueva a partir del diccionario del editor"""
+    column_def = f"[{column['name']}] {column['type']}({column['params']})" if column['params'] else f"[{column['name']}] {column['type']}"
+
+    if not column['allow_null']:
+        column_def += " NOT NULL"
+
+    if column['default']:
+        if column['default'].upper() in DEFAULT_FUNCTIONS:
+            column_def += f" DEFAULT {column['default']}"
+        elif column['type'] in NUMERIC_TYPES:
+            column_def += f" DEFAULT {column['default']}"
+        else:
+            column_def += f" DEFAULT N'{column['default']}'"
+
+        # Las filas existentes reciben el valor por defecto también en columnas NULL
+        # (salvo las que se rellenan después con su expresión)
+        if with_values and not column.get('expression'):
+            column_def += " WITH VALUES"
+
+    return column_def
+
+
+def stage_columns(columns):
+    """Columnas tal como se crean: las que tienen expresión van con NULL hasta terminar su relleno"""
+    return [dict(c, allow_null=True) if c.get('expression') else c for c in columns]
+
+
+def get_engine_edition(cursor):
+    cursor.execute("SELECT CAST(SERVERPROPERTY('EngineEdition') AS INT)")
+    return cursor.fetchone()[0]
+
+
+def plan_column_changes(columns, engine_edition=None):
+    """
+    Decide cómo agregar las columnas:
+    - STRATEGY_ALTER: todas van al final, se usa ALTER TABLE ... ADD sin reconstruir la tabla.
+    - STRATEGY_REBUILD: alguna columna tiene posición explícita, hay que reconstruir la tabla.
+    Devuelve un diccionario con 'strategy', 'metadata_only' y 'reasons'.
+    """
+    reasons = []
+    metadata_only = True
+
+    for column in columns:
+        if column['after'] is not None:
+            reasons.append(f"La columna {column['name']} tiene posición explícita")
+        elif not column['allow_null'] and not column['default']:
+            reasons.append(f"La columna {column['name']} es NOT NULL sin valor por defecto")
+
+    if reasons:
+        return {'strategy': STRATEGY_REBUILD, 'metadata_only': False, 'reasons': reasons}
+
+    for column in columns:
+        if not column['default']:
+            continue
+        if column['default'].upper() in NON_CONSTANT_FUNCTIONS:
+            metadata_only = False
+            reasons.append(f"El default de {column['name']} no es constante: se actualizará cada fila")
+        elif engine_edition not in ONLINE_ADD_COLUMN_EDITIONS:
+            metadata_only = False
+            reasons.append(f"La edición del servidor no permite agregar {column['name']} con default solo en metadatos")
+
+    return {'strategy': STRATEGY_ALTER, 'metadata_only': metadata_only, 'reasons': reasons}
+
+
+def build_alter_add(schema, table, columns):
+    """Genera un único ALTER TABLE ... ADD con todas las columnas"""
+    definitions = ",\n    ".join(build_column_definition(column, with_values=True) for column in columns)
+    return f"ALTER TABLE [{schema}].[{table}] ADD\n    {definitions}"
+
+
+def choose_mode(plan, batch_size=0, online=False, replicated=False, partitioned=False):
+    """
+    Modo de ejecución según el plan y las opciones elegidas. En una base con réplicas
+    (replicated) nunca se copia en una sola sentencia: el log de un INSERT gigante
+    atrasa a las secundarias, así que se usan lotes regulados. Una tabla particionada
+    (partitioned) se copia partición por partición, por lotes dentro de cada una si
+    hay tamaño de lote.
+    """
+    if plan['strategy'] == STRATEGY_ALTER:
+        return MODE_ALTER
+    if online:
+        return MODE_ONLINE
+    if partitioned:
+        return MODE_PARTITIONED
+    if batch_size > 0 or replicated:
+        return MODE_BATCHED
+    return MODE_REBUILD
+
+
+def ensure_history_table(cursor):
+    cursor.execute(f"""
+        IF OBJECT_ID('{HISTORY_TABLE}') IS NULL
+            CREATE TABLE {HISTORY_TABLE} (
+                history_id BIGINT IDENTITY(1,1) NOT NULL PRIMARY KEY,
+                table_name NVARCHAR(512) NOT NULL,
+                mode NVARCHAR(20) NOT NULL,
+                row_count BIGINT NOT NULL,
+                data_bytes BIGINT NOT NULL,
+                seconds FLOAT NOT NULL,
+                finished_at DATETIME2 NOT NULL DEFAULT SYSDATETIME()
+            )
+    """)
+
+
+def record_throughput(cursor, schema, table, mode, row_count, data_bytes, seconds):
+    """Guarda la velocidad de una copia terminada para futuras estimaciones"""
+    ensure_history_table(cursor)
+    cursor.execute(f"""
+        INSERT INTO {HISTORY_TABLE} (table_name, mode, row_count, data_bytes, seconds)
+        VALUES (?, ?, ?, ?, ?)
+    """, f"[{schema}].[{table}]", mode, row_count, data_bytes, seconds)
+
+
+def get_throughput(cursor):
+    """
+    Velocidad de copia en bytes/s según las últimas mediciones.
+    Devuelve (bytes_por_segundo, medido); sin historial usa DEFAULT_THROUGHPUT_MB_S.
+    """
+    cursor.execute(f"""
+        IF OBJECT_ID('{HISTORY_TABLE}') IS NOT NULL
+            SELECT SUM(data_bytes), SUM(seconds)
+            FROM (SELECT TOP ({HISTORY_SAMPLES}) data_bytes, seconds
+                  FROM {HISTORY_TABLE} WHERE seconds > 0 AND mode <> ?
+                  ORDER BY history_id DESC) h
+        ELSE
+            SELECT NULL, NULL
+    """, MODE_ALTER)
+    data_bytes, seconds = cursor.fetchone()
+    if data_bytes and seconds:
+        return data_bytes / seconds, True
+    return DEFAULT_THROUGHPUT_MB_S * 1024 * 1024, False
+
+
+def get_table_size(cursor, schema, table):
+    """
+    Filas y tamaño por índice desde sys.dm_db_partition_stats (requiere VIEW DATABASE STATE;
+    sin ese permiso se usa sys.allocation_units). Devuelve {index_id: (nombre, filas, bytes)}.
+    """
+    name = f"[{schema}].[{table}]"
+    try:
+        cursor.execute("""
+            SELECT ps.index_id, i.name, SUM(ps.row_count) AS row_count, SUM(ps.used_page_count) * 8192 AS used_bytes
+            FROM sys.dm_db_partition_stats ps
+            JOIN sys.indexes i ON i.object_id = ps.object_id AND i.index_id = ps.index_id
+            WHERE ps.object_id = OBJECT_ID(?)
+            GROUP BY ps.index_id, i.name
+        """, name)
+    except pyodbc.Error:
+        cursor.execute("""
+            SELECT p.index_id, i.name, SUM(CASE WHEN au.type IN (1, 3) THEN p.rows ELSE 0 END) AS row_count,
+                   SUM(au.used_pages) * 8192 AS used_bytes
+            FROM sys.partitions p
+            JOIN sys.allocation_units au ON au.container_id = p.partition_id
+            JOIN sys.indexes i ON i.object_id = p.object_id AND i.index_id = p.index_id
+            WHERE p.object_id = OBJECT_ID(?)
+            GROUP BY p.index_id, i.name
+        """, name)
+    return {row.index_id: (row.name, row.row_count, row.used_bytes) for row in cursor.fetchall()}
+
+
+def estimate_migration(cursor, schema, table, columns, batch_size=0, online=False):
+    """
+    Plan sin ejecutar nada: modo, tamaño de la tabla, objetos a recrear y estimaciones
+    de log, tempdb y duración. Las estimaciones son aproximadas: suponen un log
+    del tamaño de los datos escritos y la velocidad media de las últimas copias.
+    """
+    # Las columnas con expresión se crean con NULL y se rellenan con un UPDATE por lotes
+    backfills = [c['name'] for c in columns if c.get('expression')]
+    plan = plan_column_changes(stage_columns(columns), get_engine_edition(cursor))
+    replicated = is_in_availability_group(cursor)
+    layout = get_partition_layout(cursor, schema, table)
+    mode = choose_mode(plan, batch_size, online, replicated, layout is not None)
+    if mode in (MODE_ONLINE, MODE_BATCHED) or (mode == MODE_PARTITIONED and replicated):
+        batch_size = batch_size or DEFAULT_ONLINE_BATCH_SIZE
+    if mode in (MODE_BATCHED, MODE_PARTITIONED) and replicated:
+        plan['reasons'].append("La base está en un grupo de disponibilidad: la copia se hace en lotes regulados")
+    if mode == MODE_PARTITIONED:
+        plan['reasons'].append(f"La tabla está particionada por {layout.column} ({layout.scheme}): "
+                               f"se copia partición por partición ({len(layout.partitions)} particiones)")
+
+    sizes = get_table_size(cursor, schema, table)
+    base = sizes.get(1) or sizes.get(0) or (None, 0, 0)
+    row_count, data_bytes = base[1] or 0, base[2] or 0
+    index_bytes = sum(size[2] or 0 for index_id, size in sizes.items() if index_id > 1)
+    largest_index = max((size[2] or 0 for index_id, size in sizes.items() if index_id > 1), default=0)
+    throughput, measured = get_throughput(cursor)
+
+    definition = extract_table_definition(cursor, schema, table)
+
+    if mode == MODE_ALTER:
+        copied_bytes = 0 if plan['metadata_only'] else data_bytes
+        log_bytes = copied_bytes
+        log_peak = log_bytes
+        tempdb_bytes = 0
+    else:
+        # La reconstrucción en una transacción copia los datos dos veces (a _TEMP y de vuelta)
+        copies = 2 if mode == MODE_REBUILD else 1
+        copied_bytes = data_bytes * copies + index_bytes
+        log_bytes = copied_bytes
+        if mode == MODE_REBUILD:
+            log_peak = log_bytes
+        elif mode == MODE_PARTITIONED and not batch_size:
+            # Cada partición se confirma por separado: el log activo se limita a la mayor
+            largest = max((p.rows for p in layout.partitions), default=0)
+            log_peak = max(data_bytes * largest / row_count if row_count else 0, largest_index)
+        else:
+            # Cada lote se confirma: el log activo se limita a un lote y al índice más grande
+            row_bytes = data_bytes / row_count if row_count else 0
+            log_peak = max(min(batch_size, row_count) * row_bytes * 2, largest_index)
+        # Las ordenaciones de los índices pueden desbordar a tempdb
+        tempdb_bytes = largest_index
+
+    # Cada relleno reescribe la tabla una vez, un lote confirmado a la vez
+    backfill_bytes = data_bytes * len(backfills)
+    copied_bytes += backfill_bytes
+    log_bytes += backfill_bytes
+    if backfills:
+        row_bytes = data_bytes / row_count if row_count else 0
+        log_peak = max(log_peak, min(batch_size or DEFAULT_ONLINE_BATCH_SIZE, row_count) * row_bytes * 2)
+
+    return {
+        'table': f"{schema}.{table}",
+        'mode': mode,
+        'strategy': plan['strategy'],
+        'metadata_only': plan['metadata_only'],
+        'reasons': plan['reasons'],
+        'row_count': row_count,
+        'data_bytes': data_bytes,
+        'index_bytes': index_bytes,
+        'batch_size': batch_size if mode in (MODE_ONLINE, MODE_BATCHED, MODE_PARTITIONED) else 0,
+        'partitions': len(layout.partitions) if layout else 0,
+        'backfills': backfills,
+        'estimated_log_bytes': int(log_bytes),
+        'estimated_log_peak_bytes': int(log_peak),
+        'estimated_tempdb_bytes': int(tempdb_bytes),
+        'estimated_seconds': round(copied_bytes / throughput, 1) if throughput else None,
+        'throughput_bytes_s': int(throughput),
+        'throughput_measured': measured,
+        'indexes': [index.name for index in definition.secondary_indexes] if mode != MODE_ALTER else [],
+        'foreign_keys': [fk.name for fk in definition.foreign_keys + definition.referencing_fks] if mode != MODE_ALTER else [],
+        'grants': [perm.grant_script for perm in definition.permissions] if mode != MODE_ALTER else [],
+    }
+
+
+def _format_bytes(value):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if value < 1024:
+            return f"{value:.0f} {unit}" if unit == 'B' else f"{value:.1f} {unit}"
+        value /= 1024
+    return f"{value:.1f} TB"
+
+
+def _format_seconds(seconds):
+    if seconds is None:
+        return "desconocido"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m {seconds:02d}s" if hours else f"{minutes}m {seconds:02d}s"
+
+
+MODE_DESCRIPTIONS = {
+    MODE_ALTER: "ALTER TABLE ADD",
+    MODE_ONLINE: "Reconstrucción en línea (tabla sombra)",
+    MODE_BATCHED: "Reconstrucción por lotes",
+    MODE_REBUILD: "Reconstrucción completa en una transacción",
+    MODE_PARTITIONED: "Reconstrucción partición por partición",
+}
+
+
+def format_estimate(estimate):
+    """Resumen legible del plan para mostrar antes de confirmar"""
+    mode = estimate['mode']
+    description = MODE_DESCRIPTIONS[mode]
+    if mode == MODE_ALTER:
+        description += " (solo metadatos)" if estimate['metadata_only'] else " (actualiza cada fila)"
+    lines = [
+        f"Tabla: {estimate['table']}",
+        f"Estrategia: {description}",
+        f"Filas: {estimate['row_count']:,}  Datos: {_format_bytes(estimate['data_bytes'])}  "
+        f"Índices: {_format_bytes(estimate['index_bytes'])}",
+    ]
+    lines += [f"  - {reason}" for reason in estimate['reasons']]
+    if estimate['backfills']:
+        lines.append(f"Columnas a rellenar por lotes con su expresión: {', '.join(estimate['backfills'])}")
+    if mode != MODE_ALTER or not estimate['metadata_only'] or estimate['backfills']:
+        speed = "medida" if estimate['throughput_measured'] else "supuesta"
+        lines += [
+            f"Log estimado: {_format_bytes(estimate['estimated_log_bytes'])} "
+            f"(pico {_format_bytes(estimate['estimated_log_peak_bytes'])})",
+            f"tempdb estimado: {_format_bytes(estimate['estimated_tempdb_bytes'])}",
+            f"Duración estimada: {_format_seconds(estimate['estimated_seconds'])} "
+            f"(velocidad {speed}: {_format_bytes(estimate['throughput_bytes_s'])}/s)",
+        ]
+    if estimate['indexes']:
+        lines.append(f"Índices a recrear: {', '.join(estimate['indexes'])}")
+    if estimate['foreign_keys']:
+        lines.append(f"Claves foráneas a recrear: {', '.join(estimate['foreign_keys'])}")
+    if estimate['grants']:
+        lines.append(f"Permisos a restaurar: {len(estimate['grants'])}")
+    return "\n".join(lines)
@@ -0,0 +1,141 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+import pyodbc
+
+from connection_pool import PURPOSE_MONITOR, PoolTimeout, get_pool
+
+logger = logging.getLogger(__name__)
+
+
+def format_progress(report):
+    """Texto corto para la barra de estado y el registro"""
+    text = f"Copiadas {report['rows']:,} filas"
+    if report['total']:
+        text += f" de {report['total']:,} ({report['percent']:.1f}%)"
+    if report['rows_per_second']:
+        text += f" · {report['rows_per_second']:,.0f} filas/s"
+    if report['eta_seconds'] is not None:
+        minutes, seconds = divmod(int(report['eta_seconds']), 60)
+        hours, minutes = divmod(minutes, 60)
+        text += f" · ETA {hours}h {minutes:02d}m" if hours else f" · ETA {minutes}m {seconds:02d}s"
+    if report['wait_type']:
+        text += f" · espera {report['wait_type']}"
+    return text
+
+
+class _Watcher(threading.Thread):
+    """Consulta desde otra conexión las filas de la tabla destino y la petición en curso"""
+
+    def __init__(self, monitor, spid, target, total_rows):
+        super().__init__(daemon=True, name="progress-monitor")
+        self.monitor = monitor
+        self.spid = spid
+        self.target = f"[{target[0]}].[{target[1]}]"
+        self.total_rows = total_rows or 0
+        self.stop_event = threading.Event()
+
+    def run(self):
+        try:
+            pool = get_pool(self.monitor.conn_str)
+            pooled = pool.acquire(PURPOSE_MONITOR)
+        except (pyodbc.Error, PoolTimeout) as e:
+            logger.warning(f"No se pudo abrir la conexión de seguimiento: {str(e)}")
+            return
+
+        try:
+            cursor = pooled.cursor()
+            # Las lecturas no deben esperar a los bloqueos de la migración
+            cursor.execute("SET LOCK_TIMEOUT 1000; SET TRANSACTION ISOLATION LEVEL READ UNCOMMITTED")
+            start = time.monotonic()
+            rate = None
+            last = None
+            last_logged = start
+
+            errors = 0
+            while not self.stop_event.wait(self.monitor.interval):
+                try:
+                    cursor.execute("""
+                        SELECT ISNULL(SUM(row_count), 0) FROM sys.dm_db_partition_stats
+                        WHERE object_id = OBJECT_ID(?) AND index_id IN (0, 1)
+                    """, self.target)
+                    rows = cursor.fetchone()[0]
+                    cursor.execute("SELECT wait_type FROM sys.dm_exec_requests WHERE session_id = ?", self.spid)
+                    request = cursor.fetchone()
+                    pooled.connection.commit()
+                    errors = 0
+                except pyodbc.Error:
+                    # Un bloqueo puntual no detiene el seguimiento; errores seguidos (permisos) sí
+                    errors += 1
+                    if errors >= 3:
+                        raise
+                    continue
+                now = time.monotonic()
+
+                # Velocidad suavizada por diferencias: las filas previas (reanudación) no cuentan
+                if last is not None and now > last[0]:
+                    current = max(rows - last[1], 0) / (now - last[0])
+                    rate = current if rate is None else 0.3 * current + 0.7 * rate
+                last = (now, rows)
+
+                remaining = max(self.total_rows - rows, 0)
+                report = {
+                    'table': self.target,
+                    'rows': rows,
+                    'total': self.total_rows,
+                    'percent': min(100.0, rows * 100.0 / self.total_rows) if self.total_rows else 0.0,
+                    'rows_per_second': rate or 0.0,
+                    'eta_seconds': remaining / rate if rate and self.total_rows else None,
+                    'elapsed_seconds': now - start,
+                    'wait_type': request.wait_type if request else None,
+                }
+                self.monitor.on_progress(report)
+                if now - last_logged >= self.monitor.log_interval:
+                    last_logged = now
+                    self.monitor.log(format_progress(report))
+        except pyodbc.Error as e:
+            # Sin VIEW DATABASE STATE no hay contadores: la copia sigue sin seguimiento
+            logger.warning(f"Seguimiento de la copia detenido: {str(e)}")
+        finally:
+            pool.release(pooled)
+
+
+class ProgressMonitor:
+    """
+    Seguimiento en vivo de una copia larga. Mientras dura watch() un hilo con su propia
+    conexión lee sys.dm_db_partition_stats de la tabla destino y sys.dm_exec_requests
+    de la sesión que copia, y calcula filas/s, porcentaje y tiempo restante.
+    on_progress(report) se llama en cada lectura (desde el hilo del monitor);
+    log(mensaje) como mucho cada log_interval segundos.
+    """
+
+    def __init__(self, conn_str, on_progress=None, log=None, interval=2.0, log_interval=30.0):
+        self.conn_str = conn_str
+        self.on_progress = on_progress or (lambda report: None)
+        self.log = log or (lambda message, level=logging.INFO: logging.log(level, message))
+        self.interval = interval
+        self.log_interval = log_interval
+
+    @contextmanager
+    def watch(self, connection, target, total_rows):
+        cursor = connection.cursor()
+        cursor.execute("SELECT @@SPID")
+        watcher = _Watcher(self, cursor.fetchone()[0], target, total_rows)
+        watcher.start()
+        try:
+            yield
+        finally:
+            watcher.stop_event.set()
+
+
+class NullProgress:
+    """Sin seguimiento"""
+
+    @contextmanager
+    def watch(self, connection, target, total_rows):
+        yield
+
+
+NULL_PROGRESS = NullProgress()
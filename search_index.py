@@ -0,0 +1,263 @@
+import bisect
+from collections import namedtuple
+
+# Tipos de resultado
+KIND_SCHEMA = 'schema'
+KIND_TABLE = 'table'
+KIND_COLUMN = 'column'
+
+# Tipos de coincidencia, de mejor a peor
+MATCH_EXACT = 'exact'
+MATCH_PREFIX = 'prefix'
+MATCH_SUBSTRING = 'substring'
+MATCH_FUZZY = 'fuzzy'
+
+_MATCH_RANK = {MATCH_EXACT: 0, MATCH_PREFIX: 1, MATCH_SUBSTRING: 2, MATCH_FUZZY: 3}
+_KIND_RANK = {KIND_TABLE: 0, KIND_SCHEMA: 1, KIND_COLUMN: 2}
+
+# Fracción mínima de los trigramas del término presentes en el nombre para una coincidencia aproximada
+DEFAULT_FUZZY_THRESHOLD = 0.4
+DEFAULT_LIMIT = 200
+
+SearchResult = namedtuple('SearchResult', ['kind', 'schema', 'table', 'column', 'match', 'score'])
+
+
+def trigrams(text):
+    """Trigramas del texto con relleno al principio y al final, como pg_trgm"""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _plain_trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    """
+    Índice de búsqueda sobre los esquemas, tablas y columnas del catálogo.
+    Los nombres se guardan una sola vez en minúsculas (una columna "Id" en 40.000
+    tablas es un solo nombre) con los objetos que lo usan por tipo, una lista ordenada
+    para los prefijos y un índice invertido de trigramas para subcadenas y
+    coincidencias aproximadas. update_tables() rehace solo las tablas indicadas.
+    No es seguro modificarlo mientras otro hilo busca: las actualizaciones
+    incrementales van en el hilo de la interfaz y las completas crean un índice nuevo.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.sorted_names = []
+        self.postings = {}
+        self.table_entries = {}
+        self.tables_by_name = {}
+        # Objetos de un nombre ya ordenados, por (nombre, tipo); se descartan al cambiar el nombre
+        self.ordered = {}
+
+    @classmethod
+    def from_catalog(cls, catalog):
+        index = cls()
+        index.build(catalog)
+        return index
+
+    def build(self, catalog):
+        self.__init__()
+        for schema in catalog.schemas:
+            self._add(schema, (KIND_SCHEMA, schema, None, None))
+        for key in list(catalog.columns):
+            self._add_table(catalog, key)
+
+    def update_tables(self, catalog, keys):
+        """Vuelve a indexar las tablas indicadas; las que ya no están en el catálogo se quitan"""
+        for key in keys:
+            added = self.table_entries.pop(key, None)
+            if added is not None:
+                for name, entry in added:
+                    self._remove(name, entry)
+                self._unlink_table(key)
+            if catalog.columns.get(key) is not None:
+                self._add_table(catalog, key)
+
+    def __len__(self):
+        return sum(len(entries) for kinds in self.entries.values() for entries in kinds.values())
+
+    def _add_table(self, catalog, key):
+        schema, table = key
+        added = [(table, (KIND_TABLE, schema, table, None))]
+        added += [(column.column_name, (KIND_COLUMN, schema, table, column.column_name))
+                  for column in catalog.columns.get(key) or []]
+        for name, entry in added:
+            self._add(name, entry)
+        self.table_entries[key] = added
+        for scope in (table.lower(), f"{schema}.{table}".lower()):
+            self.tables_by_name.setdefault(scope, set()).add(key)
+
+    def _unlink_table(self, key):
+        schema, table = key
+        for scope in (table.lower(), f"{schema}.{table}".lower()):
+            keys = self.tables_by_name.get(scope)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tables_by_name[scope]
+
+    def _add(self, name, entry):
+        lowered = name.lower()
+        kinds = self.entries.get(lowered)
+        if kinds is None:
+            kinds = self.entries[lowered] = {}
+            bisect.insort(self.sorted_names, lowered)
+            for trigram in trigrams(lowered):
+                self.postings.setdefault(trigram, set()).add(lowered)
+        kinds.setdefault(entry[0], set()).add(entry)
+        self.ordered.pop((lowered, entry[0]), None)
+
+    def _remove(self, name, entry):
+        lowered = name.lower()
+        kinds = self.entries.get(lowered)
+        if kinds is None or entry[0] not in kinds:
+            return
+        kinds[entry[0]].discard(entry)
+        self.ordered.pop((lowered, entry[0]), None)
+        if not kinds[entry[0]]:
+            del kinds[entry[0]]
+        if kinds:
+            return
+        del self.entries[lowered]
+        position = bisect.bisect_left(self.sorted_names, lowered)
+        if position < len(self.sorted_names) and self.sorted_names[position] == lowered:
+            del self.sorted_names[position]
+        for trigram in trigrams(lowered):
+            names = self.postings.get(trigram)
+            if names is not None:
+                names.discard(lowered)
+                if not names:
+                    del self.postings[trigram]
+
+    def _matching_names(self, term, fuzzy_threshold, enough=None):
+        """
+        {nombre: (coincidencia, similitud)} de los nombres que coinciden con el término.
+        Con enough nombres exactos o por prefijo no se buscan subcadenas, y con enough
+        entre todos ellos tampoco aproximados.
+        """
+        found = {}
+        if term in self.entries:
+            found[term] = (MATCH_EXACT, 1.0)
+
+        # Prefijos: rango contiguo de la lista ordenada
+        position = bisect.bisect_left(self.sorted_names, term)
+        while position < len(self.sorted_names) and self.sorted_names[position].startswith(term):
+            found.setdefault(self.sorted_names[position], (MATCH_PREFIX, 1.0))
+            position += 1
+
+        # Con uno o dos caracteres las subcadenas coinciden con casi todo: solo prefijos
+        if len(term) < 3 or (enough is not None and len(found) >= enough):
+            return found
+
+        # Subcadenas: todo nombre que contiene el término tiene todos sus trigramas
+        plain = _plain_trigrams(term)
+        candidates = None
+        for trigram in sorted(plain, key=lambda t: len(self.postings.get(t, ()))):
+            names = self.postings.get(trigram)
+            if not names:
+                candidates = set()
+                break
+            candidates = set(names) if candidates is None else candidates & names
+            if not candidates:
+                break
+        for name in candidates or ():
+            if term in name:
+                found.setdefault(name, (MATCH_SUBSTRING, 1.0))
+
+        # Aproximadas: parte de los trigramas del término en el nombre (errores de tipeo)
+        if fuzzy_threshold is not None and (enough is None or len(found) < enough):
+            query = trigrams(term)
+            shared = {}
+            for trigram in query:
+                for name in self.postings.get(trigram, ()):
+                    shared[name] = shared.get(name, 0) + 1
+            minimum = fuzzy_threshold * len(query)
+            for name, count in shared.items():
+                if count >= minimum and name not in found:
+                    found[name] = (MATCH_FUZZY, count / len(query))
+        return found
+
+    def search(self, text, limit=DEFAULT_LIMIT, kinds=None, fuzzy_threshold=DEFAULT_FUZZY_THRESHOLD):
+        """
+        Busca esquemas, tablas y columnas. "cliente" busca en todos los nombres;
+        "ventas.cli" busca tablas del esquema ventas y columnas de las tablas llamadas
+        ventas, y "dbo.Pedido.fecha" columnas de esa tabla. Los resultados van ordenados
+        por tipo de coincidencia (exacta, prefijo, subcadena, aproximada) y similitud;
+        buscar un nombre de columna devuelve cada tabla que la tiene.
+        """
+        text = text.strip().lower()
+        if not text:
+            return []
+        if '.' in text:
+            scope, text = (part.strip() for part in text.rsplit('.', 1))
+            return self._search_scoped(scope, text, limit, kinds, fuzzy_threshold) if text else []
+
+        # Se ordenan los nombres (pocos) y solo se expanden los objetos hasta llegar al límite:
+        # "id" puede estar en decenas de miles de tablas
+        names = sorted(self._matching_names(text, fuzzy_threshold, limit).items(),
+                       key=lambda item: (_MATCH_RANK[item[1][0]], -item[1][1], len(item[0]), item[0]))
+        results = []
+        for name, (match, similarity) in names:
+            for kind in sorted(self.entries[name], key=_KIND_RANK.get):
+                if kinds and kind not in kinds:
+                    continue
+                entries = self._ordered(name, kind)
+                room = limit - len(results) if limit else len(entries)
+                for _, schema, table, column in entries[:room]:
+                    results.append(SearchResult(kind, schema, table, column, match, similarity))
+                if limit and len(results) >= limit:
+                    return results
+        return results
+
+    def _ordered(self, name, kind):
+        key = (name, kind)
+        ordered = self.ordered.get(key)
+        if ordered is None:
+            ordered = self.ordered[key] = sorted(self.entries[name][kind], key=lambda e: (e[1], e[2] or ''))
+        return ordered
+
+    def _search_scoped(self, scope, term, limit, kinds, fuzzy_threshold):
+        """Tablas de un esquema y columnas de una tabla: conjuntos chicos que se comparan uno a uno"""
+        results = []
+        if not kinds or KIND_COLUMN in kinds:
+            for key in self.tables_by_name.get(scope, ()):
+                for name, (kind, schema, table, column) in self.table_entries.get(key, ()):
+                    if kind == KIND_COLUMN:
+                        match = classify(name.lower(), term, fuzzy_threshold)
+                        if match:
+                            results.append(SearchResult(kind, schema, table, column, *match))
+        if (not kinds or KIND_TABLE in kinds) and scope in self.entries and KIND_SCHEMA in self.entries[scope]:
+            for name, (match, similarity) in self._matching_names(term, fuzzy_threshold).items():
+                for entry in self.entries[name].get(KIND_TABLE, ()):
+                    if entry[1].lower() == scope:
+                        results.append(SearchResult(KIND_TABLE, entry[1], entry[2], None, match, similarity))
+        results.sort(key=lambda r: (_MATCH_RANK[r.match], -r.score, len(r.column or r.table), r.schema,
+                                    r.table, r.column or ''))
+        return results[:limit] if limit else results
+
+
+def classify(name, term, fuzzy_threshold=DEFAULT_FUZZY_THRESHOLD):
+    """(coincidencia, similitud) de un nombre en minúsculas con el término, o None"""
+    if name == term:
+        return MATCH_EXACT, 1.0
+    if name.startswith(term):
+        return MATCH_PREFIX, 1.0
+    if term in name:
+        return MATCH_SUBSTRING, 1.0
+    if fuzzy_threshold is None or len(term) < 3:
+        return None
+    query = trigrams(term)
+    similarity = len(query & trigrams(name)) / len(query)
+    return (MATCH_FUZZY, similarity) if similarity >= fuzzy_threshold else None
+
+
+def describe_result(result):
+    """Texto de un resultado para la lista de la interfaz"""
+    if result.kind == KIND_SCHEMA:
+        return f"Esquema {result.schema}"
+    if result.kind == KIND_TABLE:
+        return f"Tabla {result.schema}.{result.table}"
+    return f"Columna {result.column} en {result.schema}.{result.table}"
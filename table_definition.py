@@ -0,0 +1,488 @@
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+# Acciones referenciales de sys.foreign_keys
+_REFERENTIAL_ACTIONS = {1: 'CASCADE', 2: 'SET NULL', 3: 'SET DEFAULT'}
+
+# Un solo lote con todos los conjuntos de resultados que describen la tabla
+_EXTRACT_SQL = """
+SET NOCOUNT ON;
+DECLARE @object_id INT = OBJECT_ID(?);
+DECLARE @db_collation NVARCHAR(128) = CAST(DATABASEPROPERTYEX(DB_NAME(), 'Collation') AS NVARCHAR(128));
+
+-- 1. Columnas
+SELECT
+    c.column_id, c.name, tp.name AS type_name, c.max_length, c.precision, c.scale,
+    c.is_nullable, c.is_identity,
+    CAST(idc.seed_value AS NVARCHAR(100)) AS seed_value,
+    CAST(idc.increment_value AS NVARCHAR(100)) AS increment_value,
+    dc.definition AS default_definition,
+    c.is_computed, cc.definition AS computed_definition, ISNULL(cc.is_persisted, 0) AS is_persisted,
+    CASE WHEN c.collation_name <> @db_collation THEN c.collation_name END AS collation_name,
+    c.is_sparse, c.is_rowguidcol
+FROM sys.columns c
+JOIN sys.types tp ON c.user_type_id = tp.user_type_id
+LEFT JOIN sys.identity_columns idc ON idc.object_id = c.object_id AND idc.column_id = c.column_id
+LEFT JOIN sys.default_constraints dc ON dc.object_id = c.default_object_id
+LEFT JOIN sys.computed_columns cc ON cc.object_id = c.object_id AND cc.column_id = c.column_id
+WHERE c.object_id = @object_id
+ORDER BY c.column_id;
+
+-- 2. Índices (incluye el heap, index_id = 0, para el almacenamiento de la tabla)
+SELECT
+    i.index_id, i.name, i.type, i.is_unique, i.is_primary_key, i.is_unique_constraint,
+    i.filter_definition, i.fill_factor, i.ignore_dup_key,
+    ds.name AS data_space_name, ds.type AS data_space_type,
+    p.data_compression_desc
+FROM sys.indexes i
+LEFT JOIN sys.data_spaces ds ON ds.data_space_id = i.data_space_id
+OUTER APPLY (
+    SELECT TOP (1) sp.data_compression_desc
+    FROM sys.partitions sp
+    WHERE sp.object_id = i.object_id AND sp.index_id = i.index_id
+    ORDER BY sp.partition_number
+) p
+WHERE i.object_id = @object_id AND i.type IN (0, 1, 2) AND i.is_hypothetical = 0
+ORDER BY i.index_id;
+
+-- 3. Columnas de los índices
+SELECT ic.index_id, c.name, ic.key_ordinal, ic.is_descending_key, ic.is_included_column, ic.partition_ordinal
+FROM sys.index_columns ic
+JOIN sys.columns c ON c.object_id = ic.object_id AND c.column_id = ic.column_id
+WHERE ic.object_id = @object_id
+ORDER BY ic.index_id, ic.key_ordinal, ic.index_column_id;
+
+-- 4. CHECK
+SELECT cc.name, cc.definition, cc.is_not_trusted, cc.is_disabled
+FROM sys.check_constraints cc
+WHERE cc.parent_object_id = @object_id
+ORDER BY cc.name;
+
+-- 5. FK salientes y entrantes
+SELECT
+    fk.object_id, fk.name,
+    ps.name AS parent_schema, po.name AS parent_table,
+    rs.name AS referenced_schema, ro.name AS referenced_table,
+    fk.delete_referential_action, fk.update_referential_action,
+    fk.is_not_trusted, fk.is_disabled,
+    CASE WHEN fk.parent_object_id = @object_id THEN 1 ELSE 0 END AS is_outgoing,
+    CASE WHEN fk.referenced_object_id = @object_id THEN 1 ELSE 0 END AS is_referenced
+FROM sys.foreign_keys fk
+JOIN sys.objects po ON po.object_id = fk.parent_object_id
+JOIN sys.schemas ps ON ps.schema_id = po.schema_id
+JOIN sys.objects ro ON ro.object_id = fk.referenced_object_id
+JOIN sys.schemas rs ON rs.schema_id = ro.schema_id
+WHERE fk.parent_object_id = @object_id OR fk.referenced_object_id = @object_id;
+
+-- 6. Columnas de las FK
+SELECT fkc.constraint_object_id, pc.name AS parent_column, rc.name AS referenced_column
+FROM sys.foreign_key_columns fkc
+JOIN sys.columns pc ON pc.object_id = fkc.parent_object_id AND pc.column_id = fkc.parent_column_id
+JOIN sys.columns rc ON rc.object_id = fkc.referenced_object_id AND rc.column_id = fkc.referenced_column_id
+WHERE fkc.parent_object_id = @object_id OR fkc.referenced_object_id = @object_id
+ORDER BY fkc.constraint_object_id, fkc.constraint_column_id;
+
+-- 7. Permisos (de tabla y de columna)
+SELECT perm.state_desc, perm.permission_name, prin.name AS principal_name, c.name AS column_name
+FROM sys.database_permissions perm
+JOIN sys.database_principals prin ON perm.grantee_principal_id = prin.principal_id
+LEFT JOIN sys.columns c ON perm.minor_id > 0 AND c.object_id = perm.major_id AND c.column_id = perm.minor_id
+WHERE perm.class = 1 AND perm.major_id = @object_id;
+"""
+
+
+def _quote(name):
+    return "[" + name.replace("]", "]]") + "]"
+
+
+def _add_constraint_sql(table, name, body, is_not_trusted=False, is_disabled=False):
+    """
+    ADD CONSTRAINT que conserva el estado de la original: una no confiable se crea
+    sin validar las filas (WITH NOCHECK) y una deshabilitada se vuelve a deshabilitar
+    """
+    nocheck = "WITH NOCHECK " if is_not_trusted or is_disabled else ""
+    sql = f"ALTER TABLE {table} {nocheck}ADD CONSTRAINT {_quote(name)} {body}"
+    if is_disabled:
+        sql += f"; ALTER TABLE {table} NOCHECK CONSTRAINT {_quote(name)}"
+    return sql
+
+
+@dataclass
+class ColumnDef:
+    name: str
+    type_name: str
+    max_length: int = 0
+    precision: int = 0
+    scale: int = 0
+    is_nullable: bool = True
+    is_identity: bool = False
+    seed_value: Optional[str] = None
+    increment_value: Optional[str] = None
+    default_definition: Optional[str] = None
+    is_computed: bool = False
+    computed_definition: Optional[str] = None
+    is_persisted: bool = False
+    collation_name: Optional[str] = None
+    is_sparse: bool = False
+    is_rowguidcol: bool = False
+
+    @property
+    def type_sql(self):
+        """Tipo con sus parámetros, ej. nvarchar(50) o decimal(18,2)"""
+        if self.type_name in ('varchar', 'char', 'varbinary', 'binary'):
+            return f"{self.type_name}({'MAX' if self.max_length == -1 else self.max_length})"
+        if self.type_name in ('nvarchar', 'nchar'):
+            return f"{self.type_name}({'MAX' if self.max_length == -1 else self.max_length // 2})"
+        if self.type_name in ('decimal', 'numeric'):
+            return f"{self.type_name}({self.precision},{self.scale})"
+        if self.type_name in ('datetime2', 'datetimeoffset', 'time'):
+            return f"{self.type_name}({self.scale})"
+        return self.type_name
+
+    @property
+    def insertable(self):
+        """Las columnas calculadas y rowversion no admiten valores explícitos"""
+        return not self.is_computed and self.type_name != 'timestamp'
+
+    def to_sql(self):
+        if self.is_computed:
+            return f"{_quote(self.name)} AS {self.computed_definition}" + (" PERSISTED" if self.is_persisted else "")
+
+        sql = f"{_quote(self.name)} {self.type_sql}"
+        if self.collation_name:
+            sql += f" COLLATE {self.collation_name}"
+        if self.is_sparse:
+            sql += " SPARSE"
+        if self.is_identity:
+            sql += f" IDENTITY({self.seed_value},{self.increment_value})"
+        if self.is_rowguidcol:
+            sql += " ROWGUIDCOL"
+        sql += " NULL" if self.is_nullable else " NOT NULL"
+        if self.default_definition:
+            sql += f" DEFAULT {self.default_definition}"
+        return sql
+
+
+@dataclass
+class IndexColumnDef:
+    name: str
+    is_descending: bool = False
+    is_included: bool = False
+
+
+@dataclass
+class IndexDef:
+    index_id: int
+    name: Optional[str]
+    type: int
+    is_unique: bool = False
+    is_primary_key: bool = False
+    is_unique_constraint: bool = False
+    filter_definition: Optional[str] = None
+    fill_factor: int = 0
+    ignore_dup_key: bool = False
+    data_space_name: Optional[str] = None
+    data_space_type: Optional[str] = None
+    data_compression: Optional[str] = None
+    key_columns: List[IndexColumnDef] = field(default_factory=list)
+    included_columns: List[str] = field(default_factory=list)
+    partition_column: Optional[str] = None
+
+    @property
+    def is_clustered(self):
+        return self.type == 1
+
+    @property
+    def key_sql(self):
+        return ", ".join(f"{_quote(c.name)} {'DESC' if c.is_descending else 'ASC'}" for c in self.key_columns)
+
+    def storage_sql(self):
+        """Cláusula ON: esquema de partición con su columna o filegroup"""
+        if not self.data_space_name:
+            return ""
+        if self.data_space_type == 'PS' and self.partition_column:
+            return f" ON {_quote(self.data_space_name)}({_quote(self.partition_column)})"
+        return f" ON {_quote(self.data_space_name)}"
+
+    def options_sql(self, extra=None):
+        options = []
+        if self.fill_factor:
+            options.append(f"FILLFACTOR = {self.fill_factor}")
+        if self.ignore_dup_key:
+            options.append("IGNORE_DUP_KEY = ON")
+        if self.data_compression and self.data_compression != 'NONE':
+            options.append(f"DATA_COMPRESSION = {self.data_compression}")
+        options.extend(extra or [])
+        return f" WITH ({', '.join(options)})" if options else ""
+
+    def create_sql(self, schema, table, extra_options=None):
+        sql = (f"CREATE {'UNIQUE ' if self.is_unique else ''}{'CLUSTERED' if self.is_clustered else 'NONCLUSTERED'} "
+               f"INDEX {_quote(self.name)} ON {_quote(schema)}.{_quote(table)} ({self.key_sql})")
+        if self.included_columns:
+            sql += f" INCLUDE ({', '.join(_quote(c) for c in self.included_columns)})"
+        if self.filter_definition:
+            sql += f" WHERE {self.filter_definition}"
+        return sql + self.options_sql(extra_options) + self.storage_sql()
+
+
+@dataclass
+class CheckDef:
+    name: str
+    definition: str
+    is_not_trusted: bool = False
+    is_disabled: bool = False
+
+
+@dataclass
+class ForeignKeyDef:
+    object_id: int
+    name: str
+    parent_schema: str
+    parent_table: str
+    referenced_schema: str
+    referenced_table: str
+    delete_action: int = 0
+    update_action: int = 0
+    is_not_trusted: bool = False
+    is_disabled: bool = False
+    parent_columns: List[str] = field(default_factory=list)
+    referenced_columns: List[str] = field(default_factory=list)
+
+    # Atributos con los nombres que usa el código de migración
+    @property
+    def constraint_name(self):
+        return self.name
+
+    @property
+    def schema_name(self):
+        return self.parent_schema
+
+    @property
+    def table_name(self):
+        return self.parent_table
+
+    @property
+    def create_script(self):
+        body = (f"FOREIGN KEY ({', '.join(_quote(c) for c in self.parent_columns)}) "
+                f"REFERENCES {_quote(self.referenced_schema)}.{_quote(self.referenced_table)} "
+                f"({', '.join(_quote(c) for c in self.referenced_columns)})")
+        if self.delete_action in _REFERENTIAL_ACTIONS:
+            body += f" ON DELETE {_REFERENTIAL_ACTIONS[self.delete_action]}"
+        if self.update_action in _REFERENTIAL_ACTIONS:
+            body += f" ON UPDATE {_REFERENTIAL_ACTIONS[self.update_action]}"
+        return _add_constraint_sql(f"{_quote(self.parent_schema)}.{_quote(self.parent_table)}", self.name, body,
+                                   self.is_not_trusted, self.is_disabled)
+
+    @property
+    def drop_script(self):
+        return f"ALTER TABLE {_quote(self.parent_schema)}.{_quote(self.parent_table)} DROP CONSTRAINT {_quote(self.name)}"
+
+
+@dataclass
+class PermissionDef:
+    schema: str
+    table: str
+    state_desc: str
+    permission_name: str
+    principal_name: str
+    column_name: Optional[str] = None
+
+    @property
+    def grant_script(self):
+        target = f"{_quote(self.schema)}.{_quote(self.table)}"
+        if self.column_name:
+            target += f" ({_quote(self.column_name)})"
+        if self.state_desc == 'GRANT_WITH_GRANT_OPTION':
+            return f"GRANT {self.permission_name} ON {target} TO {_quote(self.principal_name)} WITH GRANT OPTION"
+        return f"{self.state_desc} {self.permission_name} ON {target} TO {_quote(self.principal_name)}"
+
+
+@dataclass
+class TableDefinition:
+    """
+    Modelo estructurado de una tabla: columnas, PK, índices (con INCLUDE, filtros,
+    compresión y partición), CHECK, FK en ambos sentidos y permisos.
+    """
+    schema: str
+    name: str
+    columns: List[ColumnDef] = field(default_factory=list)
+    indexes: List[IndexDef] = field(default_factory=list)
+    checks: List[CheckDef] = field(default_factory=list)
+    foreign_keys: List[ForeignKeyDef] = field(default_factory=list)
+    referencing_fks: List[ForeignKeyDef] = field(default_factory=list)
+    permissions: List[PermissionDef] = field(default_factory=list)
+    storage: Optional[IndexDef] = None
+
+    @property
+    def full_name(self):
+        return f"{_quote(self.schema)}.{_quote(self.name)}"
+
+    @property
+    def primary_key(self):
+        return next((i for i in self.indexes if i.is_primary_key), None)
+
+    @property
+    def secondary_indexes(self):
+        return [i for i in self.indexes if not i.is_primary_key]
+
+    @property
+    def self_referencing_fks(self):
+        return [fk for fk in self.foreign_keys
+                if (fk.referenced_schema, fk.referenced_table) == (self.schema, self.name)]
+
+    @property
+    def has_identity(self):
+        return any(c.is_identity for c in self.columns)
+
+    def insertable_columns_sql(self):
+        return ", ".join(_quote(c.name) for c in self.columns if c.insertable)
+
+    def table_storage_sql(self):
+        """ON partición/filegroup y compresión del heap o del índice clúster"""
+        if not self.storage:
+            return ""
+        compression = self.storage.data_compression
+        sql = self.storage.storage_sql()
+        if compression and compression != 'NONE':
+            sql = f" WITH (DATA_COMPRESSION = {compression})" + sql
+        return sql
+
+    def column_layout(self, new_columns=None):
+        """
+        Orden final de las definiciones de columna. new_columns es una lista de
+        (nombre, after, sql): after None va al final, "-1" al principio y un nombre
+        (existente o de otra columna nueva) justo después de esa columna.
+        Las columnas con el mismo ancla conservan el orden en que se pidieron.
+        """
+        existing = [(c.name, c.to_sql()) for c in self.columns]
+        known = {name for name, _ in existing}
+        known.update(name for name, _, _ in new_columns or [])
+
+        first, last, anchored = [], [], {}
+        for name, after, sql in new_columns or []:
+            if after == "-1":
+                first.append((name, sql))
+            elif after and after in known and after != name:
+                anchored.setdefault(after, []).append((name, sql))
+            else:
+                last.append((name, sql))
+
+        layout = []
+        emitted = set()
+
+        def emit(name, sql):
+            if name in emitted:
+                return
+            emitted.add(name)
+            layout.append(sql)
+            for child in anchored.get(name, []):
+                emit(*child)
+
+        for column in first + existing + last:
+            emit(*column)
+        # Anclas circulares entre columnas nuevas: al final, en el orden pedido
+        for children in anchored.values():
+            for child in children:
+                emit(*child)
+        return layout
+
+    def create_table_sql(self, include_storage=True, new_columns=None, table_name=None, pk_name=None):
+        """table_name y pk_name crean una copia con otro nombre (ej. el staging de una partición)"""
+        lines = [f"    {sql}" for sql in self.column_layout(new_columns)]
+        pk = self.primary_key
+        if pk:
+            lines.append(f"    CONSTRAINT {_quote(pk_name or pk.name)} PRIMARY KEY "
+                         f"{'CLUSTERED' if pk.is_clustered else 'NONCLUSTERED'} ({pk.key_sql})")
+        name = f"{_quote(self.schema)}.{_quote(table_name)}" if table_name else self.full_name
+        sql = f"CREATE TABLE {name} (\r\n" + ",\r\n".join(lines) + "\r\n)"
+        if include_storage:
+            sql += self.table_storage_sql()
+        return sql
+
+    def check_sql(self):
+        return [_add_constraint_sql(self.full_name, c.name, f"CHECK {c.definition}", c.is_not_trusted, c.is_disabled)
+                for c in self.checks]
+
+    def foreign_key_sql(self):
+        return [fk.create_script for fk in self.foreign_keys]
+
+
+def extract_table_definition(cursor, schema, table, source_table=None):
+    """
+    Lee la definición completa de la tabla en una sola ida y vuelta (varios
+    conjuntos de resultados). Los scripts se generan para [schema].[table]
+    aunque se lean de source_table (ej. la tabla _TEMP renombrada).
+    """
+    source_table = source_table or table
+    cursor.execute(_EXTRACT_SQL, f"{_quote(schema)}.{_quote(source_table)}")
+
+    definition = TableDefinition(schema, table)
+
+    rows = cursor.fetchall()
+    if not rows:
+        raise Exception(f"No se encontró la tabla [{schema}].[{source_table}]")
+    for row in rows:
+        definition.columns.append(ColumnDef(
+            row.name, row.type_name, row.max_length, row.precision, row.scale,
+            bool(row.is_nullable), bool(row.is_identity), row.seed_value, row.increment_value,
+            row.default_definition, bool(row.is_computed), row.computed_definition, bool(row.is_persisted),
+            row.collation_name, bool(row.is_sparse), bool(row.is_rowguidcol)))
+
+    cursor.nextset()
+    indexes = {}
+    for row in cursor.fetchall():
+        index = IndexDef(row.index_id, row.name, row.type, bool(row.is_unique), bool(row.is_primary_key),
+                         bool(row.is_unique_constraint), row.filter_definition, row.fill_factor,
+                         bool(row.ignore_dup_key), row.data_space_name, row.data_space_type,
+                         row.data_compression_desc)
+        indexes[row.index_id] = index
+        if row.index_id in (0, 1):
+            definition.storage = index
+        if row.index_id > 0:
+            definition.indexes.append(index)
+
+    cursor.nextset()
+    for row in cursor.fetchall():
+        index = indexes.get(row.index_id)
+        if not index:
+            continue
+        if row.partition_ordinal == 1:
+            index.partition_column = row.name
+        if row.is_included_column:
+            index.included_columns.append(row.name)
+        elif row.key_ordinal > 0:
+            index.key_columns.append(IndexColumnDef(row.name, bool(row.is_descending_key)))
+
+    cursor.nextset()
+    for row in cursor.fetchall():
+        definition.checks.append(CheckDef(row.name, row.definition, bool(row.is_not_trusted), bool(row.is_disabled)))
+
+    cursor.nextset()
+    fks = {}
+    for row in cursor.fetchall():
+        # Las referencias a la propia tabla se redirigen al nombre definitivo
+        parent = (schema, table) if row.is_outgoing else (row.parent_schema, row.parent_table)
+        referenced = (schema, table) if row.is_referenced else (row.referenced_schema, row.referenced_table)
+        fk = ForeignKeyDef(row.object_id, row.name, parent[0], parent[1], referenced[0], referenced[1],
+                           row.delete_referential_action, row.update_referential_action,
+                           bool(row.is_not_trusted), bool(row.is_disabled))
+        fks[row.object_id] = fk
+        # Una FK a sí misma se trata como saliente: se elimina y recrea con la tabla
+        if row.is_outgoing:
+            definition.foreign_keys.append(fk)
+        else:
+            definition.referencing_fks.append(fk)
+
+    cursor.nextset()
+    for row in cursor.fetchall():
+        fk = fks.get(row.constraint_object_id)
+        if fk:
+            fk.parent_columns.append(row.parent_column)
+            fk.referenced_columns.append(row.referenced_column)
+
+    cursor.nextset()
+    for row in cursor.fetchall():
+        definition.permissions.append(PermissionDef(schema, table, row.state_desc, row.permission_name,
+                                                    row.principal_name, row.column_name))
+
+    return definition
@@ -0,0 +1,248 @@
+import json
+import time
+import uuid
+import logging
+import datetime
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+import pyodbc
+
+from connection_pool import PURPOSE_MONITOR, PoolTimeout, get_pool
+
+# Los eventos se registran como JSON en este logger, con los campos de auditoría en extra
+logger = logging.getLogger("telemetry")
+
+TOP_WAITS = 5
+
+
+class PhaseRecord:
+    """
+    Medición de una fase; la fase puede asignar rows con las filas afectadas.
+    log_bytes es el log de la transacción de esta sesión (None si la fase confirmó
+    por el camino, ej. una copia por lotes); db_log_bytes es lo escrito en el log de
+    toda la base, que incluye a las otras sesiones (ej. las tablas vecinas de un lote)
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = None
+        self.seconds = None
+        self.log_bytes = None
+        self.db_log_bytes = None
+        self.waits = Counter()
+        self.status = 'ok'
+
+    def to_dict(self):
+        return {
+            'phase': self.name,
+            'status': self.status,
+            'seconds': round(self.seconds, 3) if self.seconds is not None else None,
+            'rows': self.rows,
+            'log_bytes': self.log_bytes,
+            'db_log_bytes': self.db_log_bytes,
+            'top_waits': dict(self.waits.most_common(TOP_WAITS)),
+        }
+
+
+class WaitSampler(threading.Thread):
+    """
+    Muestrea desde otra conexión la espera actual de la sesión en sys.dm_exec_requests
+    y la atribuye a la fase en curso; top_waits cuenta las muestras por tipo de espera.
+    """
+
+    def __init__(self, conn_str, spid, interval=0.5):
+        super().__init__(daemon=True, name="wait-sampler")
+        self.conn_str = conn_str
+        self.spid = spid
+        self.interval = interval
+        self.current = None
+        self.stop_event = threading.Event()
+
+    def run(self):
+        try:
+            pool = get_pool(self.conn_str)
+            pooled = pool.acquire(PURPOSE_MONITOR)
+        except (pyodbc.Error, PoolTimeout) as e:
+            logger.warning(f"No se pudo abrir la conexión de muestreo de esperas: {str(e)}")
+            return
+        try:
+            cursor = pooled.cursor()
+            while not self.stop_event.wait(self.interval):
+                phase = self.current
+                if phase is None:
+                    continue
+                cursor.execute("""
+                    SELECT wait_type FROM sys.dm_exec_requests
+                    WHERE session_id = ? AND wait_type IS NOT NULL
+                """, self.spid)
+                for row in cursor.fetchall():
+                    phase.waits[row.wait_type] += 1
+                pooled.connection.commit()
+        except pyodbc.Error as e:
+            # Sin VIEW SERVER STATE solo se ve la propia sesión: se deja de muestrear
+            logger.warning(f"Muestreo de esperas detenido: {str(e)}")
+        finally:
+            pool.release(pooled)
+
+    def stop(self):
+        self.stop_event.set()
+
+
+class MigrationTelemetry:
+    """
+    Instrumentación por fase de una migración: tiempo, filas afectadas, bytes de log
+    de la propia sesión (y, aparte, de toda la base) y esperas principales. Cada fase
+    emite un evento JSON y finish() emite el resumen de la ejecución. migration_id es
+    el run_id de la ejecución hasta que la migración lo asocia a su diario
+    (set_migration_id), que se conserva al reanudar.
+    """
+
+    def __init__(self, connection, table, conn_str=None, sink=None, sample_waits=True):
+        self.connection = connection
+        self.table = table
+        self.run_id = uuid.uuid4().hex[:12]
+        self.migration_id = self.run_id
+        self.sink = sink
+        self.phases = []
+        self.started = time.monotonic()
+        self.log_metrics = True
+        self.db_log_metrics = True
+        self.sampler = None
+
+        if conn_str and sample_waits:
+            try:
+                cursor = connection.cursor()
+                cursor.execute("SELECT @@SPID")
+                self.sampler = WaitSampler(conn_str, cursor.fetchone()[0])
+                self.sampler.start()
+            except pyodbc.Error as e:
+                logger.warning(f"Muestreo de esperas desactivado: {str(e)}")
+
+    def _session_log(self):
+        """
+        (transaction_id, bytes de log) de la transacción abierta de esta sesión en la
+        base actual, (None, 0) sin transacción y None sin permisos
+        """
+        if not self.log_metrics:
+            return None
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("""
+                SELECT st.transaction_id, dt.database_transaction_log_bytes_used
+                FROM sys.dm_tran_session_transactions st
+                JOIN sys.dm_tran_database_transactions dt ON dt.transaction_id = st.transaction_id
+                WHERE st.session_id = @@SPID AND dt.database_id = DB_ID()
+            """)
+            row = cursor.fetchone()
+            return (row[0], row[1] or 0) if row else (None, 0)
+        except pyodbc.Error:
+            self.log_metrics = False
+            return None
+
+    def _database_log_bytes(self):
+        """Bytes escritos en el archivo de log de la base actual por todas las sesiones (None sin permisos)"""
+        if not self.db_log_metrics:
+            return None
+        try:
+            cursor = self.connection.cursor()
+            cursor.execute("""
+                SELECT SUM(vfs.num_of_bytes_written)
+                FROM sys.dm_io_virtual_file_stats(DB_ID(), NULL) vfs
+                JOIN sys.database_files df ON df.file_id = vfs.file_id
+                WHERE df.type = 1
+            """)
+            return cursor.fetchone()[0]
+        except pyodbc.Error:
+            self.db_log_metrics = False
+            return None
+
+    def set_migration_id(self, migration_id):
+        self.migration_id = migration_id
+
+    def emit(self, event):
+        event = dict(event, run_id=self.run_id, migration_id=self.migration_id, table=self.table,
+                     timestamp=datetime.datetime.now().isoformat(timespec='milliseconds'))
+        audit = {'migration_id': self.migration_id, 'table': self.table,
+                 'phase': event.get('phase') or event.get('event'), 'duration': event.get('seconds'),
+                 'rows': event.get('rows')}
+        logger.info(json.dumps(event, ensure_ascii=False, default=str), extra=audit)
+        if self.sink:
+            self.sink(event)
+
+    @contextmanager
+    def phase(self, name):
+        record = PhaseRecord(name)
+        session_before = self._session_log()
+        db_before = self._database_log_bytes()
+        if self.sampler:
+            self.sampler.current = record
+        start = time.monotonic()
+        try:
+            yield record
+        except BaseException:
+            record.status = 'error'
+            raise
+        finally:
+            record.seconds = time.monotonic() - start
+            if self.sampler:
+                self.sampler.current = None
+            session_after = self._session_log()
+            # Solo se puede atribuir si la transacción de la sesión abarca toda la fase
+            if session_before is not None and session_after is not None and session_after[0] is not None:
+                if session_before[0] == session_after[0]:
+                    record.log_bytes = session_after[1] - session_before[1]
+                elif session_before[0] is None:
+                    record.log_bytes = session_after[1]
+            db_after = self._database_log_bytes()
+            if db_before is not None and db_after is not None:
+                record.db_log_bytes = db_after - db_before
+            self.phases.append(record)
+            self.emit(dict(record.to_dict(), event='phase'))
+
+    def summary(self, status='ok', error=None):
+        total = time.monotonic() - self.started
+        timed = [p for p in self.phases if p.seconds is not None]
+        dominant = max(timed, key=lambda p: p.seconds, default=None)
+        waits = Counter()
+        for p in self.phases:
+            waits.update(p.waits)
+        return {
+            'event': 'summary',
+            'status': status,
+            'error': error,
+            'seconds': round(total, 3),
+            'dominant_phase': dominant.name if dominant else None,
+            # Solo el log propio: el de toda la base mezcla el de las tablas vecinas
+            'log_bytes': sum(p.log_bytes or 0 for p in self.phases) if self.log_metrics else None,
+            'top_waits': dict(waits.most_common(TOP_WAITS)),
+            'phases': [p.to_dict() for p in self.phases],
+        }
+
+    def finish(self, status='ok', error=None):
+        if self.sampler:
+            self.sampler.stop()
+        summary = self.summary(status, error)
+        self.emit(summary)
+        return summary
+
+
+class NullTelemetry:
+    """Telemetría desactivada: las fases se ejecutan sin medir nada"""
+
+    @contextmanager
+    def phase(self, name):
+        yield PhaseRecord(name)
+
+    def set_migration_id(self, migration_id):
+        pass
+
+    def emit(self, event):
+        pass
+
+    def finish(self, status='ok', error=None):
+        return None
+
+
+NULL_TELEMETRY = NullTelemetry()
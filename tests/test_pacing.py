@@ -0,0 +1,90 @@
+import pytest
+
+pyodbc = pytest.importorskip("pyodbc")
+
+from pacing import Metrics, PacingController, PacingLimits
+
+LIMITS = PacingLimits(max_log_send_queue_kb=1000, max_redo_queue_kb=1000, max_log_percent=70.0,
+                      max_blocked_ms=5000)
+
+CALM = Metrics(0, 0, 10.0, 0, None)
+SEND_QUEUE_FULL = Metrics(2000, 0, 10.0, 0, None)
+BLOCKING = Metrics(0, 0, 10.0, 3, 8000)
+
+
+class StubSource:
+    """Devuelve las métricas en orden; la última se repite"""
+
+    def __init__(self, *metrics):
+        self.metrics = list(metrics)
+        self.samples = 0
+
+    def sample(self):
+        self.samples += 1
+        if isinstance(self.metrics[0], Exception):
+            raise self.metrics.pop(0)
+        return self.metrics.pop(0) if len(self.metrics) > 1 else self.metrics[0]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def controller(source, clock, min_batch_size=1000):
+    return PacingController(source, limits=LIMITS, min_batch_size=min_batch_size, pause=5.0,
+                            log=lambda message, level=None: None, sleep=clock.sleep, clock=clock)
+
+
+def test_calm_metrics_keep_requested_size():
+    clock = FakeClock()
+    pacing = controller(StubSource(CALM), clock)
+    assert pacing.batch_size(10000) == 10000
+    assert clock.sleeps == []
+
+
+def test_pressure_halves_down_to_min_batch_size():
+    clock = FakeClock()
+    source = StubSource(SEND_QUEUE_FULL, SEND_QUEUE_FULL, SEND_QUEUE_FULL, SEND_QUEUE_FULL, SEND_QUEUE_FULL,
+                        SEND_QUEUE_FULL, CALM)
+    pacing = controller(source, clock, min_batch_size=1000)
+    assert pacing.batch_size(10000) == 1000
+    assert pacing.pauses == 6
+
+
+def test_waits_until_metrics_are_back_under_limits():
+    clock = FakeClock()
+    pacing = controller(StubSource(BLOCKING, SEND_QUEUE_FULL, CALM), clock)
+    assert pacing.batch_size(8000) == 2000
+    assert clock.sleeps == [5.0, 5.0]
+    assert pacing.paused_seconds == 10.0
+    assert pacing.last_metrics == CALM
+
+
+def test_grows_back_to_requested_size():
+    clock = FakeClock()
+    pacing = controller(StubSource(SEND_QUEUE_FULL, CALM), clock)
+    sizes = [pacing.batch_size(8000) for _ in range(10)]
+    assert sizes[0] == 4000
+    assert sizes == sorted(sizes)
+    assert sizes[-1] == 8000
+    assert len(clock.sleeps) == 1
+
+
+def test_driver_error_disables_pacing():
+    clock = FakeClock()
+    source = StubSource(pyodbc.Error("42000", "VIEW SERVER STATE permission was denied"), SEND_QUEUE_FULL)
+    pacing = controller(source, clock)
+    assert pacing.batch_size(8000) == 8000
+    assert not pacing.enabled
+    assert pacing.batch_size(8000) == 8000
+    assert source.samples == 1
+    assert clock.sleeps == []
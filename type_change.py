@@ -0,0 +1,388 @@
+import re
+from collections import namedtuple
+
+from batch_copy import get_copy_key
+from planner import get_table_size, get_throughput, _format_bytes, _format_seconds
+
+# Efecto de ALTER COLUMN sobre los datos
+IMPACT_METADATA = 'metadata'
+IMPACT_SIZE_OF_DATA = 'size_of_data'
+IMPACT_BLOCKED = 'blocked'
+
+# Formas de ejecutar el cambio
+STRATEGY_ALTER = 'alter'
+STRATEGY_ALTER_DEPENDENTS = 'alter_dependents'
+STRATEGY_SWAP = 'swap'
+STRATEGY_MANUAL = 'manual'
+
+# Una reescritura más larga que esto se propone como columna nueva + relleno por lotes
+SWAP_MIN_SECONDS = 60
+
+VARIABLE_TYPES = ('varchar', 'nvarchar', 'varbinary')
+FIXED_LENGTH_TYPES = ('char', 'nchar', 'binary')
+INTEGER_TYPES = ('tinyint', 'smallint', 'int', 'bigint')
+DECIMAL_TYPES = ('decimal', 'numeric')
+SCALED_TYPES = ('datetime2', 'datetimeoffset', 'time')
+
+# Dependencias que impiden el ALTER y no se pueden recrear automáticamente
+_MANUAL_KINDS = ('partition', 'foreign_key', 'computed', 'view')
+
+TypeSpec = namedtuple('TypeSpec', ['base', 'length', 'precision', 'scale'])
+
+_TYPE_RE = re.compile(r"^\s*([A-Za-z0-9_]+)\s*(?:\(\s*([^)]*)\s*\))?\s*$")
+
+_DEPENDENCIES_QUERY = """
+DECLARE @object_id INT = OBJECT_ID(?);
+DECLARE @column_id INT = COLUMNPROPERTY(@object_id, ?, 'ColumnId');
+
+SELECT 'index' AS kind, i.name,
+       CAST(CASE WHEN i.is_primary_key = 1 THEN 'pk' WHEN i.is_unique_constraint = 1 THEN 'unique' ELSE '' END
+            AS NVARCHAR(MAX)) AS detail
+FROM sys.indexes i
+WHERE i.object_id = @object_id AND i.name IS NOT NULL
+AND EXISTS (SELECT 1 FROM sys.index_columns ic
+            WHERE ic.object_id = i.object_id AND ic.index_id = i.index_id AND ic.column_id = @column_id
+            AND (ic.key_ordinal > 0 OR ic.is_included_column = 1))
+UNION ALL
+SELECT 'partition', ISNULL(i.name, 'HEAP'), N''
+FROM sys.index_columns ic
+JOIN sys.indexes i ON i.object_id = ic.object_id AND i.index_id = ic.index_id
+WHERE ic.object_id = @object_id AND ic.column_id = @column_id AND ic.partition_ordinal > 0 AND i.index_id IN (0, 1)
+UNION ALL
+SELECT 'statistics', s.name,
+       CAST(STUFF((SELECT ', [' + c.name + ']'
+                   FROM sys.stats_columns sc
+                   JOIN sys.columns c ON c.object_id = sc.object_id AND c.column_id = sc.column_id
+                   WHERE sc.object_id = s.object_id AND sc.stats_id = s.stats_id
+                   ORDER BY sc.stats_column_id
+                   FOR XML PATH('')), 1, 2, '') AS NVARCHAR(MAX))
+FROM sys.stats s
+WHERE s.object_id = @object_id AND s.user_created = 1
+AND EXISTS (SELECT 1 FROM sys.stats_columns sc
+            WHERE sc.object_id = s.object_id AND sc.stats_id = s.stats_id AND sc.column_id = @column_id)
+UNION ALL
+SELECT 'check', cc.name, cc.definition
+FROM sys.check_constraints cc
+WHERE cc.parent_object_id = @object_id
+AND (cc.parent_column_id = @column_id
+     OR EXISTS (SELECT 1 FROM sys.sql_expression_dependencies d
+                WHERE d.referencing_id = cc.object_id AND d.referenced_id = @object_id
+                AND d.referenced_minor_id = @column_id))
+UNION ALL
+SELECT 'default', dc.name, dc.definition
+FROM sys.default_constraints dc
+WHERE dc.parent_object_id = @object_id AND dc.parent_column_id = @column_id
+UNION ALL
+SELECT 'foreign_key', fk.name,
+       CAST(OBJECT_SCHEMA_NAME(fk.parent_object_id) + '.' + OBJECT_NAME(fk.parent_object_id) AS NVARCHAR(MAX))
+FROM sys.foreign_keys fk
+WHERE EXISTS (SELECT 1 FROM sys.foreign_key_columns fkc
+              WHERE fkc.constraint_object_id = fk.object_id
+              AND ((fkc.parent_object_id = @object_id AND fkc.parent_column_id = @column_id)
+                   OR (fkc.referenced_object_id = @object_id AND fkc.referenced_column_id = @column_id)))
+UNION ALL
+SELECT 'computed', c.name, N''
+FROM sys.computed_columns c
+WHERE c.object_id = @object_id
+AND EXISTS (SELECT 1 FROM sys.sql_expression_dependencies d
+            WHERE d.referencing_id = @object_id AND d.referencing_minor_id = c.column_id
+            AND d.referenced_id = @object_id AND d.referenced_minor_id = @column_id)
+UNION ALL
+SELECT 'view', OBJECT_SCHEMA_NAME(d.referencing_id) + '.' + OBJECT_NAME(d.referencing_id),
+       CAST(o.type_desc AS NVARCHAR(MAX))
+FROM sys.sql_expression_dependencies d
+JOIN sys.objects o ON o.object_id = d.referencing_id
+WHERE d.referenced_id = @object_id AND d.referenced_minor_id = @column_id
+AND d.is_schema_bound_reference = 1 AND d.referencing_id <> @object_id AND o.type NOT IN ('C', 'D');
+"""
+
+_COLUMN_QUERY = """
+DECLARE @object_id INT = OBJECT_ID(?);
+
+SELECT TYPE_NAME(c.system_type_id) AS type_name, c.max_length, c.precision, c.scale, c.is_nullable,
+       c.is_identity, c.is_computed, c.is_rowguidcol,
+       (SELECT MIN(p.data_compression) FROM sys.partitions p
+        WHERE p.object_id = @object_id AND p.index_id IN (0, 1)) AS data_compression
+FROM sys.columns c
+WHERE c.object_id = @object_id AND c.name = ?;
+"""
+
+
+def parse_type(type_sql):
+    """
+    Separa un tipo T-SQL en TypeSpec. length va en caracteres (también en nchar/nvarchar)
+    y -1 es max; sin parámetros se usan los valores por defecto de SQL Server.
+    """
+    match = _TYPE_RE.match(type_sql or "")
+    if not match:
+        raise Exception(f"Tipo de dato no reconocido: {type_sql}")
+    base = match.group(1).lower()
+    params = [p.strip() for p in (match.group(2) or "").split(",") if p.strip()]
+
+    if base in VARIABLE_TYPES + FIXED_LENGTH_TYPES:
+        length = -1 if params and params[0].lower() == 'max' else int(params[0]) if params else 1
+        return TypeSpec(base, length, None, None)
+    if base in DECIMAL_TYPES:
+        precision = int(params[0]) if params else 18
+        scale = int(params[1]) if len(params) > 1 else 0
+        return TypeSpec(base, None, precision, scale)
+    if base in SCALED_TYPES:
+        return TypeSpec(base, None, None, int(params[0]) if params else 7)
+    return TypeSpec(base, None, None, None)
+
+
+def catalog_type(type_name, max_length, precision, scale):
+    """TypeSpec de una columna según sys.columns (max_length en bytes)"""
+    if type_name in VARIABLE_TYPES + FIXED_LENGTH_TYPES:
+        if max_length == -1:
+            return TypeSpec(type_name, -1, None, None)
+        return TypeSpec(type_name, max_length // 2 if type_name.startswith('n') else max_length, None, None)
+    if type_name in DECIMAL_TYPES:
+        return TypeSpec(type_name, None, precision, scale)
+    if type_name in SCALED_TYPES:
+        return TypeSpec(type_name, None, None, scale)
+    return TypeSpec(type_name, None, None, None)
+
+
+def _decimal_bytes(precision):
+    return 5 if precision <= 9 else 9 if precision <= 19 else 13 if precision <= 28 else 17
+
+
+def _widens(old, new):
+    """Misma familia de longitud variable con igual o mayor longitud (sin pasar a max)"""
+    return (old.base == new.base and old.base in VARIABLE_TYPES
+            and old.length != -1 and new.length != -1 and new.length >= old.length)
+
+
+def classify_type_change(old, new, old_nullable, new_nullable, compressed=False):
+    """
+    Efecto del ALTER COLUMN sobre las filas sin mirar dependencias.
+    Devuelve (impacto, reescribe_filas, motivos); NULL → NOT NULL recorre la tabla para
+    validar pero no reescribe las filas.
+    """
+    reasons = []
+    rewrite = False
+
+    if old == new:
+        pass
+    elif _widens(old, new):
+        reasons.append(f"{old.base}: ampliar de {old.length} a {new.length} solo cambia metadatos")
+    elif old.base == new.base and old.base in DECIMAL_TYPES and old.scale == new.scale \
+            and new.precision >= old.precision and _decimal_bytes(new.precision) == _decimal_bytes(old.precision):
+        reasons.append("La nueva precisión ocupa los mismos bytes: solo cambia metadatos")
+    elif old.base in INTEGER_TYPES and new.base in INTEGER_TYPES \
+            and INTEGER_TYPES.index(new.base) > INTEGER_TYPES.index(old.base) and compressed:
+        reasons.append(f"{old.base} → {new.base} con compresión ROW/PAGE solo cambia metadatos")
+    else:
+        rewrite = True
+        if old.base == new.base and old.base in VARIABLE_TYPES + FIXED_LENGTH_TYPES:
+            if new.length != -1 and (old.length == -1 or new.length < old.length):
+                reasons.append(f"Reducir {old.base} valida y reescribe cada fila (falla si algún valor no cabe)")
+            elif new.length == -1:
+                reasons.append(f"Pasar a {old.base}(max) reescribe cada fila")
+            else:
+                reasons.append(f"{old.base} es de longitud fija: cambiar la longitud reescribe cada fila")
+        else:
+            reasons.append(f"{_type_label(old)} → {_type_label(new)} reescribe cada fila")
+
+    if old_nullable and not new_nullable:
+        reasons.append("NULL → NOT NULL recorre toda la tabla para validar (falla si hay NULLs)")
+        impact = IMPACT_SIZE_OF_DATA
+    else:
+        impact = IMPACT_SIZE_OF_DATA if rewrite else IMPACT_METADATA
+        if not old_nullable and new_nullable:
+            reasons.append("NOT NULL → NULL solo cambia metadatos")
+    return impact, rewrite, reasons
+
+
+def _type_label(spec):
+    if spec.length is not None:
+        return f"{spec.base}({'max' if spec.length == -1 else spec.length})"
+    if spec.precision is not None:
+        return f"{spec.base}({spec.precision},{spec.scale})"
+    if spec.scale is not None:
+        return f"{spec.base}({spec.scale})"
+    return spec.base
+
+
+def get_column_dependencies(cursor, schema, table, column):
+    """Objetos que dependen de la columna: lista de (tipo, nombre, detalle)"""
+    cursor.execute(_DEPENDENCIES_QUERY, f"[{schema}].[{table}]", column)
+    return [(row.kind, row.name, row.detail or "") for row in cursor.fetchall()]
+
+
+def analyze_type_change(cursor, schema, table, column, new_type, new_nullable):
+    """
+    Clasifica el cambio de tipo/nulabilidad de una columna, busca los índices,
+    estadísticas y constraints que dependen de ella, estima el costo de reescribir
+    los datos y propone la estrategia más barata:
+    - alter: ALTER COLUMN directo
+    - alter_dependents: quitar índices/estadísticas/CHECK, ALTER COLUMN y recrearlos
+    - swap: columna nueva, relleno por lotes y renombrado (la tabla no queda bloqueada
+      durante la reescritura, pero la columna pasa al final)
+    - manual: dependencias que no se pueden recrear solas (FK, vistas con SCHEMABINDING...)
+    """
+    cursor.execute(_COLUMN_QUERY, f"[{schema}].[{table}]", column)
+    row = cursor.fetchone()
+    if row is None:
+        raise Exception(f"No se encontró la columna [{column}] en [{schema}].[{table}]")
+
+    old = catalog_type(row.type_name, row.max_length, row.precision, row.scale)
+    new = parse_type(new_type)
+    impact, rewrite, reasons = classify_type_change(old, new, bool(row.is_nullable), new_nullable,
+                                                    bool(row.data_compression))
+
+    dependencies = get_column_dependencies(cursor, schema, table, column)
+    # Ampliar un varchar/nvarchar/varbinary se permite con índices, estadísticas y CHECK
+    # (salvo la PK); cambiar solo la longitud se permite también con un DEFAULT
+    tolerant = _widens(old, new) and bool(row.is_nullable) == new_nullable
+    length_only = old.base == new.base
+
+    blockers, to_drop = [], []
+    for kind, name, detail in dependencies:
+        if kind in _MANUAL_KINDS:
+            blockers.append((kind, name, detail))
+        elif kind == 'index' and detail in ('pk', 'unique'):
+            if not tolerant or detail == 'pk':
+                blockers.append((kind, name, detail))
+        elif kind in ('index', 'statistics', 'check') and not tolerant:
+            to_drop.append((kind, name, detail))
+        elif kind == 'default' and not length_only:
+            to_drop.append((kind, name, detail))
+    if row.is_identity:
+        blockers.append(('identity', column, ""))
+    if row.is_computed:
+        blockers.append(('computed', column, ""))
+
+    sizes = get_table_size(cursor, schema, table)
+    base = sizes.get(1) or sizes.get(0) or (None, 0, 0)
+    row_count, data_bytes = base[1] or 0, base[2] or 0
+    index_names = [name for kind, name, _ in dependencies if kind == 'index']
+    index_bytes = sum(size[2] or 0 for index_id, size in sizes.items() if index_id > 1 and size[0] in index_names)
+    throughput, measured = get_throughput(cursor)
+
+    if rewrite:
+        rewrite_bytes = data_bytes + index_bytes
+    elif any(kind == 'index' for kind, _, _ in to_drop):
+        # Sin reescritura igual hay que volver a crear los índices
+        rewrite_bytes = index_bytes
+    else:
+        rewrite_bytes = 0
+    # Validar NOT NULL lee la tabla sin escribir log
+    scan_bytes = data_bytes if impact == IMPACT_SIZE_OF_DATA and not rewrite else 0
+    estimated_seconds = round((rewrite_bytes + scan_bytes) / throughput, 1) if throughput else None
+
+    key = get_copy_key(cursor, schema, table, unique_only=True)
+    # El DEFAULT se traslada a la columna nueva; cualquier otra dependencia impide quitar la vieja
+    swap_blockers = []
+    if not rewrite:
+        swap_blockers.append("el cambio no reescribe la columna")
+    if not key:
+        swap_blockers.append("la tabla no tiene una clave única sin NULLs para rellenar por lotes")
+    elif column in key:
+        swap_blockers.append("la columna es parte de la clave que recorre el relleno")
+    swap_blockers += [_describe(*b) for b in blockers]
+    swap_blockers += [f"depende de la columna: {_describe(*d)}" for d in dependencies if d[0] != 'default']
+    swap_possible = not swap_blockers
+
+    if blockers:
+        impact = IMPACT_BLOCKED
+        strategy = STRATEGY_MANUAL
+        reasons += [f"Bloquea el cambio: {_describe(*b)}" for b in blockers]
+    elif to_drop and any(kind != 'default' for kind, _, _ in to_drop):
+        impact = IMPACT_BLOCKED
+        strategy = STRATEGY_ALTER_DEPENDENTS
+        reasons.append("ALTER COLUMN fallaría por los objetos dependientes: se quitan y se recrean en la transacción")
+    elif swap_possible and estimated_seconds is not None and estimated_seconds >= SWAP_MIN_SECONDS:
+        strategy = STRATEGY_SWAP
+        reasons.append("Reescritura larga: columna nueva con relleno por lotes y renombrado "
+                       "(la columna queda al final de la tabla)")
+    else:
+        strategy = STRATEGY_ALTER
+
+    return {
+        'table': f"{schema}.{table}",
+        'column': column,
+        'old_type': _type_label(old),
+        'new_type': _type_label(new),
+        'old_nullable': bool(row.is_nullable),
+        'new_nullable': new_nullable,
+        'impact': impact,
+        'rewrite': rewrite,
+        'reasons': reasons,
+        'indexes': index_names,
+        'statistics': [name for kind, name, _ in dependencies if kind == 'statistics'],
+        'constraints': [name for kind, name, _ in dependencies if kind in ('check', 'default', 'foreign_key')],
+        'blockers': [_describe(*b) for b in blockers],
+        'drop': to_drop,
+        'key': key,
+        'row_count': row_count,
+        'data_bytes': data_bytes,
+        'index_bytes': index_bytes,
+        'estimated_log_bytes': int(rewrite_bytes),
+        'estimated_seconds': estimated_seconds,
+        'throughput_bytes_s': int(throughput),
+        'throughput_measured': measured,
+        'swap_possible': swap_possible,
+        'swap_blockers': swap_blockers,
+        'strategy': strategy,
+    }
+
+
+_KIND_LABELS = {
+    'index': "índice", 'partition': "columna de partición de", 'statistics': "estadística",
+    'check': "CHECK", 'default': "DEFAULT", 'foreign_key': "clave foránea", 'computed': "columna calculada",
+    'view': "objeto con SCHEMABINDING", 'identity': "columna IDENTITY",
+}
+
+
+def _describe(kind, name, detail):
+    if kind == 'index' and detail == 'pk':
+        return f"clave primaria {name}"
+    if kind == 'index' and detail == 'unique':
+        return f"constraint UNIQUE {name}"
+    if kind == 'view':
+        return f"{_KIND_LABELS[kind]} {name} ({detail})"
+    return f"{_KIND_LABELS[kind]} {name}"
+
+
+IMPACT_DESCRIPTIONS = {
+    IMPACT_METADATA: "Solo metadatos",
+    IMPACT_SIZE_OF_DATA: "Proporcional al tamaño de la tabla",
+    IMPACT_BLOCKED: "Bloqueado por objetos dependientes",
+}
+
+STRATEGY_DESCRIPTIONS = {
+    STRATEGY_ALTER: "ALTER COLUMN directo",
+    STRATEGY_ALTER_DEPENDENTS: "Quitar dependencias, ALTER COLUMN y recrearlas",
+    STRATEGY_SWAP: "Columna nueva + relleno por lotes + renombrado",
+    STRATEGY_MANUAL: "Requiere intervención manual",
+}
+
+
+def format_type_change(analysis):
+    """Resumen legible del análisis para mostrar antes de confirmar"""
+    nullability = lambda nullable: "NULL" if nullable else "NOT NULL"
+    lines = [
+        f"Columna: {analysis['table']}.{analysis['column']}",
+        f"Cambio: {analysis['old_type']} {nullability(analysis['old_nullable'])} → "
+        f"{analysis['new_type']} {nullability(analysis['new_nullable'])}",
+        f"Impacto: {IMPACT_DESCRIPTIONS[analysis['impact']]}",
+        f"Estrategia: {STRATEGY_DESCRIPTIONS[analysis['strategy']]}",
+    ]
+    lines += [f"  - {reason}" for reason in analysis['reasons']]
+    if analysis['indexes']:
+        lines.append(f"Índices que usan la columna: {', '.join(analysis['indexes'])}")
+    if analysis['statistics']:
+        lines.append(f"Estadísticas: {', '.join(analysis['statistics'])}")
+    if analysis['constraints']:
+        lines.append(f"Constraints: {', '.join(analysis['constraints'])}")
+    if analysis['estimated_log_bytes'] or analysis['estimated_seconds']:
+        speed = "medida" if analysis['throughput_measured'] else "supuesta"
+        lines += [
+            f"Filas: {analysis['row_count']:,}  Datos: {_format_bytes(analysis['data_bytes'])}",
+            f"Log estimado: {_format_bytes(analysis['estimated_log_bytes'])}",
+            f"Duración estimada: {_format_seconds(analysis['estimated_seconds'])} "
+            f"(velocidad {speed}: {_format_bytes(analysis['throughput_bytes_s'])}/s)",
+        ]
+    return "\n".join(lines)
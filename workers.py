@@ -0,0 +1,122 @@
+import logging
+import threading
+
+import pyodbc
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+
+from cancellation import CancelToken, as_cancelled
+
+
+class JobSignals(QObject):
+    progress = pyqtSignal(str, int)   # mensaje, nivel de logging
+    status = pyqtSignal(str)          # avance para la barra de estado
+    finished = pyqtSignal(object)     # resultado de la función
+    failed = pyqtSignal(object)       # excepción
+    done = pyqtSignal()               # siempre, al terminar
+
+
+class DbJob(QRunnable):
+    """
+    Trabajo de base de datos que corre fuera del hilo de la interfaz.
+    La función recibe el propio job para informar avance (job.log) y
+    para pasar job.cancel_token a las operaciones largas.
+    """
+
+    def __init__(self, fn, description=""):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.fn = fn
+        self.description = description
+        self.signals = JobSignals()
+        self.cancel_token = CancelToken()
+        # Sesión del pool asignada al trabajo y su (cadena de conexión, SPID) para KILL
+        self.connection = None
+        self.kill_target = None
+
+    def log(self, message, level=logging.INFO):
+        self.signals.progress.emit(message, level)
+
+    def status(self, message):
+        self.signals.status.emit(message)
+
+    def cancel(self):
+        self.cancel_token.cancel()
+
+    def run(self):
+        try:
+            result = self.fn(self)
+        except Exception as e:
+            self.signals.failed.emit(as_cancelled(e, self.cancel_token))
+        else:
+            self.signals.finished.emit(result)
+        finally:
+            self.signals.done.emit()
+
+
+def kill_session(conn_str, spid):
+    """Termina una sesión desde otra conexión (último recurso si SQLCancel no responde)"""
+    connection = pyodbc.connect(conn_str, autocommit=True)
+    try:
+        connection.cursor().execute(f"KILL {int(spid)}")
+    finally:
+        connection.close()
+
+
+class JobRunner(QObject):
+    """
+    Cola de trabajos de base de datos en segundo plano.
+    Por defecto usa un solo hilo y los trabajos se ejecutan en orden; cada
+    trabajo toma su propia sesión del pool de conexiones.
+    """
+
+    busy_changed = pyqtSignal(bool)
+
+    def __init__(self, parent=None, kill_timeout_ms=5000, max_threads=1):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        self.kill_timeout_ms = kill_timeout_ms
+        self.jobs = []
+
+    def submit(self, fn, on_finished=None, on_failed=None, on_progress=None, on_status=None, description=""):
+        job = DbJob(fn, description)
+        if on_progress:
+            job.signals.progress.connect(on_progress)
+        if on_status:
+            job.signals.status.connect(on_status)
+        if on_finished:
+            job.signals.finished.connect(on_finished)
+        if on_failed:
+            job.signals.failed.connect(on_failed)
+        job.signals.done.connect(lambda: self._job_done(job))
+
+        self.jobs.append(job)
+        self.busy_changed.emit(True)
+        self.pool.start(job)
+        return job
+
+    def _job_done(self, job):
+        if job in self.jobs:
+            self.jobs.remove(job)
+        if not self.jobs:
+            self.busy_changed.emit(False)
+
+    @property
+    def busy(self):
+        return bool(self.jobs)
+
+    def cancel_all(self):
+        """Cancela los trabajos; si no terminan a tiempo se hace KILL de la sesión"""
+        jobs = list(self.jobs)
+        for job in jobs:
+            job.cancel()
+        if jobs:
+            QTimer.singleShot(self.kill_timeout_ms, lambda: self._kill_if_stuck(jobs))
+
+    def _kill_if_stuck(self, jobs):
+        for job in jobs:
+            if job not in self.jobs or not job.kill_target:
+                continue
+            conn_str, spid = job.kill_target
+            logging.warning(f"La cancelación no respondió, ejecutando KILL {spid}")
+            threading.Thread(target=kill_session, args=(conn_str, spid), daemon=True).start()